@@ -0,0 +1,34 @@
+import os
+import sys
+import tempfile
+
+import ezdxf
+
+from bench_load import read_streamed, timed
+from bench_render import load_tiled
+from pycad.util_dxf import snapshot_layers, write_dxf
+
+
+def main():
+    # example.dxf tiled copies x copies times, saved and loaded as ASCII and as binary DXF
+    copies = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    example = os.path.join(os.path.dirname(__file__), "..", "example.dxf")
+    layers = load_tiled(example, copies)
+    print(f"example.dxf x {copies * copies}: {sum(len(layer.lines) + len(layer.entities) for layer in layers)} entities")
+    with tempfile.TemporaryDirectory() as directory:
+        for fmt in ("asc", "bin"):
+            # loaded again, the dimensions keep the tags rendered by the first save
+            snapshot = snapshot_layers(load_tiled(example, copies))
+            filename = os.path.join(directory, f"drawing_{fmt}.dxf")
+            ezdxf_time, _ = timed(write_dxf, snapshot, filename, direct=False, fmt=fmt)
+            first_time, _ = timed(write_dxf, snapshot, filename, fmt=fmt)
+            save_time, _ = timed(write_dxf, snapshot, filename, fmt=fmt)
+            size = os.path.getsize(filename) // 1024
+            read_time, _ = timed(ezdxf.readfile, filename)
+            stream_time, _ = timed(read_streamed, filename)
+            print(f"{fmt:>4} {size:8} KiB  save ezdxf {ezdxf_time:6.2f}s  first {first_time:6.2f}s  "
+                  f"cached {save_time:6.2f}s  ezdxf.readfile {read_time:6.2f}s  streamed {stream_time:6.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+import os
+import random
+import sys
+import tempfile
+
+import ezdxf
+import git
+
+from bench_load import make_drawing, timed
+from pycad.util_diff import commit_diff, compare_revisions, parent_of
+
+
+def edit_drawing(filename: str, edits: int, seed: int = 2):
+    # removes, stretches and adds edits walls each, renames edits // 10 notes
+    rnd = random.Random(seed)
+    doc = ezdxf.readfile(filename)
+    msp = doc.modelspace()
+    walls = [line for line in msp.query("LINE")]
+    for line in rnd.sample(walls, 2 * edits)[:edits]:
+        msp.delete_entity(line)
+    for line in [line for line in msp.query("LINE")][:edits]:
+        end = line.dxf.end
+        line.dxf.end = (end.x + 50, end.y + 50)
+    for i in range(edits):
+        x, y = rnd.randint(0, 1000), rnd.randint(0, 1000)
+        msp.add_line((x, y), (x + 10000, y + 7), dxfattribs={'layer': 'walls'})
+    for text in [text for text in msp.query("TEXT")][:edits // 10]:
+        text.dxf.text += " (renamed)"
+    doc.saveas(filename)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with tempfile.TemporaryDirectory() as directory:
+        repo = git.Repo.init(directory)
+        filename = os.path.join(directory, "drawing.dxf")
+        make_drawing(filename, count)
+        repo.index.add(["drawing.dxf"])
+        repo.index.commit("drawing")
+        edit_drawing(filename, 100)
+        repo.index.add(["drawing.dxf"])
+        commit = repo.index.commit("edit")
+        for label in ("first", "cached"):
+            diff_time, diffs = timed(commit_diff, repo, commit.hexsha, "drawing.dxf")
+            counts = ", ".join(f"{diff.name} +{diff.counts()[0]} -{diff.counts()[1]} ~{diff.counts()[2]}"
+                               for diff in diffs)
+            print(f"{label:>8} {diff_time:8.2f}s  {counts}")
+        # the overlay of DrawingManager, the diff cached by now
+        compare_time, compare = timed(compare_revisions, repo, parent_of(repo, commit.hexsha), commit.hexsha,
+                                      "drawing.dxf")
+        print(f"{'compare':>8} {compare_time:8.2f}s  {len(compare.added.drawables)} added, "
+              f"{len(compare.removed.drawables)} removed over {len(compare.base)} layers")
+
+
+if __name__ == "__main__":
+    main()
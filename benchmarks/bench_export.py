@@ -0,0 +1,32 @@
+import os
+import sys
+import tempfile
+
+from bench_load import timed
+from bench_render import load_tiled
+from pycad.util_render import SheetRenderer, SheetView, ensure_gui_application
+
+
+def main():
+    # example.dxf tiled copies x copies times, rendered to each format at size pixels
+    copies = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 4000
+    ensure_gui_application()
+    example = os.path.join(os.path.dirname(__file__), "..", "example.dxf")
+    layers = load_tiled(example, copies)
+    view = SheetView.fit(layers, size=(size, size))
+    renderer = SheetRenderer()
+    print(f"example.dxf x {copies * copies}: {sum(len(layer.lines) + len(layer.entities) for layer in layers)} "
+          f"entities on {view.width} x {view.height}")
+    with tempfile.TemporaryDirectory() as directory:
+        for extension in ("png", "svg", "pdf"):
+            filename = os.path.join(directory, f"sheet.{extension}")
+            render_time, _ = timed(renderer.render, layers, view, filename)
+            print(f"{extension:>4} {render_time:6.2f}s {os.path.getsize(filename) // 1024:8} KiB")
+        tiles_time, names = timed(lambda: list(renderer.render_tiles(layers, view, os.path.join(directory, "tile.png"),
+                                                                     1024)))
+        print(f"tiles {tiles_time:6.2f}s {len(names)} tiles of 1024")
+
+
+if __name__ == '__main__':
+    main()
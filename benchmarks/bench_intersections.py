@@ -0,0 +1,47 @@
+import random
+import sys
+import time
+
+from PySide6.QtCore import QPoint
+
+from pycad.DrawableLineImpl import Line
+from pycad.util_intersections import find_intersections, find_intersections_bruteforce
+
+
+def floor_plan(count: int, size: int = 100000, seed: int = 1):
+    # mostly orthogonal walls of a few metres, like a floor plan
+    rnd = random.Random(seed)
+    lines = []
+    for _ in range(count):
+        x, y = rnd.randint(0, size), rnd.randint(0, size)
+        length = rnd.randint(100, 3000)
+        if rnd.random() < 0.5:
+            lines.append(Line(QPoint(x, y), QPoint(x + length, y + rnd.randint(-5, 5))))
+        else:
+            lines.append(Line(QPoint(x, y), QPoint(x + rnd.randint(-5, 5), y + length)))
+    return lines
+
+
+def run(engine, lines):
+    start = time.perf_counter()
+    table = engine(lines)
+    return time.perf_counter() - start, table
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 2000, 5000, 20000]
+    print(f"{'segments':>10} {'hits':>8} {'bruteforce [s]':>15} {'bucketed [s]':>13} {'speedup':>8}")
+    for count in sizes:
+        lines = floor_plan(count, size=int(100 * count ** 0.5 * 10))
+        new_time, new_table = run(find_intersections, lines)
+        if count <= 5000:
+            old_time, old_table = run(find_intersections_bruteforce, lines)
+            same = [(i, p.x(), p.y()) for i, p in old_table] == [(i, p.x(), p.y()) for i, p in new_table]
+            assert same, f"engines disagree on {count} segments"
+            print(f"{count:>10} {len(new_table) // 2:>8} {old_time:>15.3f} {new_time:>13.3f} {old_time / new_time:>7.1f}x")
+        else:
+            print(f"{count:>10} {len(new_table) // 2:>8} {'(skipped)':>15} {new_time:>13.3f} {'':>8}")
+
+
+if __name__ == '__main__':
+    main()
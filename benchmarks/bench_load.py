@@ -0,0 +1,100 @@
+import os
+import random
+import sys
+import tempfile
+import time
+
+import ezdxf
+from PySide6.QtCore import QPoint
+
+from pycad.DrawableDimensionImpl import Dimension
+from pycad.DrawableLineImpl import Line
+from pycad.DrawableTextImpl import Text
+from pycad.constants import dxf_app_id
+from pycad.util_dxf import read_layers, read_layer
+from pycad.util_dxf_stream import DxfStreamReader
+
+
+def make_drawing(filename: str, count: int, seed: int = 1):
+    # floor plan walls on an auto-cut layer, one text every 20 walls
+    rnd = random.Random(seed)
+    size = int(1000 * count ** 0.5)
+    doc = ezdxf.new()
+    doc.appids.new(dxf_app_id)
+    walls = doc.layers.new(name="walls")
+    walls.set_xdata(dxf_app_id, [(1001, dxf_app_id), (1000, "autocut"), (1070, 1)])
+    doc.layers.new(name="notes")
+    msp = doc.modelspace()
+    for i in range(count):
+        x, y = rnd.randint(0, size), rnd.randint(0, size)
+        length = rnd.randint(100, 3000)
+        if rnd.random() < 0.5:
+            msp.add_line((x, y), (x + length, y), dxfattribs={'layer': 'walls'})
+        else:
+            msp.add_line((x, y), (x, y + length), dxfattribs={'layer': 'walls'})
+        if i % 20 == 0:
+            msp.add_text(f"room {i}", dxfattribs={'layer': 'notes', 'insert': (x, y), 'height': 25})
+    doc.saveas(filename)
+
+
+def read_per_entity(doc):
+    # the loader before the bulk import: one add_drawable per entity
+    layers = [read_layer(dxf_layer) for dxf_layer in doc.layers]
+    for entity in doc.entities:
+        drawable = None
+        if entity.dxftype() == 'LINE':
+            drawable = Line(QPoint(entity.dxf.start.x, entity.dxf.start.y), QPoint(entity.dxf.end.x, entity.dxf.end.y))
+        elif entity.dxftype() == 'TEXT':
+            drawable = Text.from_dxf(entity)
+        elif entity.dxftype() == 'DIMENSION':
+            drawable = Dimension.from_dxf(entity)
+        if drawable:
+            for layer in layers:
+                if layer.name == entity.dxf.layer:
+                    layer.add_drawable(drawable)
+                    break
+    return layers
+
+
+def read_streamed(filename: str):
+    # what MainWindow.load_dxf_async does, without the thread
+    layers, by_name = [], {}
+    with open(filename, "rb") as stream:
+        for event, data in DxfStreamReader(stream).read():
+            if event == "layers":
+                layers = data
+                for layer in layers:
+                    by_name.setdefault(layer.name, layer)
+                continue
+            for name, (lines, drawables) in data.items():
+                by_name[name].import_entities(lines, drawables, cleanup=False)
+    for layer in by_name.values():
+        layer.finish_import()
+    return layers
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "drawing.dxf")
+        make_drawing(filename, count)
+        read_time, doc = timed(ezdxf.readfile, filename)
+        stream_time, streamed = timed(read_streamed, filename)
+    print(f"{len(doc.entities)} entities, ezdxf.readfile {read_time:.2f}s")
+    print(f"{'streamed':>20} {stream_time:8.2f}s  (file to layers, no ezdxf document)")
+    for label, loader in (("read_layers", lambda: read_layers(doc)),
+                          ("read_layers autocut", lambda: read_layers(doc, autocut=True)),
+                          ("add_drawable", lambda: read_per_entity(doc))):
+        load_time, layers = timed(loader)
+        counts = ", ".join(f"{layer.name}: {len(layer.lines) + len(layer.entities)}" for layer in layers)
+        print(f"{label:>20} {load_time:8.2f}s  {counts}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+import os
+import sys
+import time
+
+import ezdxf
+import numpy as np
+from PySide6.QtCore import QLineF, QPoint
+from PySide6.QtGui import QImage, QPainter, QColor, Qt
+from PySide6.QtWidgets import QApplication
+
+from pycad.ComponentLayers import LayerModel
+from pycad.DrawableDimensionImpl import Dimension
+from pycad.DrawableTextImpl import Text
+from pycad.util_drawable import LineBatch
+
+
+def load_tiled(filename: str, copies: int):
+    # example.dxf repeated on a copies x copies grid, lines go straight to the layer store
+    doc = ezdxf.readfile(filename)
+    layers = {dxf_layer.dxf.name: LayerModel(name=dxf_layer.dxf.name, color=QColor(Qt.black), width=1, visible=True)
+              for dxf_layer in doc.layers}
+    lines = {name: [] for name in layers}
+    others = {name: [] for name in layers}
+    for entity in doc.modelspace():
+        if entity.dxftype() == 'LINE':
+            lines[entity.dxf.layer].append((entity.dxf.start.x, entity.dxf.start.y, entity.dxf.end.x, entity.dxf.end.y))
+        elif entity.dxftype() in ('TEXT', 'DIMENSION'):
+            others[entity.dxf.layer].append(entity)
+    coords = np.array([row for rows in lines.values() for row in rows])
+    width = coords[:, [0, 2]].max() - coords[:, [0, 2]].min()
+    height = coords[:, [1, 3]].max() - coords[:, [1, 3]].min()
+    for name, layer in layers.items():
+        for tx in range(copies):
+            for ty in range(copies):
+                dx, dy = tx * width * 1.1, ty * height * 1.1
+                if lines[name]:
+                    rows = np.array(lines[name])
+                    layer.lines.extend(layer.new_ids(len(rows)), rows[:, 0] + dx, rows[:, 1] + dy,
+                                       rows[:, 2] + dx, rows[:, 3] + dy)
+                for entity in others[name]:
+                    drawable = Text.from_dxf(entity) if entity.dxftype() == 'TEXT' else Dimension.from_dxf(entity)
+                    drawable.start_point = drawable.start_point + QPoint(dx, dy)
+                    drawable.end_point = drawable.end_point + QPoint(dx, dy)
+                    layer.store_drawable(drawable)
+        layer.rebuild_index()
+    return list(layers.values())
+
+
+def render(layers, draw_lines, size=(1600, 1200)):
+    bounds = [layer.bounds() for layer in layers if layer.bounds() is not None]
+    xmin, ymin = min(b[0] for b in bounds), min(b[1] for b in bounds)
+    xmax, ymax = max(b[2] for b in bounds), max(b[3] for b in bounds)
+    zoom = min(size[0] / (xmax - xmin), size[1] / (ymax - ymin))
+    image = QImage(size[0], size[1], QImage.Format_ARGB32_Premultiplied)
+    image.fill(Qt.white)
+    painter = QPainter(image)
+    painter.scale(zoom, zoom)
+    painter.translate(-xmin, -ymin)
+    start = time.perf_counter()
+    for layer in layers:
+        ids, x1, y1, x2, y2 = layer.lines.columns()
+        draw_lines(painter, x1, y1, x2, y2)
+    lines_time = time.perf_counter() - start
+    for layer in layers:
+        for entity_id, drawable in layer.entities.items():
+            drawable.update(painter)
+            drawable.draw(painter)
+    total_time = time.perf_counter() - start
+    painter.end()
+    return lines_time, total_time, image
+
+
+def draw_each(painter, x1, y1, x2, y2):
+    for line in zip(x1.tolist(), y1.tolist(), x2.tolist(), y2.tolist()):
+        painter.drawLine(QLineF(*line))
+
+
+def main():
+    if QApplication.instance() is None:
+        QApplication([])
+    copies = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    filename = os.path.join(os.path.dirname(__file__), '..', 'example.dxf')
+    layers = load_tiled(filename, copies)
+    line_count = sum(len(layer.lines) for layer in layers)
+    entity_count = sum(len(layer.entities) for layer in layers)
+    print(f"example.dxf x{copies * copies}: {line_count} lines, {entity_count} texts and dimensions")
+    batch = LineBatch()
+    each_lines, each_total, each_image = render(layers, draw_each)
+    batch_lines, batch_total, batch_image = render(layers, batch.draw)
+    assert each_image == batch_image, "batched lines render differently"
+    print(f"{'path':>10} {'lines [s]':>10} {'frame [s]':>10}")
+    print(f"{'drawLine':>10} {each_lines:10.4f} {each_total:10.4f}")
+    print(f"{'drawLines':>10} {batch_lines:10.4f} {batch_total:10.4f}")
+    print(f"lines {each_lines / batch_lines:.1f}x faster")
+
+
+if __name__ == '__main__':
+    main()
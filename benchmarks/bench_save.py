@@ -0,0 +1,48 @@
+import os
+import random
+import sys
+import tempfile
+
+import ezdxf
+from PySide6.QtCore import QPoint
+
+from bench_load import make_drawing, timed
+from pycad.ComponentLayers import LayerModel
+from pycad.DrawableDimensionImpl import Dimension
+from pycad.util_dxf import read_layers, snapshot_layers, write_dxf
+
+
+def dimension_layer(count: int, seed: int = 1) -> LayerModel:
+    rnd = random.Random(seed)
+    layer = LayerModel(name="dims")
+    for i in range(count):
+        x, y = rnd.randint(0, 100000), rnd.randint(0, 100000)
+        layer.add_drawable(Dimension(QPoint(x, y), QPoint(x + rnd.randint(100, 3000), y)))
+    return layer
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "drawing.dxf")
+        make_drawing(filename, count)
+        snapshot = snapshot_layers(read_layers(ezdxf.readfile(filename)))
+        for label, kwargs in (("ezdxf entities", dict(direct=False)), ("direct tags", {}),
+                              ("canonical", dict(canonical=True))):
+            output = os.path.join(directory, f"saved_{label.replace(' ', '_')}.dxf")
+            save_time, _ = timed(write_dxf, snapshot, output, **kwargs)
+            print(f"{label:>24} {save_time:8.2f}s  {os.path.getsize(output) // 1024} KiB")
+
+        # a dimension sheet: rendered by ezdxf on the first save, from the cached tags after
+        snapshot = snapshot_layers([dimension_layer(count // 10)])
+        output = os.path.join(directory, "dimensions.dxf")
+        for label, kwargs in (("dimensions ezdxf", dict(direct=False)),
+                              ("dimensions first save", {}),
+                              ("dimensions cached", {}),
+                              ("dimensions not rendered", dict(render_dimensions=False))):
+            save_time, _ = timed(write_dxf, snapshot, output, **kwargs)
+            print(f"{label:>24} {save_time:8.2f}s  {os.path.getsize(output) // 1024} KiB")
+
+
+if __name__ == '__main__':
+    main()
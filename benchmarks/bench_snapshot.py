@@ -0,0 +1,45 @@
+import gc
+import os
+import sys
+import tempfile
+
+import ezdxf
+
+from bench_load import make_drawing, read_streamed, timed
+from pycad.util_dxf import read_layers, snapshot_layers
+from pycad.util_snapshot import detach_snapshot, is_mapped, read_native_snapshot, snapshot_path, write_native_snapshot
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "drawing.dxf")
+        make_drawing(filename, count)
+        dxf_time, layers = timed(lambda: read_layers(ezdxf.readfile(filename)))
+        stream_time, _ = timed(read_streamed, filename)
+        write_time, _ = timed(write_native_snapshot, snapshot_layers(layers), snapshot_path(filename), filename)
+        # what a fresh start has in memory, the loads above would make the timing mostly garbage collection
+        del layers
+        gc.collect()
+        read_time, layers = timed(read_native_snapshot, snapshot_path(filename), filename)
+        size = os.path.getsize(snapshot_path(filename)) // 1024
+        # saving over the snapshot the drawing was opened from, as the main window does: a file
+        # still mapped could not be replaced on Windows
+        detach_time, _ = timed(detach_snapshot, layers)
+        mapped = [name for layer in layers for owner in (layer.lines, layer.index)
+                  for name, value in vars(owner).items() if is_mapped(value)]
+        if mapped:
+            raise AssertionError(f"still mapped after detach_snapshot: {', '.join(mapped)}")
+        write_native_snapshot(snapshot_layers(layers), snapshot_path(filename), filename)
+        if read_native_snapshot(snapshot_path(filename), filename) is None:
+            raise AssertionError("the snapshot saved over itself does not read back")
+    print(f"{count} lines")
+    print(f"{'ezdxf + read_layers':>22} {dxf_time:8.3f}s")
+    print(f"{'streamed':>22} {stream_time:8.3f}s")
+    print(f"{'snapshot write':>22} {write_time:8.3f}s  {size} KiB")
+    print(f"{'snapshot read':>22} {read_time:8.3f}s")
+    print(f"{'detach, saved over':>22} {detach_time:8.3f}s")
+
+
+if __name__ == '__main__':
+    main()
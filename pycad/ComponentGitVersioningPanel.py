@@ -1,17 +1,29 @@
 from PySide6.QtGui import QFont
-from PySide6.QtWidgets import (QApplication, QDialog, QVBoxLayout, QHBoxLayout,
-                               QListWidget, QTextEdit, QPushButton, QLabel, QTableWidgetItem, QTableWidget, QHeaderView)
-from PySide6.QtCore import Qt, Signal
+from PySide6.QtWidgets import (QApplication, QDialog, QVBoxLayout, QHBoxLayout, QAbstractItemView,
+                               QListWidget, QTextEdit, QPushButton, QLabel, QTableWidgetItem, QTableWidget, QHeaderView,
+                               QTableView, QCheckBox, QProgressBar)
+from PySide6.QtCore import Qt, Signal, QTimer
+from datetime import datetime
+from typing import Callable, Optional
 import git
 import os
 
 from git import Commit
 
+from pycad.util_diff import CompareLoader, DiffLoader, parent_of
+from pycad.util_git import CommitLogModel, CommitWorker, drawing_files, ignore_snapshots
+
 
 class GitVersioningPanel(QDialog):
     closed = Signal(bool)  # Define a custom signal with a generic object type
+    compared = Signal(object)  # util_diff.RevisionCompare of the selected commit and its parent, None when off
+    reverting = Signal()  # before the drawing is checked out again, its file must not be in use
+    reverted = Signal()  # the drawing in its file is the one of HEAD, to be loaded again
 
     def closeEvent(self, event):
+        self.commits_model.stop()
+        for loader in self.findChildren(DiffLoader) + self.findChildren(CompareLoader) + self.findChildren(CommitWorker):
+            loader.wait()
         self.closed.emit(True)
 
     def __init__(self, repo_path, parent=None, filename: str = ""):
@@ -20,10 +32,25 @@ class GitVersioningPanel(QDialog):
 
         # Create and initialize repo if it doesn't exist
         if not os.path.exists(repo_path):
-            os.makedirs(repo_path)
-            self.repo = git.Repo.init(repo_path)
+            if os.path.basename(os.path.normpath(repo_path)) == ".git":
+                # the git directory of a work tree, the work tree is the one to init
+                self.repo = git.Repo.init(os.path.dirname(os.path.abspath(repo_path)))
+            else:
+                os.makedirs(repo_path)
+                self.repo = git.Repo.init(repo_path)
         else:
             self.repo = git.Repo(repo_path)
+        if self.repo.working_tree_dir is not None:
+            ignore_snapshots(self.repo.working_tree_dir)
+        self.drawing_path = self.path_in_repo(filename)
+        # set by the main window: takes the drawing as it is now and returns what writes it to its file
+        self.drawing_writer: Optional[Callable[[], Optional[Callable[[], None]]]] = None
+        self.commit_worker: Optional[CommitWorker] = None
+        # auto-commit: every auto_commit_interval ms, if the drawing was edited since the last commit
+        self.drawing_edited = False
+        self.auto_commit_interval = 5 * 60 * 1000
+        self.auto_commit_timer = QTimer(self)
+        self.auto_commit_timer.timeout.connect(self.auto_commit)
 
         self.setWindowTitle(f"PyCAD24 - Version Control - {filename}")
         self.setGeometry(100, 100, 600, 600)
@@ -38,22 +65,28 @@ class GitVersioningPanel(QDialog):
         # Monospace font
         monospace_font = QFont("Courier New")
 
-        # Commits List
-        self.commits_table = QTableWidget()
-        self.commits_table.setColumnCount(3)
-        self.commits_table.setHorizontalHeaderLabels(["Date", "Message", "SHA"])
+        # Commits List, read page by page as it is scrolled
+        self.commits_model = CommitLogModel(self.repo, parent=self)
+        self.commits_table = QTableView()
+        self.commits_table.setModel(self.commits_model)
+        self.commits_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.commits_table.setSelectionMode(QAbstractItemView.SingleSelection)
         self.commits_table.setFont(monospace_font)
-        self.load_commits()
-        self.commits_table.itemSelectionChanged.connect(self.load_diff)
+        self.commits_table.horizontalHeader().setStretchLastSection(True)
+        self.commits_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.commits_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        self.commits_table.selectionModel().selectionChanged.connect(self.load_diff)
 
-        # Current Diff List
+        # Current Diff List, entities per layer of the drawing or lines per file
         self.current_diff_table = QTableWidget()
-        self.current_diff_table.setColumnCount(3)
-        self.current_diff_table.setHorizontalHeaderLabels(["+", "-", "Filename"])
+        self.current_diff_table.setColumnCount(4)
+        self.current_diff_table.setHorizontalHeaderLabels(["+", "-", "~", "Layer" if self.drawing_path else "Filename"])
         self.current_diff_table.setFont(monospace_font)
         # Set fixed column widths
-        self.current_diff_table.setColumnWidth(0, 25)  # Set width of column 1 to 100
-        self.current_diff_table.setColumnWidth(1, 25)  # Set width of column 2 to 150
+        self.current_diff_table.setColumnWidth(0, 50)
+        self.current_diff_table.setColumnWidth(1, 50)
+        self.current_diff_table.setColumnWidth(2, 50)
+        self.current_diff_table.horizontalHeader().setStretchLastSection(True)
 
         # Commit Message Textbox
         self.commit_message_textbox = QTextEdit()
@@ -63,12 +96,30 @@ class GitVersioningPanel(QDialog):
         # Buttons
         self.revert_button = QPushButton("Revert")
         self.revert_button.setObjectName("REVERT_BUTTON")
+        self.revert_button.setEnabled(self.drawing_path is not None)
         self.revert_button.clicked.connect(self.revert_changes)
 
+        self.compare_button = QPushButton("Compare")
+        self.compare_button.setObjectName("COMPARE_BUTTON")
+        self.compare_button.setCheckable(True)
+        self.compare_button.setEnabled(self.drawing_path is not None)
+        self.compare_button.toggled.connect(self.load_compare)
+
         self.commit_button = QPushButton("Commit")
         self.commit_button.setObjectName("COMMIT_BUTTON")
+        self.commit_button.setEnabled(self.drawing_path is not None)
         self.commit_button.clicked.connect(self.commit_changes)
 
+        self.auto_commit_checkbox = QCheckBox("Auto-commit")
+        self.auto_commit_checkbox.setObjectName("AUTO_COMMIT_CHECKBOX")
+        self.auto_commit_checkbox.setEnabled(self.drawing_path is not None)
+        self.auto_commit_checkbox.toggled.connect(self.set_auto_commit)
+
+        self.commit_progress = QProgressBar()
+        self.commit_progress.setObjectName("COMMIT_PROGRESS")
+        self.commit_progress.setTextVisible(True)
+        self.commit_progress.hide()
+
         # Adding widgets to layouts
         commits_layout.addWidget(QLabel("Commits"))
         commits_layout.addWidget(self.commits_table)
@@ -80,61 +131,158 @@ class GitVersioningPanel(QDialog):
         message_layout.addWidget(self.commit_message_textbox)
 
         button_layout.addWidget(self.revert_button)
+        button_layout.addWidget(self.compare_button)
+        button_layout.addWidget(self.auto_commit_checkbox)
         button_layout.addWidget(self.commit_button)
 
         main_layout.addLayout(commits_layout)
         main_layout.addLayout(diff_layout)
         main_layout.addLayout(message_layout)
         main_layout.addLayout(button_layout)
+        main_layout.addWidget(self.commit_progress)
 
         self.setLayout(main_layout)
 
-    def load_commits(self):
-        self.commits_table.setRowCount(0)
-        for commit in self.repo.iter_commits():
-            row_position = self.commits_table.rowCount()
-            self.commits_table.insertRow(row_position)
-            self.commits_table.setItem(row_position, 0,
-                                       QTableWidgetItem(f"{commit.committed_datetime:%Y-%m-%d %H:%M:%S}"))
-            self.commits_table.setItem(row_position, 1, QTableWidgetItem(commit.message.splitlines()[0]))
-            self.commits_table.setItem(row_position, 2, QTableWidgetItem(commit.hexsha))
+    def path_in_repo(self, filename: str):
+        # the drawing as a path in the tree of the repository, None when it is not in it
+        if not filename or self.repo.working_tree_dir is None:
+            return None
+        path = os.path.relpath(os.path.abspath(filename), self.repo.working_tree_dir)
+        return None if path.startswith("..") else path.replace(os.sep, "/")
 
-        self.commits_table.horizontalHeader().setStretchLastSection(True)
-        self.commits_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
-        self.commits_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+    def selected_commit(self):
+        selected_rows = self.commits_table.selectionModel().selectedRows()
+        return self.commits_model.commit_at(selected_rows[0].row()) if selected_rows else None
+
+    def add_diff_row(self, added: int, removed: int, modified, name: str):
+        row_position = self.current_diff_table.rowCount()
+        self.current_diff_table.insertRow(row_position)
+        for column, value in enumerate((added, removed, modified, name)):
+            self.current_diff_table.setItem(row_position, column, QTableWidgetItem("" if value is None else str(value)))
 
     def load_diff(self):
         self.current_diff_table.setRowCount(0)
-        selected_items = self.commits_table.selectedItems()
-        if selected_items:
-            row = self.commits_table.currentRow()
-            commit_hash = self.commits_table.item(row, 2).text()
-            commit = self.repo.commit(commit_hash)
-            diffs = commit.diff('HEAD~1')
-            for diff in diffs:
-                if diff.a_path:
-                    additions = sum(
-                        1 for line in diff.diff.split('\n') if line.startswith('+') and not line.startswith('+++'))
-                    deletions = sum(
-                        1 for line in diff.diff.split('\n') if line.startswith('-') and not line.startswith('---'))
-                    row_position = self.current_diff_table.rowCount()
-                    self.current_diff_table.insertRow(row_position)
-                    self.current_diff_table.setItem(row_position, 0, QTableWidgetItem(str(additions)))
-                    self.current_diff_table.setItem(row_position, 1, QTableWidgetItem(str(deletions)))
-                    self.current_diff_table.setItem(row_position, 2, QTableWidgetItem(diff.a_path))
-
-        self.current_diff_table.horizontalHeader().setStretchLastSection(True)
-        self.current_diff_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.Stretch)
+        record = self.selected_commit()
+        if self.compare_button.isChecked():
+            self.load_compare(True)
+        if record is None:
+            return
+        if self.drawing_path:
+            # read from the object store on a worker thread, cached once done
+            loader = DiffLoader(self.repo.git_dir, record.hexsha, self.drawing_path, self)
+            loader.diff_read.connect(self.show_layer_diffs)
+            loader.finished.connect(loader.deleteLater)
+            loader.start()
+            return
+        commit = self.repo.commit(record.hexsha)
+        diffs = commit.diff('HEAD~1')
+        for diff in diffs:
+            if diff.a_path:
+                additions = sum(
+                    1 for line in diff.diff.split('\n') if line.startswith('+') and not line.startswith('+++'))
+                deletions = sum(
+                    1 for line in diff.diff.split('\n') if line.startswith('-') and not line.startswith('---'))
+                self.add_diff_row(additions, deletions, None, diff.a_path)
+
+    def show_layer_diffs(self, rev: str, diffs):
+        record = self.selected_commit()
+        if record is None or record.hexsha != rev:
+            # the selection moved on while this one was read
+            return
+        self.current_diff_table.setRowCount(0)
+        for diff in diffs:
+            self.add_diff_row(*diff.counts(), diff.name)
+
+    def load_compare(self, checked: bool):
+        record = self.selected_commit()
+        if not checked or record is None or not self.drawing_path:
+            self.compared.emit(None)
+            return
+        loader = CompareLoader(self.repo.git_dir, parent_of(self.repo, record.hexsha), record.hexsha,
+                               self.drawing_path, self)
+        loader.compare_read.connect(self.show_compare)
+        loader.finished.connect(loader.deleteLater)
+        loader.start()
+
+    def show_compare(self, compare):
+        record = self.selected_commit()
+        if self.compare_button.isChecked() and record is not None and record.hexsha == compare.new:
+            self.compared.emit(compare)
 
     def commit_changes(self):
-        message = self.commit_message_textbox.toPlainText()
-        self.repo.git.add(A=True)
-        self.repo.index.commit(message)
-        self.load_commits()
+        self.commit_drawing(self.commit_message_textbox.toPlainText())
+
+    def commit_drawing(self, message: str) -> bool:
+        """
+        Commits the drawing and its sidecars on a CommitWorker, written first by drawing_writer
+        when it was edited since the last commit (a write alone changes the sidecars). Other
+        files of the work tree are left out. False while a commit runs.
+        """
+        if self.commit_worker is not None or not self.drawing_path:
+            return False
+        write = self.drawing_writer() if self.drawing_writer is not None and self.drawing_edited else None
+        self.drawing_edited = False
+        self.commit_worker = CommitWorker(self.repo.git_dir, drawing_files(self.drawing_path), message, write, self)
+        self.commit_worker.progress.connect(self.on_commit_progress)
+        self.commit_worker.committed.connect(self.on_committed)
+        self.commit_worker.failed.connect(self.on_commit_failed)
+        self.commit_worker.finished.connect(self.on_commit_finished)
+        self.commit_button.setEnabled(False)
+        self.commit_progress.show()
+        self.commit_worker.start()
+        return True
+
+    def on_commit_progress(self, step: str, done: int, steps: int):
+        self.commit_progress.setRange(0, steps)
+        self.commit_progress.setValue(done)
+        self.commit_progress.setFormat(f"{step} (%v/%m)")
+
+    def on_committed(self, hexsha: str):
+        if hexsha:
+            self.commits_model.prepend(self.repo.commit(hexsha))
+
+    def on_commit_failed(self, message: str):
+        # what was not committed is committed by the next one
+        self.drawing_edited = True
+        self.commit_progress.setFormat(f"commit failed: {message}")
+
+    def on_commit_finished(self):
+        self.commit_worker.deleteLater()
+        self.commit_worker = None
+        self.commit_button.setEnabled(True)
+        if self.commit_progress.value() == self.commit_progress.maximum():
+            self.commit_progress.hide()
+
+    def mark_edited(self):
+        # edits between two ticks of the auto-commit make one commit
+        self.drawing_edited = True
+
+    def set_auto_commit(self, checked: bool):
+        if checked:
+            self.auto_commit_timer.start(self.auto_commit_interval)
+        else:
+            self.auto_commit_timer.stop()
+
+    def auto_commit(self):
+        if self.drawing_edited and self.commit_worker is None:
+            self.commit_drawing(f"auto-commit {datetime.now():%Y-%m-%d %H:%M:%S}")
 
     def revert_changes(self):
-        self.repo.git.reset('--hard')
-        self.load_commits()
+        """
+        The drawing and its sidecars back to how HEAD has them, the rest of the work tree,
+        which may not be pycad's, is left alone. The history does not change, the commits
+        stay as they are.
+        """
+        if self.commit_worker is not None or not self.drawing_path or not self.repo.head.is_valid():
+            return
+        files = drawing_files(self.drawing_path)
+        paths = self.repo.git.ls_tree("--name-only", "HEAD", "--", *files).splitlines()
+        if not paths:
+            return
+        self.reverting.emit()
+        self.repo.git.checkout("HEAD", "--", *paths)
+        self.drawing_edited = False
+        self.reverted.emit()
 
 
 if __name__ == "__main__":
@@ -1,11 +1,20 @@
-from PySide6.QtCore import Signal
+import heapq
+from operator import itemgetter
+from typing import Dict, List
+
+import numpy as np
+from PySide6.QtCore import Signal, QRect, QPoint
 from PySide6.QtGui import QColor, Qt
 from PySide6.QtWidgets import QWidget, QHBoxLayout, QRadioButton, QLineEdit, QSpinBox, QPushButton, QLabel, QCheckBox, \
     QComboBox, QDialog, QVBoxLayout, QListWidget, QListWidgetItem, QColorDialog
 
+from pycad.Drawable import Drawable
 from pycad.DrawableLineImpl import Line, split_line_by_points
-from pycad.constants import linetypes
+from pycad.DrawableLineStore import LineStore
+from pycad.constants import linetypes, TOLERANCE
 from pycad.util_geometry import sort_points_on_line
+from pycad.util_intersections import find_intersections
+from pycad.util_spatial import SegmentIndex, segment_bbox
 
 
 class LayerModel:
@@ -15,13 +24,206 @@ class LayerModel:
         self.color = color
         self.lineweight = width
         self.visible = visible
-        self.drawables = []
         self.flAutoCut = False
+        self.next_id = 0
+        # bumped on every change of the content, lets views cache what they drew
+        self.revision = 0
+        # lines live in columns, every other drawable (text, dimension) by entity id
+        self.lines = LineStore()
+        self.entities: Dict[int, Drawable] = {}
+        self.index = SegmentIndex()
+        # util_journal.Journal recording the edits, set while a journal is open
+        self.journal = None
+
+    @property
+    def drawables(self) -> List[Drawable]:
+        # lines and other entities merged back in insertion order
+        return [drawable for entity_id, drawable in
+                heapq.merge(self.lines.items(), self.entities.items(), key=itemgetter(0))]
+
+    @drawables.setter
+    def drawables(self, drawables: List[Drawable]):
+        self.lines = LineStore()
+        self.entities = {}
+        for drawable in drawables:
+            self.store_drawable(drawable)
+        self.rebuild_index()
+
+    def new_ids(self, count: int = 1) -> np.ndarray:
+        ids = np.arange(self.next_id, self.next_id + count, dtype=np.int64)
+        self.next_id += count
+        self.revision += 1
+        return ids
+
+    def store_drawable(self, drawable: Drawable) -> int:
+        entity_id = int(self.new_ids()[0])
+        if isinstance(drawable, Line):
+            start_point, end_point = drawable.start_point, drawable.end_point
+            self.lines.append(entity_id, start_point.x(), start_point.y(), end_point.x(), end_point.y())
+        else:
+            drawable.entity_id = entity_id
+            self.entities[entity_id] = drawable
+        return entity_id
+
+    def lookup(self, entity_id: int) -> Drawable:
+        drawable = self.entities.get(entity_id)
+        return drawable if drawable is not None else self.lines.view(entity_id)
 
     def add_drawable(self, line: Line):
-        self.drawables.append(line)
         if isinstance(line, Line):
-            self.cleanup()
+            self.insert_line(line)
+        else:
+            self.index_drawable(line)
+
+    def import_entities(self, lines: np.ndarray, drawables: List[Drawable] = (), autocut: bool = False,
+                        cleanup: bool = True):
+        """
+        Bulk add for loading: lines as an (n, 4) array of x1, y1, x2, y2 and the other
+        drawables are stored as they are, the index is built once and one cleanup pass
+        runs at the end. Auto-cut only runs when asked for and flAutoCut is set.
+        A load arriving in chunks passes cleanup=False and calls finish_import() after
+        the last one, small chunks then go to the dynamic part of the index.
+        """
+        lines = np.asarray(lines, dtype=np.float64).reshape(-1, 4)
+        ids = self.new_ids(len(lines))
+        self.lines.extend(ids, lines[:, 0], lines[:, 1], lines[:, 2], lines[:, 3])
+        drawable_ids = [self.store_drawable(drawable) for drawable in drawables]
+        if len(lines) + len(drawables) > max(4096, self.index.static_count // 4):
+            self.rebuild_index()
+        else:
+            for entity_id, (x1, y1, x2, y2) in zip(ids.tolist(), lines.tolist()):
+                self.index.insert(entity_id, x1, y1, x2, y2)
+            for entity_id, drawable in zip(drawable_ids, drawables):
+                start_point, end_point = drawable.start_point, drawable.end_point
+                self.index.insert(entity_id, start_point.x(), start_point.y(), end_point.x(), end_point.y())
+            if self.index.needs_rebuild():
+                self.rebuild_index()
+        if self.journal is not None:
+            for x1, y1, x2, y2 in lines.tolist():
+                self.journal.added(self, Line(QPoint(x1, y1), QPoint(x2, y2)))
+            for drawable in drawables:
+                self.journal.added(self, drawable)
+        if cleanup:
+            self.finish_import(autocut)
+
+    def finish_import(self, autocut: bool = False):
+        if autocut and self.flAutoCut:
+            self.rescan_intersections()
+        self.remove_short_lines()
+        self.cleanup_duplicates()
+
+    def insert_line(self, line: Line):
+        # incremental cleanup, only the new line and the lines it crosses are looked at.
+        # cleanup() is still the full rescan of the layer.
+        fragments = self.cut_crossed_lines(line) if self.flAutoCut else [line]
+        for fragment in fragments:
+            if fragment.is_empty() or self.find_duplicate(fragment) is not None:
+                continue
+            self.index_drawable(fragment)
+
+    def cut_crossed_lines(self, line: Line) -> List[Line]:
+        points = []
+        fragments = []
+        for other in self.query_lines(segment_bbox(line.start_point, line.end_point)):
+            intersect_point = other.intersect(line)
+            if intersect_point:
+                points.append(intersect_point)
+                fragments.extend(split_line_by_points(other, [intersect_point]))
+                self.remove_drawable(other)
+        fragments.extend(split_line_by_points(line, sort_points_on_line(line, points)))
+        return fragments
+
+    def find_duplicate(self, line: Line):
+        x1, y1, x2, y2 = segment_bbox(line.start_point, line.end_point)
+        for other in self.query_lines((x1 - TOLERANCE, y1 - TOLERANCE, x2 + TOLERANCE, y2 + TOLERANCE)):
+            if other == line:
+                return other
+        return None
+
+    def query_lines(self, bbox) -> List[Line]:
+        rows = self.lines.rows_of(self.index.query(bbox))
+        return [self.lines.view(entity_id) for entity_id in self.lines.ids[rows].tolist()]
+
+    def remove_drawable(self, drawable: Drawable):
+        self.remove_ids(np.array([drawable.entity_id], dtype=np.int64))
+
+    def remove_drawables(self, drawables: List[Drawable]):
+        self.remove_ids(np.array([drawable.entity_id for drawable in drawables], dtype=np.int64))
+
+    def remove_ids(self, ids: np.ndarray):
+        if len(ids) == 0:
+            return
+        if self.journal is not None:
+            self.journal.removed(self, ids)
+        self.revision += 1
+        self.lines.remove_many(ids)
+        for entity_id in ids.tolist():
+            self.entities.pop(entity_id, None)
+        self.index.remove_many(ids)
+        if self.index.needs_rebuild():
+            self.rebuild_index()
+
+    def update_drawable(self, drawable: Drawable):
+        # to be called after the points of a drawable of this layer were edited
+        self.revision += 1
+        start_point, end_point = drawable.start_point, drawable.end_point
+        self.index.update(drawable.entity_id, start_point.x(), start_point.y(), end_point.x(), end_point.y())
+
+    def index_drawable(self, drawable: Drawable) -> int:
+        entity_id = self.store_drawable(drawable)
+        start_point, end_point = drawable.start_point, drawable.end_point
+        self.index.insert(entity_id, start_point.x(), start_point.y(), end_point.x(), end_point.y())
+        if self.index.needs_rebuild():
+            self.rebuild_index()
+        if self.journal is not None:
+            self.journal.added(self, drawable)
+        return entity_id
+
+    def rebuild_index(self):
+        ids, x1, y1, x2, y2 = self.lines.columns()
+        if self.entities:
+            points = [(drawable.start_point, drawable.end_point) for drawable in self.entities.values()]
+            ids = np.concatenate((ids, np.fromiter(self.entities.keys(), dtype=np.int64)))
+            x1 = np.concatenate((x1, [p.x() for p, q in points]))
+            y1 = np.concatenate((y1, [p.y() for p, q in points]))
+            x2 = np.concatenate((x2, [q.x() for p, q in points]))
+            y2 = np.concatenate((y2, [q.y() for p, q in points]))
+        self.index.rebuild(ids, x1, y1, x2, y2)
+
+    def get_drawables(self, rect: QRect = None) -> List[Drawable]:
+        if rect is None:
+            return self.drawables
+        drawables = [self.lookup(entity_id) for entity_id in self.index.query_rect(rect).tolist()]
+        return [drawable for drawable in drawables if drawable.intersects(rect)]
+
+    def query(self, bbox):
+        """columns of the lines and the other drawables whose bounding box overlaps bbox"""
+        ids = self.index.query(bbox)
+        columns = self.lines.columns(self.lines.rows_of(ids))
+        if not self.entities:
+            return columns, []
+        ids = ids[np.isin(ids, np.fromiter(self.entities.keys(), dtype=np.int64))]
+        return columns, [self.entities[entity_id] for entity_id in ids.tolist()]
+
+    def hit_test(self, point: QPoint, margin: float = 5) -> List[Drawable]:
+        x, y = point.x(), point.y()
+        ids = self.index.query((x - margin, y - margin, x + margin, y + margin))
+        hits = [self.lines.view(entity_id)
+                for entity_id in self.lines.hit_test(x, y, margin, self.lines.rows_of(ids)).tolist()]
+        hits.extend(self.entities[entity_id] for entity_id in ids.tolist()
+                    if entity_id in self.entities and self.entities[entity_id].contains_point(point))
+        return hits
+
+    def bounds(self):
+        """(xmin, ymin, xmax, ymax) of everything on the layer, None when empty"""
+        boxes = [segment_bbox(drawable.start_point, drawable.end_point) for drawable in self.entities.values()]
+        line_bounds = self.lines.bounds()
+        if line_bounds is not None:
+            boxes.append(line_bounds)
+        if not boxes:
+            return None
+        return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+                max(b[2] for b in boxes), max(b[3] for b in boxes))
 
     def cleanup(self):
         if self.flAutoCut:
@@ -30,14 +232,8 @@ class LayerModel:
         self.cleanup_duplicates()
 
     def rescan_intersections(self):
-        intersection_table = []
-        for i, line1 in enumerate(self.drawables):
-            for j, line2 in enumerate(self.drawables):
-                if i < j:
-                    intersect_point = line1.intersect(line2)
-                    if intersect_point:
-                        intersection_table.append((i, intersect_point))
-                        intersection_table.append((j, intersect_point))
+        drawables = self.drawables
+        intersection_table = find_intersections(drawables)
 
         intersection_groups = {}
         for line_idx, intersect_point in intersection_table:
@@ -47,19 +243,23 @@ class LayerModel:
 
         new_lines = []
         for line_idx, intersect_points in intersection_groups.items():
-            line = self.drawables[line_idx]
+            line = drawables[line_idx]
             sorted_points = sort_points_on_line(line, intersect_points)
             new_lines.extend(split_line_by_points(line, sorted_points))
 
-        self.drawables = [line for idx, line in enumerate(self.drawables) if idx not in intersection_groups]
-        self.drawables.extend(new_lines)
+        self.remove_drawables([drawables[idx] for idx in intersection_groups])
+        for line in new_lines:
+            self.index_drawable(line)
 
     def cleanup_duplicates(self):
-        unique_lines = set(self.drawables)
-        self.drawables = list(unique_lines)
+        # order preserving, the first of a group of equal lines is kept
+        self.remove_ids(self.lines.duplicate_ids(TOLERANCE))
 
     def remove_short_lines(self):
-        self.drawables = [line for line in self.drawables if not line.is_empty()]
+        short_ids = self.lines.short_ids(1.0)
+        short_ids = np.concatenate((short_ids, [entity_id for entity_id, drawable in self.entities.items()
+                                                if drawable.is_empty()])).astype(np.int64)
+        self.remove_ids(short_ids)
 
 
 class LayerItem(QWidget):
@@ -109,6 +309,10 @@ class LayerItem(QWidget):
         self.autocut_checkbox.stateChanged.connect(self.on_autocut_changed)
         layout.addWidget(self.autocut_checkbox)
 
+        self.rescan_button = QPushButton("Rescan")
+        self.rescan_button.clicked.connect(self.on_rescan_clicked)
+        layout.addWidget(self.rescan_button)
+
         # Add linetype combo box
         self.linetype_combo = QComboBox()
         self.linetype_combo.addItems(linetypes.keys())
@@ -157,6 +361,11 @@ class LayerItem(QWidget):
         self.layer.flAutoCut = bool(state)
         self.emit_changed()
 
+    def on_rescan_clicked(self):
+        self.layer.cleanup()
+        self.parent.canvas.update()
+        self.emit_changed()
+
     def on_linetype_changed(self, index):
         linetype = self.linetype_combo.currentText()
         self.layer.linetype = linetype
@@ -1,7 +1,7 @@
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 from PySide6.QtCore import QPoint, Qt, Signal, QRect
-from PySide6.QtGui import QMouseEvent, QPainter, QFont, QTransform, QPen
+from PySide6.QtGui import QMouseEvent, QPainter, QFont, QTransform, QPen, QPixmap
 from PySide6.QtWidgets import QWidget, QInputDialog
 
 from pycad.ComponentLayers import LayerModel
@@ -9,10 +9,11 @@ from pycad.Drawable import Drawable, HotspotClasses, HotspotHandler
 from pycad.DrawableDimensionImpl import Dimension
 from pycad.DrawableLineImpl import Line
 from pycad.DrawableTextImpl import Text
-from pycad.constants import linetypes
-from pycad.util_drawable import draw_rect, draw_hotspot_class, draw_cursor, draw_point
+from pycad.util_drawable import draw_rect, draw_hotspot_class, draw_cursor, draw_point, LineBatch
 from pycad.util_geometry import find_nearest_point, snap_to_angle
 from pycad.util_math import distance, floor_to_nearest, ceil_to_nearest
+from pycad.util_diff import RevisionCompare
+from pycad.util_render import LevelOfDetail, layer_pen, paint_layer, text_reach
 
 
 class DrawingManager(QWidget):
@@ -37,10 +38,34 @@ class DrawingManager(QWidget):
         self.screen_point_snapped = QPoint(0, 0)
         self.mode = "line"  # Default mode
         self.font_family = "Arial"  # Default mode
+        # a few pixmaps whatever the number of layers: the layers below the current one, the current
+        # one and the ones above it, so an edit only redraws the current layer, see paintEvent
+        self.layer_cache: Dict[str, Tuple[tuple, QPixmap]] = {}
+        self.line_batch = LineBatch()
+        # level of detail, in screen pixels, 0 turns a rule off: lines and entities shorter than
+        # lod_point_size are drawn as points, texts lower than lod_text_size as their box and
+        # dimensions shorter than lod_dimension_size, or with such a text, as their dimension line
+        self.lod_point_size = 1.0
+        self.lod_text_size = 4.0
+        self.lod_dimension_size = 24.0
+        # compare mode, two revisions shown instead of the layers: the newer one dimmed, what
+        # was added and removed over it, see util_diff.compare_revisions
+        self.compare: Optional[RevisionCompare] = None
+        self.compare_opacity = 0.25
 
     def set_mode(self, mode):
         self.mode = mode
 
+    def set_compare(self, compare: Optional[RevisionCompare]):
+        # None goes back to the layers, the mouse does not edit them while a compare is shown
+        self.compare = compare
+        self.update()
+
+    def set_layers(self, layers: List[LayerModel]):
+        # the layers of a drawing loaded, replayed or reverted, the current one kept when it is still there
+        self.layers = layers
+        self.current_layer_index = max(0, min(self.current_layer_index, len(layers) - 1))
+
     def set_current_layer(self, index):
         self.current_layer_index = index
         self.changed.emit(self.layers)
@@ -79,6 +104,13 @@ class DrawingManager(QWidget):
     def map_to_view(self, point):
         return point * self.zoom_factor + self.offset
 
+    def view_bbox(self, margin: float = 0):
+        # the model space rectangle shown by the widget, grown by margin model units
+        x0 = -self.offset.x() / self.zoom_factor
+        y0 = -self.offset.y() / self.zoom_factor
+        return (x0 - margin, y0 - margin,
+                x0 + self.width() / self.zoom_factor + margin, y0 + self.height() / self.zoom_factor + margin)
+
     def current_layer(self, ):
         return self.layers[self.current_layer_index]
 
@@ -107,6 +139,10 @@ class DrawingManager(QWidget):
 
     def mousePressEvent(self, event: QMouseEvent):
         self.update_mouse_positions(event)
+        if self.compare is not None:
+            # the layers are hidden behind the revisions compared, nothing to edit
+            self.update()
+            return
         if event.button() == Qt.LeftButton:
             layer = self.current_layer()
             self.current_drawable = self.create_drawable(
@@ -115,10 +151,10 @@ class DrawingManager(QWidget):
             )
         elif event.button() == Qt.RightButton:
             layer = self.current_layer()
-            for line in layer.drawables:
-                if line.contains_point(self.model_point_raw):
-                    layer.drawables.remove(line)
-                    self.update()
+            hits = layer.hit_test(self.model_point_raw)
+            if hits:
+                layer.remove_drawables(hits)
+                self.update()
         self.changed.emit(self.layers)
 
     def mouseMoveEvent(self, event):
@@ -136,6 +172,10 @@ class DrawingManager(QWidget):
 
     def mouseReleaseEvent(self, event):
         self.update_mouse_positions(event)
+        if self.compare is not None:
+            self.current_drawable = None
+            self.update()
+            return
         if self.current_drawable:
             end_point = self.model_point_snapped
             if event.modifiers() & Qt.ControlModifier:
@@ -149,13 +189,69 @@ class DrawingManager(QWidget):
         self.changed.emit(self.layers)
         self.update()
 
+    def view_transform(self) -> QTransform:
+        transform = QTransform()
+        transform.translate(self.offset.x(), self.offset.y())
+        transform.scale(self.zoom_factor, self.zoom_factor)
+        return transform
+
+    def layer_pen(self, layer: LayerModel) -> QPen:
+        return layer_pen(layer, self.zoom_factor)
+
+    def level_of_detail(self) -> LevelOfDetail:
+        return LevelOfDetail(self.lod_point_size, self.lod_text_size, self.lod_dimension_size)
+
+    def paint_layer(self, painter: QPainter, layer: LayerModel, view_bbox):
+        # draws the part of the layer inside view_bbox, painter set to model coordinates, see util_render
+        paint_layer(painter, layer, view_bbox, self.zoom_factor, self.line_batch, self.level_of_detail(),
+                    text_reach(layer, painter.font()))
+
+    def layer_pixmap(self, slot: str, layers: List[LayerModel]) -> QPixmap:
+        # layers rendered together for the current view, redrawn only when one of them, its style, the view or
+        # the device pixel ratio (the window moved to another screen) changed
+        key = (tuple((layer, layer.revision, layer.color.rgba(), layer.lineweight, layer.linetype) for layer in layers),
+               self.font_family, self.zoom_factor, self.offset.x(), self.offset.y(), self.width(), self.height(),
+               self.devicePixelRatioF(), self.lod_point_size, self.lod_text_size, self.lod_dimension_size)
+        cached = self.layer_cache.get(slot)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        ratio = self.devicePixelRatioF()
+        pixmap = cached[1] if cached is not None and cached[1].size() == self.size() * ratio else \
+            QPixmap(round(self.width() * ratio), round(self.height() * ratio))
+        pixmap.setDevicePixelRatio(ratio)
+        pixmap.fill(Qt.transparent)
+        painter = QPainter(pixmap)
+        painter.setFont(QFont(self.font_family, 12))
+        painter.setTransform(self.view_transform())
+        view_bbox = self.view_bbox()
+        for layer in layers:
+            self.paint_layer(painter, layer, view_bbox)
+        painter.end()
+        self.layer_cache[slot] = (key, pixmap)
+        return pixmap
+
     def paintEvent(self, event):
         painter: QPainter = QPainter(self)
         font = QFont(self.font_family, 12)  # 12 is the font size
         painter.setFont(font)
-        for drawable in self.get_drawables():
-            drawable.update(painter)
 
+        if self.compare is not None:
+            slots = [("compare base", [layer for layer in self.compare.base if layer.visible], self.compare_opacity),
+                     ("compare changes", [self.compare.removed, self.compare.added], 1.0)]
+        else:
+            index = self.current_layer_index
+            slots = [(slot, [layer for layer in layers if layer.visible], 1.0) for slot, layers in
+                     (("below", self.layers[:index]), ("current", self.layers[index:index + 1]),
+                      ("above", self.layers[index + 1:]))]
+        self.layer_cache = {slot: self.layer_cache[slot] for slot, layers, _ in slots
+                            if layers and slot in self.layer_cache}
+        for slot, layers, opacity in slots:
+            if layers:
+                painter.setOpacity(opacity)
+                painter.drawPixmap(0, 0, self.layer_pixmap(slot, layers))
+        painter.setOpacity(1.0)
+
+        # interactive overlay, drawn over the cached layers on every frame
         # Draw endpoint markers
         for hotspot in self.get_hotspots( self.model_point_raw ):
             cls,p,updater = hotspot
@@ -173,25 +269,10 @@ class DrawingManager(QWidget):
             if isinstance(self.current_drawable.end_point, QPoint):
                 draw_rect(painter, self.map_to_view(self.current_drawable.end_point))
 
-        transform = QTransform()
-        transform.translate(self.offset.x(), self.offset.y())
-        transform.scale(self.zoom_factor, self.zoom_factor)
-        painter.setTransform(transform)
+        painter.setTransform(self.view_transform())
 
-        for layer in self.layers:
-            if not layer.visible:
-                continue
-            pen = QPen(layer.color, layer.lineweight / self.zoom_factor, Qt.SolidLine)
-            pen.setDashPattern(linetypes[layer.linetype])
-            painter.setPen(pen)
-            for drawable in layer.drawables:
-                drawable.draw(painter)
         if self.current_drawable:
-            layer = self.current_layer()
-            pen = QPen(self.current_layer().color, self.current_layer().lineweight / self.zoom_factor, Qt.SolidLine)
-
-            pen.setDashPattern(linetypes[layer.linetype])
-            painter.setPen(pen)
+            painter.setPen(self.layer_pen(self.current_layer()))
             self.current_drawable.draw(painter)
 
         # if self.flSnapGrid:
@@ -205,12 +286,13 @@ class DrawingManager(QWidget):
         for layer in self.layers:
             if not layer.visible:
                 continue
-            for drawable in layer.drawables:
-                if rect is None or rect is not None and drawable.intersects(rect):
-                    drawables.append( drawable )
+            drawables.extend(layer.get_drawables(rect))
         return drawables
 
     def get_hotspots(self, pos:QPoint):
+        if self.compare is not None:
+            # the layers are hidden, see mousePressEvent
+            return []
         rect:QRect =QRect(pos.x()-50,pos.y()-50,100,100)
         hotspots:List[Tuple[HotspotClasses,QPoint,HotspotHandler]] = []
         for drawable in self.get_drawables(rect):
@@ -219,6 +301,8 @@ class DrawingManager(QWidget):
         return hotspots
 
     def get_snap_points(self, pos:QPoint) -> List[Tuple[HotspotClasses,QPoint]]:
+        if self.compare is not None:
+            return []
         snap_points:List[Tuple[HotspotClasses,QPoint]] = []
         rect:QRect =QRect(pos.x()-50,pos.y()-50,100,100)
         p = pos
@@ -2,24 +2,28 @@ import csv
 import os
 
 import ezdxf
-from PySide6.QtCore import QPoint
-from PySide6.QtGui import QFontDatabase, Qt, QColor
+from PySide6.QtCore import Signal
+from PySide6.QtGui import QFontDatabase, Qt
 from PySide6.QtWidgets import QMainWindow, QSpinBox, QPushButton, QVBoxLayout, QSizePolicy, QHBoxLayout, QCheckBox, \
-    QLabel, QSpacerItem, QWidget
-from ezdxf.sections.table import LayerTable
+    QLabel, QSpacerItem, QWidget, QProgressBar
 
 from pycad.ComponentGitVersioningPanel import GitVersioningPanel
-from pycad.ComponentLayers import LayerManager, LayerModel
+from pycad.ComponentLayers import LayerManager
 from pycad.ComponentPluginManager import PluginManagerDialog
 from pycad.ComponentsDrawingManager import DrawingManager
 from pycad.DrawableDimensionImpl import Dimension
 from pycad.DrawableLineImpl import Line
 from pycad.DrawableTextImpl import Text
-from pycad.constants import dxf_app_id, linetypes, lwindex, lwrindex
-from pycad.util_drawable import qcolor_to_dxf_color, get_true_color
+from pycad.util_autosave import AutosaveScheduler
+from pycad.util_dxf import canonical_snapshot, snapshot_layers, write_dxf, read_layers
+from pycad.util_dxf_stream import DxfStreamLoader
+from pycad.util_git import drawing_repository
+from pycad.util_snapshot import detach_snapshot, read_native_snapshot, snapshot_path, write_native_snapshot
+from pycad.util_journal import Journal, journal_path, read_journal, base_matches, replay
 
 
 class MainWindow(QMainWindow):
+    loaded = Signal(bool)  # emitted when load_dxf_async ends, False when it was cancelled or failed
     # Define a light theme stylesheet
     light_theme = """
         * {
@@ -50,6 +54,18 @@ class MainWindow(QMainWindow):
         self.drawing_manager = DrawingManager(file)
         self.drawing_manager.setStyleSheet(self.dark_theme)
         self.drawing_manager.changed.connect(self.on_model_changed)
+        self.journal = Journal(journal_path(file), lambda: self.drawing_manager.layers)
+        # set by start_journal, a new drawing has no file yet and its journal begins with the first autosave
+        self.journal_started = False
+        self.autosave = AutosaveScheduler(temp, self.take_snapshot, self.write_snapshot, delay=1000, parent=self)
+        # the temp file is only read back by load_dxf, its dimensions can do without their block
+        self.autosave_renders_dimensions = False
+        # "asc" or "bin", the format save_dxf and the autosave write
+        self.save_format = "asc"
+        self.autosave_format = "asc"
+        # save_dxf writes the drawing in canonical order and handles, commits of it stay small
+        self.canonical_save = True
+        self.autosave.saved.connect(self.on_autosaved)
 
         self.layer_manager = LayerManager(self.drawing_manager, filename=file)
         self.layer_manager.setMaximumWidth(720)
@@ -61,8 +77,12 @@ class MainWindow(QMainWindow):
         self.layer_manager.setStyleSheet(self.light_theme)
         self.layer_manager.show()  # Show the layer manager as a non-blocking modal
 
-        self.versioning_panel = GitVersioningPanel(".git", filename=file)
+        self.versioning_panel = GitVersioningPanel(drawing_repository(file), filename=file)
+        self.versioning_panel.drawing_writer = self.drawing_writer
+        self.versioning_panel.reverting.connect(self.release_drawing)
+        self.versioning_panel.reverted.connect(self.reload_drawing)
         self.versioning_panel.closed.connect(self.on_versioning_panel_closed)
+        self.versioning_panel.compared.connect(self.drawing_manager.set_compare)
         self.versioning_panel.show()
 
         self.plugin_manager_panel = PluginManagerDialog(self, filename=file)
@@ -72,9 +92,15 @@ class MainWindow(QMainWindow):
         self.line_mode_button: QPushButton = None
         self.dimension_mode_button: QPushButton = None
         self.text_mode_button: QPushButton = None
+        self.load_progress: QProgressBar = None
+        self.cancel_load_button: QPushButton = None
+        self.loader: DxfStreamLoader = None
+        self.loading_layers = {}
+        self.loading_autocut = False
+        # False while a load runs and after one was cancelled, the drawing is then not saved over the file
+        self.load_complete = True
 
         self.init_ui()
-        self.load_dxf(file)
         self.setWindowTitle(f"PyCAD 24 - {self.dxf_file}")
 
     def on_grid_snap_changed(self, checked):
@@ -100,12 +126,83 @@ class MainWindow(QMainWindow):
     def on_layers_changed(self, layers):
         # print("layers changed", flush=True)
         # print(f"{layers}", flush=True)
-        self.save_dxf(self.temp_file)
+        self.drawing_manager.update()
+        self.journal.layers_changed()
+        self.autosave.schedule()
+        self.versioning_panel.mark_edited()
 
     def on_model_changed(self, model):
         # print("model changed", flush=True)
         # print(f"{model}", flush=True)
+        self.autosave.schedule()
+        self.versioning_panel.mark_edited()
+
+    def take_snapshot(self):
+        return self.journal.checkpoint(), snapshot_layers(self.drawing_manager.layers)
+
+    def write_snapshot(self, snapshot, filename):
+        # runs on the autosave thread
+        checkpoint, layers = snapshot
+        write_dxf(layers, filename, render_dimensions=self.autosave_renders_dimensions, fmt=self.autosave_format)
+        return checkpoint, os.stat(filename)
+
+    def on_autosaved(self, filename, result):
+        checkpoint, stat = result
+        if self.journal_started and not self.journal.active:
+            # the first autosave of a new drawing is the base, the edits from here on are recorded
+            self.journal.begin(filename)
+        else:
+            self.journal.compact(filename, stat, checkpoint)
+        self.statusBar().showMessage(f"autosaved to {filename}")
+
+    def start_journal(self):
+        # records the edits from now on, over the autosaved temp file if there is one
+        self.journal_started = True
+        base = self.temp_file if os.path.exists(self.temp_file) else self.dxf_file
+        if os.path.exists(base):
+            self.journal.begin(base)
+
+    def release_drawing(self):
+        """
+        Before the drawing is replaced under the window (a revert): no autosave pending,
+        the journal and the temp file of this session gone, the snapshot no longer mapped.
+        """
+        self.autosave.timer.stop()
+        self.autosave.wait()
+        self.journal.close()
+        detach_snapshot(self.drawing_manager.layers)
+        if os.path.exists(self.temp_file):
+            os.unlink(self.temp_file)
+
+    def reload_drawing(self):
+        # after release_drawing, the journal starts again once loaded is emitted (see main.py)
+        if not self.load_snapshot(self.dxf_file):
+            self.load_dxf_async(self.dxf_file)
+
+    def replay_journal(self) -> bool:
+        """
+        Brings back the edits of a session that did not close: loads the file the journal
+        was started over and replays its records. The recovered drawing is written to the
+        temp file at once. A journal that does not match its file is set aside as .stale.
+        """
+        path = self.journal.path
+        records = read_journal(path)
+        if not records or records[0].get("op") != "begin" or not base_matches(records[0]):
+            print(f"journal {path} does not match its drawing, moved to {path}.stale", flush=True)
+            os.replace(path, f"{path}.stale")
+            return False
+        base = records[0]["base"]
+        if os.path.abspath(base) != os.path.abspath(self.dxf_file):
+            self.load_dxf(base)
+        self.drawing_manager.set_layers(replay(records, self.drawing_manager.layers))
+        self.layer_manager.update_layer_list()
+        self.drawing_manager.update()
         self.save_dxf(self.temp_file)
+        self.versioning_panel.mark_edited()
+        if os.path.abspath(base) not in (os.path.abspath(self.dxf_file), os.path.abspath(self.temp_file)):
+            os.unlink(base)
+        print(f"replayed {len(records)} journal records from {path}", flush=True)
+        return True
 
     def on_layer_manager_closed(self, value):
         self.layout_man_button.setChecked(False)
@@ -209,6 +306,14 @@ class MainWindow(QMainWindow):
         self.setCentralWidget(container)
         # Add status bar
         self.statusBar().showMessage("Status: Ready")
+        self.load_progress = QProgressBar()
+        self.load_progress.setMaximumWidth(200)
+        self.load_progress.hide()
+        self.statusBar().addPermanentWidget(self.load_progress)
+        self.cancel_load_button = QPushButton("Cancel loading")
+        self.cancel_load_button.clicked.connect(self.cancel_load)
+        self.cancel_load_button.hide()
+        self.statusBar().addPermanentWidget(self.cancel_load_button)
 
         self.layer_manager.update_layer_list()
         self.layer_manager.layer_list.setCurrentRow(0)
@@ -248,99 +353,134 @@ class MainWindow(QMainWindow):
         self.plugin_manager_panel.show()
 
     def closeEvent(self, event):
-        self.save_dxf(self.dxf_file)
-        self.layer_manager.close()
+        if self.loader is not None:
+            self.loader.requestInterruption()
+            self.loader.wait()
+            self.loader = None
+        self.autosave.shutdown()
+        # a commit running writes the drawing too, it is done before the drawing is saved
         self.versioning_panel.close()
+        if self.load_complete:
+            self.save_dxf(self.dxf_file)
+        else:
+            print(f"{self.dxf_file} was not loaded completely, it is left as it was", flush=True)
+        self.journal.close()
+        self.layer_manager.close()
         event.accept()
-        os.unlink(self.temp_file)
+        if os.path.exists(self.temp_file):
+            os.unlink(self.temp_file)
 
-    def load_dxf(self, filename):
-        self.drawing_manager.layers = []
-        self.layer_manager.layers = []
+    def load_dxf(self, filename, autocut: bool = False):
+        # auto-cut layers are only rescanned when autocut is set, drawings saved here are already cut
         doc = ezdxf.readfile(filename)
-        doc_layers: LayerTable = doc.layers
-        for dxf_layer in doc_layers:
-            color = QColor(get_true_color(dxf_layer))
-            width0 = dxf_layer.dxf.lineweight if dxf_layer.dxf.hasattr('lineweight') else 1
-            width = lwrindex[width0] if width0 >= 0 else lwrindex[5]
-            linetype = dxf_layer.dxf.get('linetype', 'Continuous')
-            # print(f"layer {dxf_layer.dxf.name} has linetype {linetype}", flush=True)
-
-            layer = LayerModel(name=dxf_layer.dxf.name, color=color, width=width,
-                               visible=True)
-            layer.linetype = dxf_layer.dxf.get('linetype', 'Continuous')
-            # Read XDATA
-            if dxf_layer.has_xdata(dxf_app_id):
-                xdata = dxf_layer.get_xdata(dxf_app_id)
-                for code, value in xdata:
-                    if code == 1000 and value == "autocut":
-                        # print(f"Layer {layer.name} has autocut set to: {value}", flush=True)
-                        pass
-                    if code == 1070:
-                        # print(f"Layer {layer.name} integer value to: {value}", flush=True)
-                        layer.flAutoCut = True if value == 1 else False
-                    else:
-                        layer.flAutoCut = False
-
-            self.layer_manager.layers.append(layer)
-            self.drawing_manager.layers.append(layer)
-
-        for entity in doc.entities:
-            drawable = None
-            if entity.dxftype() == 'LINE':
-                start_point = QPoint(entity.dxf.start.x, entity.dxf.start.y)
-                end_point = QPoint(entity.dxf.end.x, entity.dxf.end.y)
-                color = QColor(entity.dxf.color) if entity.dxf.hasattr('color') else QColor(Qt.black)
-                width = entity.dxf.lineweight if entity.dxf.hasattr('lineweight') else 1
-                drawable = Line(start_point, end_point)
-            elif entity.dxftype() == 'TEXT':
-                drawable = Text.from_dxf(entity)
-            elif entity.dxftype() == 'DIMENSION':
-                drawable = Dimension.from_dxf(entity)
-            layer_name = entity.dxf.layer
-            if drawable:
-                for layer in self.drawing_manager.layers:
-                    if layer is not None and layer.name is not None and layer.name == layer_name:
-                        layer.add_drawable(drawable)
-                        break
+        layers = read_layers(doc, autocut=autocut)
+        self.drawing_manager.set_layers(layers)
+        self.layer_manager.layers = list(layers)
 
         self.layer_manager.current_layer_index = 0
         self.drawing_manager.update()
         self.layer_manager.update_layer_list()
 
-    def save_dxf(self, filename):
+    def load_snapshot(self, filename) -> bool:
+        # the layers from the native snapshot next to filename, False when it is missing or stale
+        layers = read_native_snapshot(snapshot_path(filename), filename)
+        if layers is None:
+            return False
+        self.drawing_manager.set_layers(layers)
+        self.layer_manager.layers = list(layers)
+        self.layer_manager.current_layer_index = 0
+        self.drawing_manager.update()
+        self.layer_manager.update_layer_list()
+        self.load_complete = True
+        self.statusBar().showMessage(f"loaded {filename} from {snapshot_path(filename)}")
+        self.loaded.emit(True)
+        return True
+
+    def load_dxf_async(self, filename, autocut: bool = False):
+        """
+        Streams the entities of filename, ASCII or binary, into the layers from a worker
+        thread, the canvas repaints after every chunk. loaded is emitted at the end.
+        """
+        if not os.path.exists(filename):
+            self.loaded.emit(True)
+            return
+        self.load_complete = False
+        self.loading_autocut = autocut
+        self.loader = DxfStreamLoader(filename, parent=self)
+        self.loader.layers_read.connect(self.on_layers_read)
+        self.loader.entities_read.connect(self.on_entities_read)
+        self.loader.progress.connect(self.on_load_progress)
+        self.loader.finished_loading.connect(self.on_load_finished)
+        self.load_progress.setValue(0)
+        self.load_progress.show()
+        self.cancel_load_button.show()
+        self.statusBar().showMessage(f"loading {filename}")
+        self.loader.start()
+
+    def cancel_load(self):
+        if self.loader is not None:
+            self.loader.requestInterruption()
+
+    def on_layers_read(self, layers):
+        self.loading_layers = {}
+        for layer in layers:
+            self.loading_layers.setdefault(layer.name, layer)
+        self.drawing_manager.set_layers(layers)
+        self.layer_manager.layers = list(layers)
+        self.layer_manager.current_layer_index = 0
+        self.layer_manager.update_layer_list()
+        self.drawing_manager.update()
 
-        doc: ezdxf.drawing.Drawing = ezdxf.new()
-
-        if not doc.appids.has_entry(dxf_app_id):
-            doc.appids.new(dxf_app_id)
-
-        for linetype in linetypes:
-            if linetype != "Continuous":
-                if not doc.linetypes.has_entry(linetype):
-                    doc.linetypes.new(linetype, dxfattribs={'description': linetype, 'pattern': linetypes[linetype]})
-
-        for index, layer in enumerate(self.drawing_manager.layers):
-            if layer.name != '0' and layer.name != 'Defpoints':
-                dxf_layer = doc.layers.new(
-                    name=layer.name,
-                    dxfattribs={
-                        "true_color": qcolor_to_dxf_color(layer.color),
-                        "lineweight": lwindex[layer.lineweight],
-                        "linetype": layer.linetype,
-                    }
-                )
-                # Add XDATA to the layer
-                xdata = [
-                    (1001, dxf_app_id),
-                    (1000, "autocut"),
-                    (1070, 1 if layer.flAutoCut else 0),
-                ]
-                dxf_layer.set_xdata(dxf_app_id, xdata)
-            for drawable in layer.drawables:
-                drawable.save_to_dxf(doc, layer_name=layer.name)
-
-        doc.saveas(filename)
+    def on_entities_read(self, chunk):
+        if self.loader is None:
+            return
+        for name, (lines, drawables) in chunk.items():
+            self.loading_layers[name].import_entities(lines, drawables, cleanup=False)
+        self.loader.chunk_done()
+        self.drawing_manager.update()
+
+    def on_load_progress(self, done, total):
+        self.load_progress.setValue(int(100 * done / total) if total else 100)
+
+    def on_load_finished(self, completed):
+        if self.loader is None:
+            return
+        filename = self.loader.filename
+        self.loader.wait()
+        self.loader = None
+        for layer in self.loading_layers.values():
+            layer.finish_import(self.loading_autocut)
+        self.loading_layers = {}
+        self.load_complete = completed
+        self.load_progress.hide()
+        self.cancel_load_button.hide()
+        self.drawing_manager.update()
+        self.statusBar().showMessage(f"loaded {filename}" if completed else f"loading {filename} stopped")
+        self.loaded.emit(completed)
+
+    def save_dxf(self, filename):
+        self.write_drawing(self.drawing_snapshot(), filename)
+
+    def drawing_snapshot(self):
+        # a drawing opened from its snapshot still maps it, write_drawing writes over it
+        detach_snapshot(self.drawing_manager.layers)
+        snapshot = snapshot_layers(self.drawing_manager.layers)
+        if self.canonical_save:
+            # the native snapshot in the order of the DXF, as a load of it would give
+            snapshot = canonical_snapshot(snapshot)
+        return snapshot
+
+    def write_drawing(self, snapshot, filename):
+        write_dxf(snapshot, filename, fmt=self.save_format, canonical=self.canonical_save)
+        if os.path.abspath(filename) == os.path.abspath(self.dxf_file):
+            write_native_snapshot(snapshot, snapshot_path(filename), filename)
+
+    def drawing_writer(self):
+        # for the versioning panel: the drawing is snapshotted here and written by the commit thread
+        if not self.load_complete:
+            return None
+        snapshot = self.drawing_snapshot()
+        return lambda: self.write_drawing(snapshot, self.dxf_file)
 
     def save_csv(self, entities, filename):
         with open(filename, mode='w', newline='') as file:
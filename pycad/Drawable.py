@@ -26,6 +26,7 @@ class Drawable(ABC):
     points: List[QPoint] = []
     moving_point: QPoint = None
     max_points: int = 2
+    entity_id: int = None  # set by the layer holding the drawable
 
     def __init__(self, start_point: QPoint, end_point: QPoint = None):
         self.start_point = start_point
@@ -4,14 +4,14 @@ from abc import ABC
 from typing import List, Tuple
 
 from PySide6.QtCore import QPoint, QRect, QPointF
-from PySide6.QtGui import QPainter
+from PySide6.QtGui import QPainter, QTransform
 
 from pycad.Drawable import Drawable, HotspotClasses, HotspotHandler
 from ezdxf.document import Drawing as DXFDrawing
 from ezdxf.document import Modelspace as DXFModelspace
 from ezdxf.entities import Dimension as DXFDimension
-from pycad.util_geometry import line_intersects_rect, line_contains_point, get_text_dimensions, \
-    get_pen_width, set_pen_width, mod
+from pycad.util_geometry import line_intersects_rect, line_contains_point, get_pen_width, set_pen_width, mod
+from pycad.util_text import text_layouts
 
 
 class Dimension(Drawable, ABC):
@@ -21,6 +21,10 @@ class Dimension(Drawable, ABC):
         self.start_point = start_point
         self.end_point = end_point
         self.offset_distance = 25
+        self.cached_layout = None
+        # DXF tags of the last rendering (util_dxf.RenderedDimension), the dict is shared
+        # with the shallow copies saved by autosave so what they render is kept here
+        self.dxf_cache = {}
 
     def isin(self, rect: QRect) -> bool:
         return rect.contains(self.start_point) or rect.contains(self.end_point)
@@ -64,18 +68,33 @@ class Dimension(Drawable, ABC):
         # return math.atan2(self.end_point.y() - self.start_point.y(), self.start_point.x() - self.end_point.x())
         # return math.atan2(self.end_point.y() - self.start_point.y(), self.end_point.x() - self.start_point.x())
 
-    def draw(self, painter: QPainter):
+    def layout(self, painter: QPainter):
+        # offset points, label text, extent and placement, kept until the end points, the offset or the font change
+        font = painter.font()
+        key = (self.start_point.x(), self.start_point.y(), self.end_point.x(), self.end_point.y(),
+               self.offset_distance, font.family(), font.pointSizeF())
+        if self.cached_layout is not None and self.cached_layout[0] == key:
+            return self.cached_layout[1]
         start_point = self.offset_point(self.start_point, self.offset_distance)
         end_point = self.offset_point(self.end_point, self.offset_distance)
         rotation = (self.get_rotation() + math.pi) * 180 / math.pi
         dir = -1 if 90 < rotation <= 270 else 0.5
-        text = f"{self.length():.2f} ({rotation:.2f} [{dir}])"
         text = f"{self.length():.1f}"
-        tw, th = get_text_dimensions(painter, text)
+        label = text_layouts.layout(text, font)
         mid_point = QPoint(
             (start_point.x() + self.end_point.x()) / 2,
             (start_point.y() + self.end_point.y()) / 2,
         )
+        placement = QTransform()
+        placement.translate(mid_point.x(), mid_point.y())
+        placement.rotate(mod(rotation + 90, 180) - 90)
+        placement.translate(-label.width / 2, dir * label.height)
+        layout = (start_point, end_point, text, label, placement)
+        self.cached_layout = (key, layout)
+        return layout
+
+    def draw(self, painter: QPainter):
+        start_point, end_point, text, label, placement = self.layout(painter)
         # Placeholder for drawing dimensions; real implementation may vary
         painter.drawLine(start_point.x(), start_point.y(), end_point.x(), end_point.y())
         painter.drawLine(self.start_point.x(), self.start_point.y(), start_point.x(), start_point.y())
@@ -87,22 +106,26 @@ class Dimension(Drawable, ABC):
         set_pen_width(painter, pw)
 
         painter.save()
-        painter.translate(mid_point.x(), mid_point.y())
-        rotation = mod(rotation + 90, 180) - 90
-        painter.rotate(rotation)
-        # painter.drawText(
-        #     0,
-        #     0,
-        #     "I__I__I",
-        # )
-        painter.translate(-tw / 2, dir * th)
-        painter.drawText(
-            0,
-            0,
-            text,
-        )
+        painter.setTransform(placement, True)
+        painter.drawStaticText(0, -label.ascent, text_layouts.static_text(text, painter.font(), painter.transform()))
         painter.restore()
 
+    def baseline(self) -> Tuple[QPoint, QPoint]:
+        # the dimension line, offset_point applied to both ends at once
+        start_point, end_point = self.start_point, self.end_point
+        dx, dy = end_point.x() - start_point.x(), end_point.y() - start_point.y()
+        length = math.hypot(dx, dy)
+        if length == 0:
+            return QPoint(start_point.x(), start_point.y()), QPoint(end_point.x(), end_point.y())
+        ox, oy = -dy / length * self.offset_distance, dx / length * self.offset_distance
+        return (QPoint(start_point.x() + ox, start_point.y() + oy),
+                QPoint(end_point.x() + ox, end_point.y() + oy))
+
+    def draw_baseline(self, painter: QPainter):
+        # dimension line only, without ticks, extension lines and label
+        start_point, end_point = self.baseline()
+        painter.drawLine(start_point.x(), start_point.y(), end_point.x(), end_point.y())
+
     def length(self):
         return math.hypot(self.start_point.x() - self.end_point.x(), self.start_point.y() - self.end_point.y())
 
@@ -127,7 +150,8 @@ class Dimension(Drawable, ABC):
 
         return QPoint(offsetted.x(), offsetted.y())
 
-    def save_to_dxf(self, dxf_document: DXFDrawing, layer_name: str):
+    def save_to_dxf(self, dxf_document: DXFDrawing, layer_name: str, render: bool = True):
+        # without render only the definition points are stored, the dimension has no block
         msp: DXFModelspace = dxf_document.modelspace()
         p1: QPoint = self.start_point
         p2: QPoint = self.end_point
@@ -142,7 +166,9 @@ class Dimension(Drawable, ABC):
                 'defpoint3': (p2.x(), p2.y()),
             }
         )
-        dim.render()
+        if render:
+            dim.render()
+        return dim
 
     @classmethod
     def from_dxf(cls, entity_data: DXFDimension):
@@ -0,0 +1,243 @@
+from typing import Iterator, List, Tuple
+
+import numpy as np
+from PySide6.QtCore import QPoint
+
+from pycad.DrawableLineImpl import Line
+from pycad.util_spatial import encode_cells
+
+Columns = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+
+
+class LineStore:
+    """
+    Columnar storage for the Line entities of a layer: float64 x1, y1, x2, y2 and an
+    int64 entity id per row, about 41 bytes a segment. Rows are kept in increasing id
+    order, removed rows are masked and dropped on the next compaction, so an id is
+    found with a binary search and the store iterates in insertion order.
+    """
+
+    def __init__(self, capacity: int = 256):
+        self.ids = np.empty(capacity, dtype=np.int64)
+        self.x1 = np.empty(capacity)
+        self.y1 = np.empty(capacity)
+        self.x2 = np.empty(capacity)
+        self.y2 = np.empty(capacity)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.size = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    @classmethod
+    def from_columns(cls, ids: np.ndarray, x1: np.ndarray, y1: np.ndarray, x2: np.ndarray,
+                     y2: np.ndarray) -> 'LineStore':
+        # takes the columns as they are, the next extend copies them into larger ones
+        store = cls(0)
+        store.ids, store.x1, store.y1, store.x2, store.y2 = ids, x1, y1, x2, y2
+        store.alive = np.ones(len(ids), dtype=bool)
+        store.size = store.count = len(ids)
+        return store
+
+    def reserve(self, capacity: int):
+        if capacity <= len(self.ids):
+            return
+        capacity = max(capacity, 2 * len(self.ids))
+        for name in ('ids', 'x1', 'y1', 'x2', 'y2', 'alive'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def append(self, entity_id: int, x1: float, y1: float, x2: float, y2: float):
+        self.extend(np.array([entity_id]), np.array([x1]), np.array([y1]), np.array([x2]), np.array([y2]))
+
+    def extend(self, ids: np.ndarray, x1: np.ndarray, y1: np.ndarray, x2: np.ndarray, y2: np.ndarray):
+        # ids must be larger than any id already in the store
+        n = len(ids)
+        self.reserve(self.size + n)
+        rows = slice(self.size, self.size + n)
+        self.ids[rows] = ids
+        self.x1[rows] = x1
+        self.y1[rows] = y1
+        self.x2[rows] = x2
+        self.y2[rows] = y2
+        self.alive[rows] = True
+        self.size += n
+        self.count += n
+
+    def row_of(self, entity_id: int) -> int:
+        row = int(np.searchsorted(self.ids[:self.size], entity_id))
+        if row < self.size and self.ids[row] == entity_id and self.alive[row]:
+            return row
+        return -1
+
+    def live_row(self, entity_id: int) -> int:
+        # row_of for a line that has to be there, a removed one is a stale LineView
+        row = self.row_of(entity_id)
+        if row < 0:
+            raise KeyError(f"line {entity_id} is not in the store, it was removed")
+        return row
+
+    def rows_of(self, ids: np.ndarray) -> np.ndarray:
+        # rows of the ids that are in the store, other ids are dropped
+        ids = np.asarray(ids, dtype=np.int64)
+        rows = np.searchsorted(self.ids[:self.size], ids)
+        inside = rows < self.size
+        rows = rows[inside]
+        rows = rows[self.ids[rows] == ids[inside]]
+        return rows[self.alive[rows]]
+
+    def __contains__(self, entity_id: int):
+        return self.row_of(entity_id) >= 0
+
+    def remove(self, entity_id: int):
+        self.remove_many(np.array([entity_id], dtype=np.int64))
+
+    def remove_many(self, ids: np.ndarray):
+        rows = self.rows_of(ids)
+        self.alive[rows] = False
+        self.count -= len(rows)
+        if self.size - self.count > max(1024, self.size // 2):
+            self.compact()
+
+    def compact(self):
+        rows = self.live_rows()
+        for name in ('ids', 'x1', 'y1', 'x2', 'y2'):
+            column = getattr(self, name)
+            column[:len(rows)] = column[rows]
+        self.alive[:len(rows)] = True
+        self.alive[len(rows):] = False
+        self.size = self.count = len(rows)
+
+    def set_points(self, entity_id: int, x1: float, y1: float, x2: float, y2: float):
+        row = self.live_row(entity_id)
+        self.x1[row], self.y1[row], self.x2[row], self.y2[row] = x1, y1, x2, y2
+
+    def live_rows(self) -> np.ndarray:
+        return np.flatnonzero(self.alive[:self.size])
+
+    def columns(self, rows: np.ndarray = None) -> Columns:
+        """ids, x1, y1, x2, y2 of the live rows (or of the given rows), views when nothing was removed"""
+        if rows is None:
+            if self.count == self.size:
+                rows = slice(0, self.size)
+            else:
+                rows = self.live_rows()
+        return self.ids[rows], self.x1[rows], self.y1[rows], self.x2[rows], self.y2[rows]
+
+    def lengths(self, rows: np.ndarray = None) -> np.ndarray:
+        ids, x1, y1, x2, y2 = self.columns(rows)
+        return np.hypot(x1 - x2, y1 - y2)
+
+    def short_ids(self, threshold: float = 1.0) -> np.ndarray:
+        # vectorized Line.is_empty
+        ids = self.columns()[0]
+        return ids[self.lengths() < threshold]
+
+    def duplicate_ids(self, tolerance: float) -> np.ndarray:
+        """
+        ids of the lines equal to an earlier kept line the way Line.__eq__ and
+        find_duplicate see it: both endpoints within tolerance on each axis, in either
+        direction. Every line goes in twice, once per direction, sorted by the exact key
+        of the tolerance sized cell of its first point, so the matches are found with
+        binary searches in the cells around a line's start and checked on the
+        coordinates. A line only removes the later ones when it is kept itself, as when
+        the lines are added one by one.
+        """
+        ids, x1, y1, x2, y2 = self.columns()
+        n = len(ids)
+        # past twice the tolerance the points matching one are in 2 x 2 cells at most, mostly in one
+        cell = 4 * tolerance if tolerance > 0 else 1.0
+        sx, sy, ex, ey = np.concatenate((x1, x2)), np.concatenate((y1, y2)), np.concatenate((x2, x1)), \
+            np.concatenate((y2, y1))
+        keys = encode_cells(np.floor(sx / cell), np.floor(sy / cell))
+        order = np.argsort(keys)
+        keys = keys[order]
+        # the lines in the same order, so the binary searches run over nearly sorted needles
+        lines = order[order < n]
+        low_x, high_x = np.floor((x1[lines] - tolerance) / cell), np.floor((x1[lines] + tolerance) / cell)
+        low_y, high_y = np.floor((y1[lines] - tolerance) / cell), np.floor((y1[lines] + tolerance) / cell)
+        earlier, later = [], []
+        for column, near in ((low_x, slice(None)), (high_x, high_x > low_x)):
+            # cells (column, low_y) and (column, high_y) are one run of keys
+            lo = np.searchsorted(keys, encode_cells(column[near], low_y[near]), 'left')
+            hi = np.searchsorted(keys, encode_cells(column[near], high_y[near]), 'right')
+            counts = hi - lo
+            j = np.repeat(lines[near], counts)
+            rows = order[np.repeat(lo - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())]
+            i = rows % n
+            match = (i < j) & (np.abs(sx[rows] - x1[j]) <= tolerance) & (np.abs(sy[rows] - y1[j]) <= tolerance) & \
+                (np.abs(ex[rows] - x2[j]) <= tolerance) & (np.abs(ey[rows] - y2[j]) <= tolerance)
+            earlier.append(i[match])
+            later.append(j[match])
+        earlier, later = np.concatenate(earlier), np.concatenate(later)
+        removed = np.zeros(n, dtype=bool)
+        # a match with a line that has no earlier match of its own removes, the chains go in order
+        chained = np.isin(earlier, later)
+        removed[later[~chained]] = True
+        pairs = np.lexsort((earlier[chained], later[chained]))
+        for i, j in zip(earlier[chained][pairs].tolist(), later[chained][pairs].tolist()):
+            if not removed[i]:
+                removed[j] = True
+        return ids[removed]
+
+    def bounds(self):
+        if self.count == 0:
+            return None
+        ids, x1, y1, x2, y2 = self.columns()
+        return (float(min(x1.min(), x2.min())), float(min(y1.min(), y2.min())),
+                float(max(x1.max(), x2.max())), float(max(y1.max(), y2.max())))
+
+    def hit_test(self, x: float, y: float, margin: float = 5, rows: np.ndarray = None) -> np.ndarray:
+        """ids of the lines passing within margin of (x, y), vectorized line_contains_point"""
+        ids, x1, y1, x2, y2 = self.columns(rows)
+        inside = (np.minimum(x1, x2) - margin <= x) & (x <= np.maximum(x1, x2) + margin) & \
+                 (np.minimum(y1, y2) - margin <= y) & (y <= np.maximum(y1, y2) + margin)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dist = np.abs((y2 - y1) * x - (x2 - x1) * y + x2 * y1 - y2 * x1) / np.hypot(y2 - y1, x2 - x1)
+        return ids[inside & (dist <= margin)]
+
+    def view(self, entity_id: int) -> 'LineView':
+        return LineView(self, entity_id)
+
+    def items(self) -> Iterator[Tuple[int, 'LineView']]:
+        for entity_id in self.columns()[0].tolist():
+            yield entity_id, LineView(self, entity_id)
+
+    def views(self) -> List['LineView']:
+        return [view for entity_id, view in self.items()]
+
+
+class LineView(Line):
+    """
+    Line backed by a row of a LineStore, for the code that works on Line objects.
+    Reading or setting its points goes to the store; the owning layer has to be told
+    with update_drawable so its index follows. Once the line is removed the view raises
+    KeyError.
+    """
+
+    def __init__(self, store: LineStore, entity_id: int):
+        self.store = store
+        self.entity_id = entity_id
+
+    @property
+    def start_point(self) -> QPoint:
+        row = self.store.live_row(self.entity_id)
+        return QPoint(self.store.x1[row], self.store.y1[row])
+
+    @start_point.setter
+    def start_point(self, value: QPoint):
+        row = self.store.live_row(self.entity_id)
+        self.store.x1[row], self.store.y1[row] = value.x(), value.y()
+
+    @property
+    def end_point(self) -> QPoint:
+        row = self.store.live_row(self.entity_id)
+        return QPoint(self.store.x2[row], self.store.y2[row])
+
+    @end_point.setter
+    def end_point(self, value: QPoint):
+        row = self.store.live_row(self.entity_id)
+        self.store.x2[row], self.store.y2[row] = value.x(), value.y()
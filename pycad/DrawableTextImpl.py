@@ -2,11 +2,12 @@ import math
 from abc import ABC
 from typing import List, Tuple
 
-from PySide6.QtCore import QPoint, QRect
-from PySide6.QtGui import QPainter
+from PySide6.QtCore import QPoint, QRect, QRectF
+from PySide6.QtGui import QPainter, QTransform
 
 from pycad.Drawable import Drawable, HotspotClasses, HotspotHandler
 from pycad.util_geometry import line_intersects_rect, line_contains_point, _points_equal
+from pycad.util_text import text_layouts
 from ezdxf.document import Drawing as DXFDrawing
 from ezdxf.document import Modelspace as DXFModelspace
 from ezdxf.entities import Text as DXFText
@@ -21,6 +22,7 @@ class Text(Drawable, ABC):
         self.end_point = end_point
         self.text = text
         self.height = height
+        self.cached_placement = None
 
     def isin(self,rect:QRect) -> bool:
         return rect.contains(self.start_point) or rect.contains(self.end_point)
@@ -67,28 +69,49 @@ class Text(Drawable, ABC):
     def is_empty(self, threshold=1.0) -> bool:
         return False
 
-    def draw(self, painter: QPainter):
-        start_point = self.start_point
+    def placement(self) -> QTransform:
+        # translation and rotation of the text, kept until the end points change
+        key = (self.start_point.x(), self.start_point.y(), self.end_point.x(), self.end_point.y())
+        if self.cached_placement is not None and self.cached_placement[0] == key:
+            return self.cached_placement[1]
         rotation_deg = (self.get_rotation() + math.pi) * 180 / math.pi
-        text = f"{self.text} ({rotation_deg:.2f})"
-        text = f"{self.text}"
+        placement = QTransform()
+        placement.translate(self.start_point.x(), self.start_point.y())
+        placement.rotate(rotation_deg)
+        self.cached_placement = (key, placement)
+        return placement
 
+    def draw(self, painter: QPainter):
+        font = painter.font()
+        layout = text_layouts.layout(self.text, font)
         painter.save()
-        painter.translate(start_point.x(), start_point.y())
+        painter.setTransform(self.placement(), True)
+        painter.drawStaticText(0, -layout.ascent, text_layouts.static_text(self.text, font, painter.transform()))
+        painter.restore()
+
+    def draw_outline(self, painter: QPainter):
+        # box the text would take, estimated from the font metrics without laying it out
+        metrics = painter.fontMetrics()
+        rotation_deg = (self.get_rotation() + math.pi) * 180 / math.pi
+        painter.save()
+        painter.translate(self.start_point.x(), self.start_point.y())
         painter.rotate(rotation_deg)
-        painter.drawText(0, 0, text)
+        painter.drawRect(QRectF(0, -metrics.ascent(), len(self.text) * metrics.averageCharWidth(), metrics.height()))
         painter.restore()
 
     def length(self):
         return math.hypot(self.start_point.x() - self.end_point.x(), self.start_point.y() - self.end_point.y())
 
+    def dxf_rotation(self) -> float:
+        return (self.get_rotation() + math.pi) * 180 / math.pi
+
     def save_to_dxf(self, dxf_document: DXFDrawing, layer_name: str):
         msp: DXFModelspace = dxf_document.modelspace()
         text_entity: DXFText = msp.add_text(
             self.text,
             dxfattribs={
                 'height': self.height,
-                'rotation': (self.get_rotation() + math.pi) * 180 / math.pi,
+                'rotation': self.dxf_rotation(),
                 'width': self.length(),
                 'layer': layer_name,
             }
@@ -103,13 +126,17 @@ class Text(Drawable, ABC):
 
     @classmethod
     def from_dxf(cls, entity_data: DXFText):
-        width = entity_data.dxf.get("width", 25)
-        rotation = entity_data.dxf.get("rotation", 0)
-        p1 = QPoint(entity_data.dxf.insert.x, entity_data.dxf.insert.y)
+        return cls.from_placement(entity_data.dxf.insert.x, entity_data.dxf.insert.y, entity_data.dxf.height,
+                                  entity_data.dxf.text, entity_data.dxf.get("width", 25),
+                                  entity_data.dxf.get("rotation", 0))
+
+    @classmethod
+    def from_placement(cls, x: float, y: float, height: float, text: str, width: float = 25, rotation: float = 0):
+        p1 = QPoint(x, y)
         a = rotation * math.pi / 180
         dp = QPoint(width * math.cos(a), width * math.sin(a))
         p2 = QPoint(p1.x() + dp.x(), p1.y() + dp.y(), )
-        text_instance = cls(p1, p2, entity_data.dxf.height)
-        text_instance.text = entity_data.dxf.text
+        text_instance = cls(p1, p2, height)
+        text_instance.text = text
         return text_instance
 
@@ -0,0 +1,190 @@
+import argparse
+import csv
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, NamedTuple, Optional, Tuple
+
+from pycad.DrawableTextImpl import Text
+from pycad.util_dxf import snapshot_layers, write_dxf
+from pycad.util_dxf_stream import read_dxf_layers
+from pycad.util_snapshot import read_native_snapshot, snapshot_path
+
+RENDER_FORMATS = ("png", "jpg", "svg", "pdf")
+RENDER_FIELDS = ["file", "output", "status", "error", "width", "height", "files", "load_s", "render_s", "total_s"]
+REPORT_FIELDS = ["file", "output", "status", "error", "layers", "lines_read", "lines_saved", "texts", "dimensions",
+                 "load_s", "cleanup_s", "save_s", "total_s"]
+
+
+class BatchJob(NamedTuple):
+    source: str
+    target: str
+    autocut: bool
+    autocut_all: bool
+    fmt: str
+    canonical: bool
+
+
+def process_file(job: BatchJob) -> dict:
+    """
+    Runs in a pool process: loads the DXF, runs the cleanup of LayerModel.finish_import
+    on every layer (auto-cut, short lines, duplicates) and saves it like
+    MainWindow.save_dxf does. Errors go to the report row instead of the pool.
+    """
+    row = {"file": job.source, "output": job.target, "status": "ok", "error": ""}
+    start = time.perf_counter()
+    try:
+        layers = read_dxf_layers(job.source, cleanup=False)
+        loaded = time.perf_counter()
+        row["layers"] = len(layers)
+        row["lines_read"] = sum(len(layer.lines) for layer in layers)
+        for layer in layers:
+            if job.autocut_all:
+                layer.flAutoCut = True
+            layer.finish_import(job.autocut)
+        cleaned = time.perf_counter()
+        directory = os.path.dirname(job.target)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        write_dxf(snapshot_layers(layers), job.target, fmt=job.fmt, canonical=job.canonical)
+        saved = time.perf_counter()
+        row["lines_saved"] = sum(len(layer.lines) for layer in layers)
+        row["texts"] = sum(1 for layer in layers for drawable in layer.entities.values() if isinstance(drawable, Text))
+        row["dimensions"] = sum(len(layer.entities) for layer in layers) - row["texts"]
+        row.update(load_s=round(loaded - start, 4), cleanup_s=round(cleaned - loaded, 4),
+                   save_s=round(saved - cleaned, 4))
+    except Exception as e:
+        row.update(status="failed", error=f"{type(e).__name__}: {e}")
+    row["total_s"] = round(time.perf_counter() - start, 4)
+    return row
+
+
+def collect_jobs(inputs: List[str], output_dir: str, autocut: bool, autocut_all: bool, fmt: str,
+                 canonical: bool) -> List[BatchJob]:
+    # files as given and the .dxf files under directories, kept at their relative path in output_dir
+    sources = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                sources += [(os.path.join(root, name), os.path.relpath(os.path.join(root, name), path))
+                            for name in sorted(names) if name.lower().endswith(".dxf")]
+        else:
+            sources.append((path, os.path.basename(path)))
+    return [BatchJob(source, os.path.join(output_dir, relative) if output_dir else source, autocut, autocut_all, fmt,
+                     canonical) for source, relative in sources]
+
+
+def run_pool(worker, jobs: list, processes: int, report: str, fields: List[str], describe) -> int:
+    # one job per pool task, progress as they finish, the rows in job order in the CSV report
+    rows = [None] * len(jobs)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, processes)) as executor:
+        futures = {executor.submit(worker, job): number for number, job in enumerate(jobs)}
+        for done, future in enumerate(as_completed(futures), 1):
+            row = rows[futures[future]] = future.result()
+            detail = row["error"] if row["status"] != "ok" else describe(row)
+            print(f"[{done}/{len(jobs)}] {row['file']}: {row['status']} {row['total_s']:.2f}s {detail}", flush=True)
+
+    with open(report, mode="w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+    failed = sum(1 for row in rows if row["status"] != "ok")
+    print(f"{len(jobs)} files in {time.perf_counter() - start:.2f}s, {failed} failed, report in {report}",
+          flush=True)
+    return 1 if failed else 0
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="pycad --batch",
+        description="Cleans up DXF files without the GUI: auto-cut, short lines, duplicates, then saves them.")
+    parser.add_argument("inputs", nargs="+", help="DXF files or directories searched for .dxf files")
+    parser.add_argument("-o", "--output-dir", help="where the cleaned files go, the inputs are overwritten without it")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("-r", "--report", default="pycad_report.csv", help="CSV report, one row per file")
+    parser.add_argument("--format", choices=("asc", "bin"), default="asc", help="DXF format to save")
+    parser.add_argument("--no-autocut", action="store_true", help="skip the auto-cut of auto-cut layers")
+    parser.add_argument("--autocut-all", action="store_true", help="auto-cut every layer, not only auto-cut layers")
+    parser.add_argument("--canonical", action="store_true",
+                        help="save in canonical order with content handles, for a small diff in git")
+    args = parser.parse_args(argv)
+
+    jobs = collect_jobs(args.inputs, args.output_dir, not args.no_autocut, args.autocut_all, args.format,
+                        args.canonical)
+    if not jobs:
+        print("no DXF files found", flush=True)
+        return 1
+    return run_pool(process_file, jobs, args.jobs, args.report, REPORT_FIELDS,
+                    lambda row: f"{row['lines_read']} -> {row['lines_saved']} lines")
+
+
+class RenderJob(NamedTuple):
+    source: str
+    target: str
+    extent: Optional[Tuple[float, float, float, float]]
+    scale: Optional[float]
+    size: Optional[Tuple[int, int]]
+    tile_size: int
+
+
+def render_file(job: RenderJob) -> dict:
+    """
+    Runs in a pool process: loads the drawing, from its native snapshot when that is
+    current, and renders it with util_render.SheetRenderer in the format of the target
+    extension. Errors go to the report row instead of the pool.
+    """
+    from pycad.util_render import SheetRenderer, SheetView, ensure_gui_application
+    row = {"file": job.source, "output": job.target, "status": "ok", "error": ""}
+    start = time.perf_counter()
+    try:
+        ensure_gui_application()
+        layers = read_native_snapshot(snapshot_path(job.source), job.source)
+        if layers is None:
+            layers = read_dxf_layers(job.source, cleanup=False)
+        loaded = time.perf_counter()
+        view = SheetView.fit(layers, extent=job.extent, scale=job.scale, size=job.size)
+        directory = os.path.dirname(job.target)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        files = SheetRenderer().render(layers, view, job.target, tile_size=job.tile_size)
+        row.update(width=view.width, height=view.height, files=len(files), load_s=round(loaded - start, 4),
+                   render_s=round(time.perf_counter() - loaded, 4))
+    except Exception as e:
+        row.update(status="failed", error=f"{type(e).__name__}: {e}")
+    row["total_s"] = round(time.perf_counter() - start, 4)
+    return row
+
+
+def render_main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="pycad --render",
+        description="Renders DXF files without the GUI to PNG, JPG, SVG or PDF with the pens of the canvas.")
+    parser.add_argument("inputs", nargs="+", help="DXF files or directories searched for .dxf files")
+    parser.add_argument("-o", "--output-dir", help="where the renders go, next to the inputs without it")
+    parser.add_argument("-f", "--format", choices=RENDER_FORMATS, default="png", help="output format")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("-r", "--report", default="pycad_render.csv", help="CSV report, one row per file")
+    parser.add_argument("--scale", type=float, help="pixels per drawing unit, instead of --size")
+    parser.add_argument("--size", type=int, nargs=2, metavar=("WIDTH", "HEIGHT"),
+                        help="fit the extent in WIDTH x HEIGHT pixels, 1024 x 1024 by default")
+    parser.add_argument("--extent", type=float, nargs=4, metavar=("X1", "Y1", "X2", "Y2"),
+                        help="drawing area to render, the bounds of the visible layers by default")
+    parser.add_argument("--tile-size", type=int, default=4096,
+                        help="larger images are written as tiles of this size, one at a time")
+    args = parser.parse_args(argv)
+
+    jobs = [RenderJob(job.source, f"{os.path.splitext(job.target)[0]}.{args.format}",
+                      tuple(args.extent) if args.extent else None, args.scale,
+                      tuple(args.size) if args.size else None, args.tile_size)
+            for job in collect_jobs(args.inputs, args.output_dir, False, False, "asc", False)]
+    if not jobs:
+        print("no DXF files found", flush=True)
+        return 1
+    return run_pool(render_file, jobs, args.jobs, args.report, RENDER_FIELDS,
+                    lambda row: f"{row['width']}x{row['height']} in {row['files']} files")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,20 +1,43 @@
+import os
 import sys
 import time
 from PySide6.QtWidgets import (
     QApplication
 )
 
-from pycad.ComponentGitVersioningPanel import GitVersioningPanel
 from pycad.ComponentsMainWindow import MainWindow
+from pycad.cli import main as batch_main, render_main
+from pycad.util_journal import journal_path
 
 
-if __name__ == '__main__':
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--batch":
+        # headless, see pycad/cli.py
+        sys.exit(batch_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "--render":
+        sys.exit(render_main(sys.argv[2:]))
     app = QApplication(sys.argv)
     timestamp = time.strftime("%Y%m%d-%H%M%S")
     default_file = f"drawing_{timestamp}.dxf"
     file_path = sys.argv[1] if len(sys.argv) > 1 else default_file
     temp_file = f"temp_{timestamp}_{file_path}"
-    repo_path = f"{file_path}.git"
     window = MainWindow(file_path, temp_file)
+
+    def on_loaded(completed):
+        if not completed:
+            return
+        if os.path.exists(journal_path(file_path)):
+            # the last session on this drawing did not close
+            window.replay_journal()
+        window.start_journal()
+
+    window.loaded.connect(on_loaded)
     window.show()
+    # an unchanged drawing opens from its native snapshot
+    if not window.load_snapshot(file_path):
+        window.load_dxf_async(file_path)
     sys.exit(app.exec())
+
+
+if __name__ == '__main__':
+    main()
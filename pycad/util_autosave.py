@@ -0,0 +1,66 @@
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Any, Callable
+
+from PySide6.QtCore import QObject, QTimer, Signal
+
+
+class AutosaveScheduler(QObject):
+    """
+    Coalesces change notifications: schedule() restarts a single shot timer of delay ms,
+    when it fires the model is snapshotted on the UI thread and written by one worker
+    thread. A write still queued when a newer snapshot arrives is dropped.
+    """
+    saved = Signal(str, object)  # filename and what write returned
+    failed = Signal(str)
+
+    def __init__(self, filename: str, snapshot: Callable[[], Any], write: Callable[[Any, str], None],
+                 delay: int = 1000, parent=None):
+        super().__init__(parent)
+        self.filename = filename
+        self.snapshot = snapshot
+        self.write = write
+        self.generation = 0
+        self.pending: Future = None
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay)
+        self.timer.timeout.connect(self.save_now)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="autosave")
+
+    @property
+    def delay(self) -> int:
+        return self.timer.interval()
+
+    @delay.setter
+    def delay(self, value: int):
+        self.timer.setInterval(value)
+
+    def schedule(self):
+        self.timer.start()
+
+    def save_now(self):
+        self.timer.stop()
+        self.generation += 1
+        self.pending = self.executor.submit(self.write_snapshot, self.generation, self.snapshot())
+
+    def write_snapshot(self, generation: int, snapshot):
+        if generation != self.generation:
+            return
+        try:
+            result = self.write(snapshot, self.filename)
+        except Exception as e:
+            print(f"autosave to {self.filename} failed: {e}", flush=True)
+            self.failed.emit(str(e))
+            return
+        self.saved.emit(self.filename, result)
+
+    def wait(self):
+        if self.pending is not None:
+            self.pending.result()
+
+    def shutdown(self, flush: bool = False):
+        # stops the timer, writes the pending changes if flush, and waits for the worker
+        if flush and self.timer.isActive():
+            self.save_now()
+        self.timer.stop()
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,320 @@
+import hashlib
+import io
+import json
+import os
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import git
+import numpy as np
+from PySide6.QtCore import QPoint, QThread, Signal
+from PySide6.QtGui import QColor
+
+from pycad.ComponentLayers import LayerModel
+from pycad.Drawable import Drawable
+from pycad.DrawableDimensionImpl import Dimension
+from pycad.DrawableTextImpl import Text
+from pycad.util_dxf import entity_order, line_hashes, replace_file
+from pycad.util_dxf_stream import DxfStreamReader
+
+DIFF_CACHE_VERSION = 2
+
+
+class LayerEntities(NamedTuple):
+    lines: np.ndarray  # (n, 4)
+    drawables: List[Drawable]
+
+
+class LayerDiff(NamedTuple):
+    name: str
+    added: np.ndarray  # lines (n, 4)
+    removed: np.ndarray  # lines (n, 4)
+    modified: np.ndarray  # lines (n, 8), the points before and after
+    added_entities: List[tuple]  # texts and dimensions as util_dxf.entity_order gives them
+    removed_entities: List[tuple]
+    modified_entities: List[Tuple[tuple, tuple]]  # before, after
+
+    def counts(self) -> Tuple[int, int, int]:
+        return (len(self.added) + len(self.added_entities), len(self.removed) + len(self.removed_entities),
+                len(self.modified) + len(self.modified_entities))
+
+
+class Revision(NamedTuple):
+    layers: List[LayerModel]  # the layer table, empty layers
+    entities: Dict[str, LayerEntities]
+
+
+def read_entities(data: bytes) -> Revision:
+    # the entities of a DXF in memory per layer, in the order of the layer table
+    layers, lines, drawables = [], {}, {}
+    for event, chunk in DxfStreamReader(io.BytesIO(data)).read():
+        if event == "layers":
+            layers = chunk
+            for layer in chunk:
+                lines.setdefault(layer.name, [])
+                drawables.setdefault(layer.name, [])
+            continue
+        for name, (chunk_lines, chunk_drawables) in chunk.items():
+            lines[name].append(chunk_lines)
+            drawables[name].extend(chunk_drawables)
+    return Revision(layers, {name: LayerEntities(np.concatenate(lines[name] or [np.empty((0, 4))]), drawables[name])
+                             for name in lines})
+
+
+def revision_blob(repo: git.Repo, rev: Optional[str], path: str) -> Optional[git.Blob]:
+    if rev is None:
+        return None
+    try:
+        return repo.commit(rev).tree / path
+    except KeyError:
+        return None
+
+
+def read_revision(repo: git.Repo, rev: Optional[str], path: str) -> Revision:
+    # the drawing at path as committed in rev, straight from the object store; empty when it is not there
+    blob = revision_blob(repo, rev, path)
+    return read_entities(blob.data_stream.read()) if blob is not None else Revision([], {})
+
+
+def normalized_lines(lines: np.ndarray) -> np.ndarray:
+    # a line and its reverse are the same line
+    swap = (lines[:, 0] > lines[:, 2]) | ((lines[:, 0] == lines[:, 2]) & (lines[:, 1] > lines[:, 3]))
+    return np.where(swap[:, None], lines[:, [2, 3, 0, 1]], lines)
+
+
+def unmatched(hashes: np.ndarray, others: np.ndarray) -> np.ndarray:
+    """
+    Mask of the rows of hashes left once each row of others is matched with one row of
+    the same hash, the first ones of a repeated hash matched first: of two equal lines
+    only one left is one removed line.
+    """
+    order = np.argsort(hashes, kind="stable")
+    ordered = hashes[order]
+    rank = np.empty(len(hashes), dtype=np.int64)
+    rank[order] = np.arange(len(hashes)) - np.searchsorted(ordered, ordered, "left")
+    others = np.sort(others)
+    return rank >= np.searchsorted(others, hashes, "right") - np.searchsorted(others, hashes, "left")
+
+
+def pair_by_point(removed: List[tuple], added: List[tuple]) -> List[Tuple[int, int]]:
+    """
+    Pairs of indices (removed, added) of entities that kept a point, points given as a
+    list of points per entity. Each entity is in one pair at most, so a line cut in two
+    is one modified line and one added line.
+    """
+    at = {}
+    for index, points in enumerate(added):
+        for point in points:
+            at.setdefault(point, []).append(index)
+    taken = set()
+    pairs = []
+    for index, points in enumerate(removed):
+        for point in points:
+            match = next((candidate for candidate in at.get(point, ()) if candidate not in taken), None)
+            if match is not None:
+                taken.add(match)
+                pairs.append((index, match))
+                break
+    return pairs
+
+
+def diff_layer(name: str, old: LayerEntities, new: LayerEntities) -> LayerDiff:
+    """
+    Lines are compared by a hash of their points with the direction left out, texts and
+    dimensions by their canonical key, so the order entities come in does not matter;
+    an entity repeated n times is matched n times.
+    A removed and an added entity of the same kind that share a point (the ends of a
+    line, the insertion point of a text, the first point of a dimension) count as one
+    modified entity.
+    """
+    old_lines, new_lines = normalized_lines(old.lines), normalized_lines(new.lines)
+    old_hashes = line_hashes(name, old_lines[:, 0], old_lines[:, 1], old_lines[:, 2], old_lines[:, 3])
+    new_hashes = line_hashes(name, new_lines[:, 0], new_lines[:, 1], new_lines[:, 2], new_lines[:, 3])
+    removed = old_lines[unmatched(old_hashes, new_hashes)]
+    added = new_lines[unmatched(new_hashes, old_hashes)]
+    pairs = pair_by_point([((x1, y1), (x2, y2)) for x1, y1, x2, y2 in removed.tolist()],
+                          [((x1, y1), (x2, y2)) for x1, y1, x2, y2 in added.tolist()])
+    removed_rows = np.array([row for row, _ in pairs], dtype=np.int64)
+    added_rows = np.array([row for _, row in pairs], dtype=np.int64)
+    modified = np.hstack((removed[removed_rows], added[added_rows]))
+    removed, added = np.delete(removed, removed_rows, axis=0), np.delete(added, added_rows, axis=0)
+
+    old_keys = Counter(entity_order(drawable) for drawable in old.drawables)
+    new_keys = Counter(entity_order(drawable) for drawable in new.drawables)
+    removed_entities = sorted((old_keys - new_keys).elements())
+    added_entities = sorted((new_keys - old_keys).elements())
+    # same kind and same first point
+    pairs = pair_by_point([(key[:3],) for key in removed_entities], [(key[:3],) for key in added_entities])
+    modified_entities = [(removed_entities[old_row], added_entities[new_row]) for old_row, new_row in pairs]
+    paired_old, paired_new = {row for row, _ in pairs}, {row for _, row in pairs}
+    return LayerDiff(name, added, removed, modified,
+                     [key for row, key in enumerate(added_entities) if row not in paired_new],
+                     [key for row, key in enumerate(removed_entities) if row not in paired_old],
+                     modified_entities)
+
+
+def diff_entities(old: Dict[str, LayerEntities], new: Dict[str, LayerEntities]) -> List[LayerDiff]:
+    # the layers of new then the ones only in old, only those with a change
+    empty = LayerEntities(np.empty((0, 4)), [])
+    diffs = [diff_layer(name, old.get(name, empty), new.get(name, empty))
+             for name in list(new) + [name for name in old if name not in new]]
+    return [diff for diff in diffs if any(diff.counts())]
+
+
+def diff_cache_path(repo: git.Repo, old: Optional[str], new: str, path: str) -> str:
+    # in the git directory, out of reach of `git add -A`
+    digest = hashlib.sha256(path.encode("utf8")).hexdigest()[:16]
+    return os.path.join(repo.git_dir, "pycad-diff", f"{old or 'root'}_{new}_{digest}.npz")
+
+
+def write_diff_cache(filename: str, diffs: List[LayerDiff]):
+    meta = {"version": DIFF_CACHE_VERSION,
+            "layers": [{"name": diff.name, "added": diff.added_entities, "removed": diff.removed_entities,
+                        "modified": diff.modified_entities} for diff in diffs]}
+    arrays = {"meta": np.frombuffer(json.dumps(meta).encode("utf8"), dtype=np.uint8)}
+    for number, diff in enumerate(diffs):
+        arrays.update({f"added_{number}": diff.added, f"removed_{number}": diff.removed,
+                       f"modified_{number}": diff.modified})
+
+    def write(name):
+        with open(name, "wb") as file:
+            np.savez(file, **arrays)
+
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    replace_file(filename, write)
+
+
+def read_diff_cache(filename: str) -> Optional[List[LayerDiff]]:
+    if not os.path.exists(filename):
+        return None
+    with np.load(filename) as data:
+        meta = json.loads(data["meta"].tobytes())
+        if meta.get("version") != DIFF_CACHE_VERSION:
+            return None
+        return [LayerDiff(layer["name"], data[f"added_{number}"], data[f"removed_{number}"],
+                          data[f"modified_{number}"], [tuple(key) for key in layer["added"]],
+                          [tuple(key) for key in layer["removed"]],
+                          [(tuple(before), tuple(after)) for before, after in layer["modified"]])
+                for number, layer in enumerate(meta["layers"])]
+
+
+def diff_revisions(repo: git.Repo, old: Optional[str], new: str, path: str,
+                   new_revision: Optional[Revision] = None) -> List[LayerDiff]:
+    """
+    The entities of the drawing at path added, removed and modified from commit old to
+    commit new (old None: from nothing), per layer. Results are kept on disk per pair of
+    commits, an unchanged drawing is not read at all. new_revision is the drawing in new
+    when the caller has read it already.
+    """
+    old, new = (repo.commit(old).hexsha if old is not None else None), repo.commit(new).hexsha
+    cache = diff_cache_path(repo, old, new, path)
+    diffs = read_diff_cache(cache)
+    if diffs is not None:
+        return diffs
+    old_blob, new_blob = revision_blob(repo, old, path), revision_blob(repo, new, path)
+    if old_blob is not None and new_blob is not None and old_blob.hexsha == new_blob.hexsha:
+        diffs = []
+    else:
+        new_revision = new_revision or read_revision(repo, new, path)
+        diffs = diff_entities(read_revision(repo, old, path).entities, new_revision.entities)
+    write_diff_cache(cache, diffs)
+    return diffs
+
+
+def parent_of(repo: git.Repo, rev: str) -> Optional[str]:
+    commit = repo.commit(rev)
+    return commit.parents[0].hexsha if commit.parents else None
+
+
+def commit_diff(repo: git.Repo, rev: str, path: str) -> List[LayerDiff]:
+    # what a commit changed in the drawing, against its first parent
+    return diff_revisions(repo, parent_of(repo, rev), rev, path)
+
+
+def entity_from_key(key: tuple) -> Drawable:
+    # back from util_dxf.entity_order
+    kind, x1, y1, x2, y2, text, height = key
+    if kind == "Text":
+        return Text(QPoint(x1, y1), QPoint(x2, y2), height=height, text=text)
+    return Dimension(QPoint(x1, y1), QPoint(x2, y2))
+
+
+def highlight_layer(name: str, color: QColor, lines: List[np.ndarray], keys: List[tuple]) -> LayerModel:
+    layer = LayerModel(name=name, color=color, width=3, visible=True)
+    layer.import_entities(np.concatenate([np.empty((0, 4))] + lines), [entity_from_key(key) for key in keys],
+                          cleanup=False)
+    return layer
+
+
+class RevisionCompare(NamedTuple):
+    old: Optional[str]
+    new: str
+    base: List[LayerModel]  # the drawing in new, drawn dimmed
+    added: LayerModel  # in new and not in old, modified entities as they are in new
+    removed: LayerModel  # in old and not in new, modified entities as they were in old
+
+
+def compare_revisions(repo: git.Repo, old: Optional[str], new: str, path: str,
+                      added_color: QColor = QColor(0, 170, 0),
+                      removed_color: QColor = QColor(220, 0, 0)) -> RevisionCompare:
+    """
+    The drawing at path in commit new with what changed since commit old as two layers
+    to draw over it. The entities come from diff_revisions, matched by their hashes and
+    cached per pair of commits; only the new revision is read to draw the base.
+    """
+    revision = read_revision(repo, new, path)
+    diffs = diff_revisions(repo, old, new, path, revision)
+    base = []
+    for layer in revision.layers:
+        if layer.name in revision.entities:
+            entities = revision.entities.pop(layer.name)
+            layer.import_entities(entities.lines, entities.drawables, cleanup=False)
+            base.append(layer)
+    added = highlight_layer("added", added_color, [diff.added for diff in diffs] +
+                            [diff.modified[:, 4:] for diff in diffs],
+                            [key for diff in diffs for key in diff.added_entities] +
+                            [after for diff in diffs for _, after in diff.modified_entities])
+    removed = highlight_layer("removed", removed_color, [diff.removed for diff in diffs] +
+                              [diff.modified[:, :4] for diff in diffs],
+                              [key for diff in diffs for key in diff.removed_entities] +
+                              [before for diff in diffs for before, _ in diff.modified_entities])
+    return RevisionCompare(old, new, base, added, removed)
+
+
+class CompareLoader(QThread):
+    """Runs compare_revisions on a worker thread."""
+    compare_read = Signal(object)  # RevisionCompare
+    failed = Signal(str)
+
+    def __init__(self, repo_path: str, old: Optional[str], new: str, path: str, parent=None):
+        super().__init__(parent)
+        self.repo_path = repo_path
+        self.old = old
+        self.new = new
+        self.path = path
+
+    def run(self):
+        try:
+            self.compare_read.emit(compare_revisions(git.Repo(self.repo_path), self.old, self.new, self.path))
+        except Exception as e:
+            print(f"compare of {self.path} at {self.old} and {self.new} failed: {e}", flush=True)
+            self.failed.emit(str(e))
+
+
+class DiffLoader(QThread):
+    """Runs commit_diff on a worker thread, the first time a commit is diffed reads both revisions."""
+    diff_read = Signal(str, object)  # commit, [LayerDiff]
+    failed = Signal(str)
+
+    def __init__(self, repo_path: str, rev: str, path: str, parent=None):
+        super().__init__(parent)
+        self.repo_path = repo_path
+        self.rev = rev
+        self.path = path
+
+    def run(self):
+        try:
+            self.diff_read.emit(self.rev, commit_diff(git.Repo(self.repo_path), self.rev, self.path))
+        except Exception as e:
+            print(f"diff of {self.path} at {self.rev} failed: {e}", flush=True)
+            self.failed.emit(str(e))
@@ -1,7 +1,9 @@
 import math
 
 import ezdxf
-from PySide6.QtCore import QPoint
+import numpy as np
+import shiboken6
+from PySide6.QtCore import QPoint, QPointF, QLineF
 from PySide6.QtGui import QPainter, QPen, Qt, QColor
 
 from pycad.Drawable import HotspotClasses
@@ -24,6 +26,37 @@ def get_true_color(dxf_layer: ezdxf.sections.table.Layer):
 
 
 
+class LineBatch:
+    """
+    Reusable float64 buffer of x1, y1, x2, y2 rows. A row has the memory layout of a
+    QLineF, so the whole batch goes to QPainter.drawLines in one call, read in place.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.buffer = np.empty((capacity, 4))
+
+    def draw(self, painter: QPainter, x1: np.ndarray, y1: np.ndarray, x2: np.ndarray, y2: np.ndarray):
+        count = len(x1)
+        if count == 0:
+            return
+        if count > len(self.buffer):
+            self.buffer = np.empty((max(count, 2 * len(self.buffer)), 4))
+        lines = self.buffer[:count]
+        lines[:, 0], lines[:, 1], lines[:, 2], lines[:, 3] = x1, y1, x2, y2
+        painter.drawLines(shiboken6.wrapInstance(lines.ctypes.data, QLineF), count)
+
+    def draw_points(self, painter: QPainter, x: np.ndarray, y: np.ndarray):
+        # same buffer read as x, y rows laid out like QPointF
+        count = len(x)
+        if count == 0:
+            return
+        if 2 * count > self.buffer.size:
+            self.buffer = np.empty((max(count, 2 * len(self.buffer)), 4))
+        points = self.buffer.reshape(-1, 2)[:count]
+        points[:, 0], points[:, 1] = x, y
+        painter.drawPoints(shiboken6.wrapInstance(points.ctypes.data, QPointF), count)
+
+
 def draw_cross(painter: QPainter, point: QPoint):
     x = point.x()
     y = point.y()
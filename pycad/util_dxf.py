@@ -0,0 +1,525 @@
+import copy
+import hashlib
+import io
+import os
+import re
+import struct
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+import ezdxf
+import numpy as np
+from ezdxf.document import CONST_GUID, CONST_MARKER_STRING
+from ezdxf.lldxf.tagwriter import TagWriter
+from ezdxf.lldxf.types import BINARY_DATA, BYTES, DOUBLE, INT16, INT32, INT64
+from ezdxf.render.arrows import ARROWS
+
+from PySide6.QtGui import QColor
+
+from pycad.ComponentLayers import LayerModel
+from pycad.Drawable import Drawable
+from pycad.DrawableDimensionImpl import Dimension
+from pycad.DrawableTextImpl import Text
+from pycad.constants import dxf_app_id, linetypes, lwindex, lwrindex
+from pycad.util_drawable import qcolor_to_dxf_color, get_true_color
+from pycad.util_dxf_stream import BINARY_SENTINEL
+
+
+class LayerSnapshot(NamedTuple):
+    name: str
+    color: int
+    lineweight: float
+    linetype: str
+    autocut: bool
+    x1: np.ndarray
+    y1: np.ndarray
+    x2: np.ndarray
+    y2: np.ndarray
+    entities: List[Drawable]
+
+
+def snapshot_layers(layers: List[LayerModel]) -> List[LayerSnapshot]:
+    """
+    Copy of what save needs from the layers, safe to write from another thread while
+    the layers keep changing: the line columns are copied arrays, texts and dimensions
+    shallow copies, their points being replaced and never modified in place.
+    """
+    snapshot = []
+    for layer in layers:
+        ids, x1, y1, x2, y2 = layer.lines.columns()
+        snapshot.append(LayerSnapshot(
+            name=layer.name,
+            color=qcolor_to_dxf_color(layer.color),
+            lineweight=layer.lineweight,
+            linetype=layer.linetype,
+            autocut=layer.flAutoCut,
+            x1=x1.copy(), y1=y1.copy(), x2=x2.copy(), y2=y2.copy(),
+            entities=[copy.copy(drawable) for drawable in layer.entities.values()],
+        ))
+    return snapshot
+
+
+def read_layer(dxf_layer) -> LayerModel:
+    color = QColor(get_true_color(dxf_layer))
+    width0 = dxf_layer.dxf.lineweight if dxf_layer.dxf.hasattr('lineweight') else 1
+    width = lwrindex[width0] if width0 >= 0 else lwrindex[5]
+    layer = LayerModel(name=dxf_layer.dxf.name, color=color, width=width, visible=True)
+    layer.linetype = dxf_layer.dxf.get('linetype', 'Continuous')
+    # Read XDATA
+    if dxf_layer.has_xdata(dxf_app_id):
+        xdata = dxf_layer.get_xdata(dxf_app_id)
+        for code, value in xdata:
+            if code == 1070:
+                layer.flAutoCut = True if value == 1 else False
+            else:
+                layer.flAutoCut = False
+    return layer
+
+
+def read_layers(doc: ezdxf.document.Drawing, autocut: bool = False) -> List[LayerModel]:
+    """
+    Layers of the document with their entities, gathered per layer name and handed to
+    LayerModel.import_entities in one batch. Points are truncated like QPoint does.
+    Entities on a layer missing from the layer table are skipped.
+    """
+    layers = [read_layer(dxf_layer) for dxf_layer in doc.layers]
+    by_name: Dict[str, LayerModel] = {}
+    for layer in layers:
+        by_name.setdefault(layer.name, layer)
+    lines: Dict[str, list] = {name: [] for name in by_name}
+    drawables: Dict[str, List[Drawable]] = {name: [] for name in by_name}
+    for entity in doc.entities:
+        name = entity.dxf.layer
+        if name not in by_name:
+            continue
+        kind = entity.dxftype()
+        if kind == 'LINE':
+            start, end = entity.dxf.start, entity.dxf.end
+            lines[name].append((start.x, start.y, end.x, end.y))
+        elif kind == 'TEXT':
+            drawables[name].append(Text.from_dxf(entity))
+        elif kind == 'DIMENSION':
+            drawables[name].append(Dimension.from_dxf(entity))
+    for name, layer in by_name.items():
+        layer.import_entities(np.trunc(np.array(lines[name], dtype=np.float64)), drawables[name], autocut=autocut)
+    return layers
+
+
+def build_dxf(snapshot: List[LayerSnapshot], direct: bool = False,
+              render_dimensions: bool = True) -> ezdxf.document.Drawing:
+    # with direct the lines, texts and dimensions are left out, write_dxf writes them
+    doc: ezdxf.document.Drawing = ezdxf.new()
+
+    if not doc.appids.has_entry(dxf_app_id):
+        doc.appids.new(dxf_app_id)
+
+    for linetype in linetypes:
+        if linetype != "Continuous":
+            if not doc.linetypes.has_entry(linetype):
+                doc.linetypes.new(linetype, dxfattribs={'description': linetype, 'pattern': linetypes[linetype]})
+
+    msp = doc.modelspace()
+    for layer in snapshot:
+        if layer.name != '0' and layer.name != 'Defpoints':
+            dxf_layer = doc.layers.new(
+                name=layer.name,
+                dxfattribs={
+                    "true_color": layer.color,
+                    "lineweight": lwindex[layer.lineweight],
+                    "linetype": layer.linetype,
+                }
+            )
+            # Add XDATA to the layer
+            xdata = [
+                (1001, dxf_app_id),
+                (1000, "autocut"),
+                (1070, 1 if layer.autocut else 0),
+            ]
+            dxf_layer.set_xdata(dxf_app_id, xdata)
+        if direct:
+            for drawable in layer.entities:
+                if not isinstance(drawable, (Text, Dimension)):
+                    drawable.save_to_dxf(doc, layer_name=layer.name)
+            continue
+        attribs = {'layer': layer.name}
+        for sx, sy, ex, ey in zip(layer.x1.tolist(), layer.y1.tolist(), layer.x2.tolist(), layer.y2.tolist()):
+            msp.add_line((sx, sy), (ex, ey), dxfattribs=attribs)
+        for drawable in layer.entities:
+            if isinstance(drawable, Dimension):
+                drawable.save_to_dxf(doc, layer_name=layer.name, render=render_dimensions)
+            else:
+                drawable.save_to_dxf(doc, layer_name=layer.name)
+    return doc
+
+
+# the tags ezdxf writes for a LINE, a left aligned TEXT and a DIMENSION without block of a DXF R2013 model space
+LINE_TAGS = "  0\nLINE\n  5\n%X\n330\n{owner}\n100\nAcDbEntity\n  8\n{layer}\n100\nAcDbLine\n" \
+            " 10\n%r\n 20\n%r\n 30\n0.0\n 11\n%r\n 21\n%r\n 31\n0.0\n"
+TEXT_TAGS = "  0\nTEXT\n  5\n%X\n330\n{owner}\n100\nAcDbEntity\n  8\n{layer}\n100\nAcDbText\n" \
+            " 10\n%r\n 20\n%r\n 30\n0.0\n 40\n%r\n  1\n%s\n 50\n%r\n 41\n%r\n" \
+            " 11\n%r\n 21\n%r\n 31\n0.0\n100\nAcDbText\n"
+DIMENSION_TAGS = "  0\nDIMENSION\n  5\n%X\n330\n{owner}\n100\nAcDbEntity\n  8\n{layer}\n100\nAcDbDimension\n" \
+                 "280\n0\n  3\nStandard\n 10\n%r\n 20\n%r\n 30\n0.0\n 70\n160\n 71\n5\n  1\n<>\n" \
+                 "100\nAcDbAlignedDimension\n 13\n%r\n 23\n%r\n 33\n0.0\n 14\n%r\n 24\n%r\n 34\n0.0\n" \
+                 " 50\n0.0\n100\nAcDbRotatedDimension\n"
+ENDBLK = re.compile(r"  0\nENDBLK\n  5\n([0-9A-F]+)\n")
+# the LINE_TAGS points packed as in a binary DXF
+BINARY_LINE_POINTS = struct.Struct("<hdhdhdhdhdhd")
+# a canonical save: handles hashed from the content into [base, 2 * base), far above the handles ezdxf counts,
+# and the header variables and ezdxf markers that change on every save written as constants
+CANONICAL_HANDLE_BASE = 1 << 40
+CANONICAL_DATE = "2451544.5"  # 2000-01-01 as julian date, the date ezdxf writes for its tests
+CANONICAL_DATES = re.compile(r"(  9\n\$(?:TDCREATE|TDUCREATE|TDUPDATE|TDUUPDATE|TDINDWG|TDUSRTIMER)\n 40\n)[^\n]*\n")
+CANONICAL_GUIDS = re.compile(r"(  9\n\$(?:FINGERPRINTGUID|VERSIONGUID)\n  2\n)[^\n]*\n")
+EZDXF_MARKER = re.compile(re.escape(ezdxf.__version__) + r" @ [0-9T:.+-]+")
+
+
+class RenderedDimension(NamedTuple):
+    """tags of a rendered dimension and of its block entities, without their handle and owner"""
+    key: tuple
+    head: str  # DIMENSION tags before the block name
+    tail: str  # and after it
+    block: List[Tuple[str, str]]  # entity type and tags
+    arrows: List[str]  # arrow blocks the block entities insert
+    binary: Dict[str, tuple]  # encoding -> head, tail and block tags as binary DXF, see binary_dimension
+
+
+def entity_tags(entity, dxfversion: str) -> Optional[Tuple[str, str]]:
+    stream = io.StringIO()
+    entity.export_dxf(TagWriter(stream, dxfversion=dxfversion))
+    parts = stream.getvalue().split("\n", 6)
+    if len(parts) < 7 or parts[2] != "  5" or parts[4] != "330":
+        return None
+    return parts[1], parts[6]
+
+
+def dimension_key(drawable: Dimension, layer_name: str, style: str) -> tuple:
+    start_point, end_point = drawable.start_point, drawable.end_point
+    return start_point.x(), start_point.y(), end_point.x(), end_point.y(), layer_name, style
+
+
+def render_dimension(doc: ezdxf.document.Drawing, drawable: Dimension, layer_name: str,
+                     key: tuple) -> Optional[RenderedDimension]:
+    # renders through ezdxf into doc and keeps the tags in the dimension for the next saves
+    drawable.dxf_cache.pop("rendered", None)
+    dimension = drawable.save_to_dxf(doc, layer_name=layer_name).dimension
+    tags = entity_tags(dimension, doc.dxfversion)
+    block = doc.blocks.get(dimension.dxf.geometry)
+    entities = [entity_tags(entity, doc.dxfversion) for entity in block]
+    arrows = [entity.dxf.name for entity in block if entity.dxftype() == "INSERT"]
+    if tags is None or None in entities or not all(ARROWS.is_acad_arrow(ARROWS.arrow_name(name)) or
+                                                   ARROWS.is_ezdxf_arrow(ARROWS.arrow_name(name)) for name in arrows):
+        return None
+    head, geometry, tail = tags[1].partition(f"  2\n{dimension.dxf.geometry}\n")
+    if not geometry:
+        return None
+    rendered = drawable.dxf_cache["rendered"] = RenderedDimension(key, head, tail, entities, sorted(set(arrows)), {})
+    return rendered
+
+
+def binary_dimension(rendered: RenderedDimension, encoding: str) -> tuple:
+    # the tags of a rendered dimension as binary DXF, encoded on the first binary save
+    if encoding not in rendered.binary:
+        rendered.binary[encoding] = (binary_tags(rendered.head, encoding), binary_tags(rendered.tail, encoding),
+                                     [(kind, binary_tags(tags, encoding)) for kind, tags in rendered.block])
+    return rendered.binary[encoding]
+
+
+def direct_entity_count(snapshot: List[LayerSnapshot], render_dimensions: bool = True) -> int:
+    # lines, texts and, when they are not rendered, dimensions
+    return sum(len(layer.x1) + sum(1 for drawable in layer.entities if isinstance(drawable, Text) or
+                                   (not render_dimensions and isinstance(drawable, Dimension)))
+               for layer in snapshot)
+
+
+def write_binary_lines(file: "BinaryTagFile", line_tags: str, handles: List[int], columns: tuple, batch: int):
+    # LINE_TAGS of a layer encoded once, only the handles and the points are packed per line
+    tags = (line_tags % (0, 0.0, 0.0, 0.0, 0.0)).split("\n")
+    head = binary_tags("\n".join(tags[:4] + [""]), file.encoding)[:-2]  # without the b"0\0" of handle 0
+    body = binary_tags("\n".join(tags[4:12] + [""]), file.encoding)
+    pack = BINARY_LINE_POINTS.pack
+    for start in range(0, len(columns[0]), batch):
+        rows = zip(handles[start:start + batch], *(column[start:start + batch] for column in columns))
+        file.file.write(b"".join([b"%s%X\0%s%s" % (head, h, body, pack(10, x1, 20, y1, 30, 0.0, 11, x2, 21, y2, 31, 0.0))
+                                  for h, x1, y1, x2, y2 in rows]))
+
+
+def write_entity_tags(file, snapshot: List[LayerSnapshot], owner: str, handles: List[int],
+                      render_dimensions: bool = True, batch: int = 10000):
+    """
+    Writes the lines and texts of the snapshot as DXF tags, under handles in the order they
+    are written, and the dimensions as well when they are not rendered. They have no other
+    attributes than their layer, so a format string per layer does.
+    """
+    position = 0
+    for layer in snapshot:
+        name = layer.name.replace("%", "%%")
+        line_tags = LINE_TAGS.format(owner=owner, layer=name)
+        columns = (layer.x1.tolist(), layer.y1.tolist(), layer.x2.tolist(), layer.y2.tolist())
+        line_handles = handles[position:position + len(layer.x1)]
+        if isinstance(file, BinaryTagFile):
+            write_binary_lines(file, line_tags, line_handles, columns, batch)
+        else:
+            for start in range(0, len(layer.x1), batch):
+                rows = zip(line_handles[start:start + batch], *(column[start:start + batch] for column in columns))
+                file.write("".join([line_tags % row for row in rows]))
+        position += len(layer.x1)
+        text_tags = TEXT_TAGS.format(owner=owner, layer=name)
+        dimension_tags = DIMENSION_TAGS.format(owner=owner, layer=name)
+        entities = []
+        for drawable in layer.entities:
+            if isinstance(drawable, Text):
+                x, y = float(drawable.start_point.x()), float(drawable.start_point.y())
+                text = str(drawable.text).replace("\r", "").replace("\n", "")
+                entities.append(text_tags % (handles[position], x, y, float(drawable.height), text,
+                                             drawable.dxf_rotation(), drawable.length(), x, y))
+                position += 1
+            elif isinstance(drawable, Dimension) and not render_dimensions:
+                x1, y1 = float(drawable.start_point.x()), float(drawable.start_point.y())
+                x2, y2 = float(drawable.end_point.x()), float(drawable.end_point.y())
+                entities.append(dimension_tags % (handles[position], x1, y1, x1, y1, x2, y2))
+                position += 1
+        file.write("".join(entities))
+
+
+# group code as written in ASCII tags -> binary group code and value type, filled as codes come
+BINARY_CODES: Dict[str, Tuple[bytes, str]] = {}
+
+
+def binary_code(text: str) -> Tuple[bytes, str]:
+    code = int(text)
+    kind = "d" if code in DOUBLE else "h" if code in INT16 else "i" if code in INT32 else \
+        "q" if code in INT64 else "B" if code in BYTES else "x" if code in BINARY_DATA else \
+        "#" if code == 999 else "s"
+    BINARY_CODES[text] = code.to_bytes(2, "little"), kind
+    return BINARY_CODES[text]
+
+
+def binary_tags(text: str, encoding: str) -> bytes:
+    """
+    ASCII tags, whole ones, encoded as in a binary DXF R2000 and newer: 2 byte group
+    codes, numbers packed, strings zero terminated, binary data in chunks of 127 bytes.
+    """
+    lines = text.split("\n")
+    output = []
+    append = output.append
+    pack = struct.pack
+    for code, value in zip(lines[:-1:2], lines[1::2]):
+        prefix, kind = BINARY_CODES.get(code) or binary_code(code)
+        if kind == "s":
+            append(prefix + value.encode(encoding, errors="dxfreplace") + b"\0")
+        elif kind == "d":
+            append(prefix + pack("<d", float(value)))
+        elif kind == "x":
+            data = bytes.fromhex(value)
+            for start in range(0, len(data), 127):
+                chunk = data[start:start + 127]
+                append(prefix + bytes((len(chunk),)) + chunk)
+        elif kind != "#":  # no comments in binary DXF
+            append(prefix + pack("<" + kind, int(value)))
+    return b"".join(output)
+
+
+class BinaryTagFile:
+    """
+    Takes the ASCII tags write_dxf writes and writes them to file as binary DXF, bytes
+    are tags encoded already. Writes are expected to hold whole tags.
+    """
+
+    def __init__(self, file, encoding: str):
+        self.file = file
+        self.encoding = encoding
+        self.file.write(BINARY_SENTINEL)
+
+    def write(self, data: Union[str, bytes]):
+        self.file.write(data if isinstance(data, bytes) else binary_tags(data, self.encoding))
+
+
+def entity_order(drawable: Drawable) -> tuple:
+    start_point, end_point = drawable.start_point, drawable.end_point
+    return (type(drawable).__name__, start_point.x(), start_point.y(), end_point.x(), end_point.y(),
+            str(getattr(drawable, "text", "")), float(getattr(drawable, "height", 0)))
+
+
+def canonical_snapshot(snapshot: List[LayerSnapshot]) -> List[LayerSnapshot]:
+    """
+    The snapshot in a canonical order: the lines of every layer sorted by their points,
+    texts and dimensions by their type, points and text. The same drawing always saves
+    in the same order, however its lines were drawn, cut or reloaded.
+    """
+    result = []
+    for layer in snapshot:
+        order = np.lexsort((layer.y2, layer.x2, layer.y1, layer.x1))
+        result.append(layer._replace(x1=layer.x1[order], y1=layer.y1[order], x2=layer.x2[order], y2=layer.y2[order],
+                                     entities=sorted(layer.entities, key=entity_order)))
+    return result
+
+
+def value_hash(*values) -> int:
+    return int.from_bytes(hashlib.blake2b(repr(values).encode("utf8"), digest_size=8).digest(), "little")
+
+
+def mix_hash(h: np.ndarray) -> np.ndarray:
+    # the splitmix64 finalizer, wrapping uint64 arithmetic
+    h = (h ^ (h >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return h ^ (h >> np.uint64(31))
+
+
+def line_hashes(layer_name: str, x1: np.ndarray, y1: np.ndarray, x2: np.ndarray, y2: np.ndarray) -> np.ndarray:
+    h = np.full(len(x1), value_hash(layer_name), dtype=np.uint64)
+    for column in (x1, y1, x2, y2):
+        h = mix_hash(h ^ np.ascontiguousarray(column, dtype=np.float64).view(np.uint64))
+    return h
+
+
+def content_handles(snapshot: List[LayerSnapshot], cached: List[Tuple[object, "RenderedDimension"]],
+                    render_dimensions: bool = True) -> np.ndarray:
+    """
+    Handles for the entities write_dxf writes itself, in the order it writes them: the
+    entities of the cached dimension blocks and their dimensions, then per layer the lines,
+    texts and not rendered dimensions. A handle is a hash of the entity, so an edit only
+    changes the handles of the entities it touches. Equal hashes go up by one in write
+    order, which the canonical order keeps the same from save to save.
+    """
+    hashes = []
+    for _, rendered in cached:
+        hashes.append(np.array([value_hash(rendered.key, number) for number in range(len(rendered.block) + 1)],
+                               dtype=np.uint64))
+    for layer in snapshot:
+        hashes.append(line_hashes(layer.name, layer.x1, layer.y1, layer.x2, layer.y2))
+        hashes.append(np.array([value_hash(layer.name, *entity_order(drawable)) for drawable in layer.entities
+                                if isinstance(drawable, Text) or
+                                (not render_dimensions and isinstance(drawable, Dimension))], dtype=np.uint64))
+    base = np.uint64(CANONICAL_HANDLE_BASE)
+    handles = np.concatenate(hashes) % base + base if hashes else np.empty(0, dtype=np.uint64)
+    while True:
+        order = np.argsort(handles, kind="stable")
+        repeated = order[1:][handles[order[1:]] == handles[order[:-1]]]
+        if not len(repeated):
+            return handles.astype(np.int64)
+        handles[repeated] += np.uint64(1)
+
+
+def canonical_header(skeleton: str) -> str:
+    # the dates, GUIDs and ezdxf markers of a document written by ezdxf, the same on every save
+    skeleton = CANONICAL_DATES.sub(lambda match: f"{match.group(1)}{CANONICAL_DATE}\n", skeleton)
+    skeleton = CANONICAL_GUIDS.sub(lambda match: f"{match.group(1)}{CONST_GUID}\n", skeleton)
+    return EZDXF_MARKER.sub(CONST_MARKER_STRING, skeleton)
+
+
+def replace_file(filename: str, write):
+    # write(path) goes to a temporary file next to filename, renamed over it once complete
+    directory, name = os.path.split(os.path.abspath(filename))
+    temp_name = os.path.join(directory, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        write(temp_name)
+        os.replace(temp_name, filename)
+    finally:
+        if os.path.exists(temp_name):
+            os.unlink(temp_name)
+
+
+def write_dxf(snapshot: List[LayerSnapshot], filename: str, direct: bool = True, render_dimensions: bool = True,
+              fmt: str = "asc", canonical: bool = False):
+    """
+    With direct, ezdxf writes the header and the tables, and the lines and texts are
+    written as tags in front of the end of its ENTITIES section, under handles reserved
+    past the ones ezdxf used. A dimension is rendered by ezdxf once, its tags are kept and
+    written as long as its points, layer and style are the same, only the empty block
+    comes from ezdxf. Otherwise everything goes through ezdxf.
+    render_dimensions=False stores the definition points only, a file for this program
+    to read back (autosave), other programs expect the block.
+    fmt="bin" writes a binary DXF, the same tags encoded by BinaryTagFile.
+    canonical writes the same file for the same drawing, for a small diff in git: the
+    order of canonical_snapshot, handles from content_handles and constant dates and
+    GUIDs in the header. It always writes direct.
+    """
+    if canonical:
+        snapshot = canonical_snapshot(snapshot)
+    elif not direct:
+        doc = build_dxf(snapshot, render_dimensions=render_dimensions)
+        replace_file(filename, lambda name: doc.saveas(name, fmt=fmt))
+        return
+    doc = build_dxf(snapshot, direct=True)
+    cached: List[Tuple[object, RenderedDimension]] = []
+    if render_dimensions:
+        style = doc.header.get("$DIMSTYLE", "Standard")
+        # dimensions not rendered yet are rendered in a scratch document, only their tags are kept
+        scratch = None
+        for layer in snapshot:
+            for drawable in layer.entities:
+                if not isinstance(drawable, Dimension):
+                    continue
+                key = dimension_key(drawable, layer.name, style)
+                rendered = drawable.dxf_cache.get("rendered")
+                if rendered is None or rendered.key != key:
+                    scratch = scratch or ezdxf.new()
+                    rendered = render_dimension(scratch, drawable, layer.name, key)
+                if rendered is None:
+                    drawable.save_to_dxf(doc, layer_name=layer.name)
+                    continue
+                for arrow in rendered.arrows:
+                    if arrow not in doc.blocks:
+                        doc.acquire_arrow(ARROWS.arrow_name(arrow))
+                cached.append((doc.blocks.new_anonymous_block(type_char="D"), rendered))
+    first = int(str(doc.entitydb.handles), 16)
+    if canonical:
+        handles = content_handles(snapshot, cached, render_dimensions)
+        doc.entitydb.handles.reset("%X" % (int(handles.max()) + 1 if len(handles) else first))
+    else:
+        count = direct_entity_count(snapshot, render_dimensions) + sum(1 + len(rendered.block) for _, rendered in cached)
+        handles = np.arange(first, first + count, dtype=np.int64)
+        doc.entitydb.handles.reset("%X" % (first + count))
+    handles = handles.tolist()
+    skeleton = io.StringIO()
+    doc.write(skeleton)
+    skeleton = skeleton.getvalue()
+    if canonical:
+        skeleton = canonical_header(skeleton)
+    end = skeleton.index("  0\nENDSEC\n", skeleton.index("  0\nSECTION\n  2\nENTITIES\n"))
+
+    owner = doc.modelspace().block_record_handle
+    binary = fmt == "bin"
+    encoding = doc.output_encoding
+    block_entities: Dict[str, Union[str, bytes]] = {}
+    dimensions = []
+    written = 0
+    for block, rendered in cached:
+        entities = []
+        if binary:
+            head, tail, block_tags = binary_dimension(rendered, encoding)
+            for kind, tags in block_tags:
+                entities.append(binary_tags(f"  0\n{kind}\n  5\n{handles[written]:X}\n330\n"
+                                            f"{block.block_record_handle}\n", encoding))
+                entities.append(tags)
+                written += 1
+            block_entities[block.endblk.dxf.handle] = b"".join(entities)
+            dimensions.append(binary_tags(f"  0\nDIMENSION\n  5\n{handles[written]:X}\n330\n{owner}\n", encoding) +
+                              head + binary_tags(f"  2\n{block.name}\n", encoding) + tail)
+            written += 1
+            continue
+        for kind, tags in rendered.block:
+            entities.append(f"  0\n{kind}\n  5\n{handles[written]:X}\n330\n{block.block_record_handle}\n{tags}")
+            written += 1
+        block_entities[block.endblk.dxf.handle] = "".join(entities)
+        dimensions.append(f"  0\nDIMENSION\n  5\n{handles[written]:X}\n330\n{owner}\n"
+                          f"{rendered.head}  2\n{block.name}\n{rendered.tail}")
+        written += 1
+
+    def write(name):
+        with open(name, "wb") if binary else open(name, "wt", encoding=encoding, errors="dxfreplace") as output:
+            file = BinaryTagFile(output, encoding) if binary else output
+            position = 0
+            if block_entities:
+                for match in ENDBLK.finditer(skeleton, 0, end):
+                    if match.group(1) in block_entities:
+                        file.write(skeleton[position:match.start()])
+                        file.write(block_entities[match.group(1)])
+                        position = match.start()
+            file.write(skeleton[position:end])
+            file.write(b"".join(dimensions) if binary else "".join(dimensions))
+            write_entity_tags(file, snapshot, owner, handles[written:], render_dimensions)
+            file.write(skeleton[end:])
+
+    replace_file(filename, write)
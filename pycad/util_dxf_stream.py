@@ -0,0 +1,317 @@
+import os
+import struct
+from typing import BinaryIO, Dict, Iterator, List, Tuple, Union
+
+import numpy as np
+from ezdxf.lldxf.const import DXF2007
+from ezdxf.lldxf.types import BINARY_DATA, BYTES, DOUBLE, INT16, INT32, INT64
+from ezdxf.tools.codepage import toencoding
+from PySide6.QtCore import QThread, QSemaphore, QPoint, Signal
+from PySide6.QtGui import QColor
+
+from pycad.ComponentLayers import LayerModel
+from pycad.Drawable import Drawable
+from pycad.DrawableDimensionImpl import Dimension
+from pycad.DrawableTextImpl import Text
+from pycad.constants import dxf_app_id, lwrindex
+
+BINARY_SENTINEL = b"AutoCAD Binary DXF\r\n\x1a\x00"
+
+# group codes kept for each kind of entity, the first occurrence wins
+WANTED_CODES = {
+    "LINE": {8, 10, 20, 11, 21},
+    "TEXT": {8, 10, 20, 40, 41, 50, 1},
+    "DIMENSION": {8, 13, 23, 14, 24},
+}
+
+
+def is_binary_dxf(filename: str) -> bool:
+    with open(filename, "rb") as file:
+        return file.read(len(BINARY_SENTINEL)) == BINARY_SENTINEL
+
+
+def ascii_tags(stream: BinaryIO, block_size: int = 1 << 20) -> Iterator[Tuple[int, bytes]]:
+    # (group code, raw value) pairs of an ASCII DXF, read a block of lines at a time
+    pending = []
+    while True:
+        lines = stream.readlines(block_size)
+        if not lines:
+            return
+        if pending:
+            lines = pending + lines
+        pending = [lines.pop()] if len(lines) % 2 else []
+        for code, value in zip(lines[::2], lines[1::2]):
+            code = int(code)
+            if code != 999:
+                yield code, value
+
+
+# how the value of a group code is stored in a binary DXF, anything else is a zero terminated string
+BINARY_VALUES = {
+    **{code: (struct.Struct("<d"), 8) for code in DOUBLE},
+    **{code: (struct.Struct("<h"), 2) for code in INT16},
+    **{code: (struct.Struct("<i"), 4) for code in INT32},
+    **{code: (struct.Struct("<q"), 8) for code in INT64},
+}
+
+
+def binary_tags(stream: BinaryIO, block_size: int = 1 << 20) -> Iterator[Tuple[int, Union[bytes, int, float]]]:
+    """
+    (group code, value) pairs of a binary DXF, the stream positioned after the sentinel.
+    Strings stay raw bytes as from ascii_tags, numbers come decoded. A tag cut by the
+    end of a block is parsed again once the next block is appended.
+    """
+    data = stream.read(block_size)
+    # the first tag is (0, SECTION), its group code takes one byte before R2000
+    r12 = data[:2] != b"\0\0"
+    index = 0
+    while True:
+        try:
+            if r12:
+                code = data[index]
+                position = index + 1
+                if code == 255:
+                    code = data[position] | data[position + 1] << 8
+                    position += 2
+            else:
+                code = data[index] | data[index + 1] << 8
+                position = index + 2
+            if code in BINARY_VALUES:
+                unpack, size = BINARY_VALUES[code]
+                value = unpack.unpack_from(data, position)[0]
+                position += size
+            elif code in BYTES:
+                value = data[position]
+                position += 1
+            elif code in BINARY_DATA:
+                end = position + 1 + data[position]
+                if end > len(data):
+                    raise IndexError(end)
+                value = data[position + 1:end]
+                position = end
+            else:
+                end = data.index(b"\0", position)
+                value = data[position:end]
+                position = end + 1
+        except (IndexError, ValueError, struct.error):
+            more = stream.read(block_size)
+            if not more:
+                if index < len(data):
+                    raise ValueError(f"binary DXF truncated at byte {stream.tell() - len(data) + index}")
+                return
+            data = data[index:] + more
+            index = 0
+            continue
+        index = position
+        yield code, value
+
+
+class DxfStreamReader:
+    """
+    Reads the layer table and the LINE, TEXT and DIMENSION entities of an ASCII or
+    binary DXF without building a document: read() yields ("layers", [LayerModel]) when the layer
+    table ends and then ("entities", {layer name: (lines (n, 4), [Drawable])}) for
+    every chunk_size entities. Points are truncated like QPoint does, entities on a
+    layer missing from the layer table are skipped.
+    """
+
+    def __init__(self, stream: BinaryIO, chunk_size: int = 20000):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.encoding = "utf8"
+        self.layers: List[LayerModel] = []
+        self.lines: Dict[str, list] = {}
+        self.drawables: Dict[str, List[Drawable]] = {}
+        self.count = 0
+
+    def decode(self, value: bytes) -> str:
+        return value.rstrip(b"\r\n").decode(self.encoding, errors="replace")
+
+    def read(self) -> Iterator[Tuple[str, object]]:
+        section = None
+        kind = None
+        fields = {}
+        layer_tags = []
+        header_variable = None
+        version = codepage = None
+        wanted = set()
+        started = False
+        start = self.stream.tell()
+        if self.stream.read(len(BINARY_SENTINEL)) == BINARY_SENTINEL:
+            stream_tags = binary_tags(self.stream)
+        else:
+            self.stream.seek(start)
+            stream_tags = ascii_tags(self.stream)
+        for code, value in stream_tags:
+            if code != 0:
+                if code in wanted and code not in fields:
+                    fields[code] = value
+                elif kind == "LAYER":
+                    layer_tags.append((code, value))
+                elif section == "HEADER":
+                    if code == 9:
+                        header_variable = value.strip()
+                    elif header_variable == b"$ACADVER":
+                        version = value.strip().decode()
+                    elif header_variable == b"$DWGCODEPAGE":
+                        codepage = value.strip().decode()
+                elif kind == "SECTION" and code == 2:
+                    section = value.strip().decode()
+                continue
+
+            if kind in WANTED_CODES and section == "ENTITIES":
+                # the same kinds in BLOCKS belong to blocks, dimension blocks among them
+                self.add_entity(kind, fields)
+                if self.count >= self.chunk_size:
+                    yield "entities", self.take_chunk()
+            elif kind == "LAYER":
+                self.layers.append(self.read_layer(fields, layer_tags))
+            kind = value.strip().decode()
+            fields = {}
+            layer_tags = []
+            if kind == "ENDSEC":
+                if section == "HEADER" and version is not None and version < DXF2007 and codepage:
+                    self.encoding = toencoding(codepage)
+                section = None
+            elif kind == "ENDTAB" and self.layers and not started:
+                started = True
+                yield "layers", self.start_entities()
+            wanted = WANTED_CODES.get(kind, ()) if section == "ENTITIES" else {2} if kind == "LAYER" else ()
+            if kind == "EOF":
+                break
+        if kind != "EOF":
+            # what was read so far has been yielded, the caller must not take it for the whole file
+            raise ValueError("not a DXF file or truncated, no EOF")
+        if not started:
+            yield "layers", self.start_entities()
+        if self.count:
+            yield "entities", self.take_chunk()
+
+    def start_entities(self) -> List[LayerModel]:
+        names = dict.fromkeys(layer.name for layer in self.layers)
+        self.lines = {name: [] for name in names}
+        self.drawables = {name: [] for name in names}
+        return self.layers
+
+    def read_layer(self, fields: Dict[int, bytes], tags: List[Tuple[int, bytes]]) -> LayerModel:
+        # the same attributes as util_dxf.read_layer takes from an ezdxf layer
+        name = self.decode(fields.get(2, b"0"))
+        true_color = lineweight = None
+        linetype = "Continuous"
+        flAutoCut = None
+        xdata = None
+        for code, value in tags:
+            if code == 1001:
+                xdata = value.strip().decode() == dxf_app_id
+            elif xdata:
+                flAutoCut = code == 1070 and int(value) == 1
+            elif xdata is None:
+                if code == 420 and true_color is None:
+                    true_color = int(value)
+                elif code == 370 and lineweight is None:
+                    lineweight = int(value)
+                elif code == 6:
+                    linetype = self.decode(value)
+        width0 = lineweight if lineweight is not None else 1
+        width = lwrindex[width0] if width0 >= 0 else lwrindex[5]
+        layer = LayerModel(name=name, color=QColor(true_color or 0), width=width, visible=True)
+        layer.linetype = linetype
+        if flAutoCut is not None:
+            layer.flAutoCut = flAutoCut
+        return layer
+
+    def add_entity(self, kind: str, fields: Dict[int, bytes]):
+        name = self.decode(fields.get(8, b"0"))
+        if name not in self.lines:
+            return
+        if kind == "LINE":
+            self.lines[name].append((float(fields.get(10, 0)), float(fields.get(20, 0)),
+                                     float(fields.get(11, 0)), float(fields.get(21, 0))))
+        elif kind == "TEXT":
+            self.drawables[name].append(Text.from_placement(
+                float(fields.get(10, 0)), float(fields.get(20, 0)), float(fields.get(40, 2.5)),
+                self.decode(fields.get(1, b"")), float(fields.get(41, 25)), float(fields.get(50, 0))))
+        else:
+            self.drawables[name].append(Dimension(QPoint(float(fields.get(13, 0)), float(fields.get(23, 0))),
+                                                  QPoint(float(fields.get(14, 0)), float(fields.get(24, 0)))))
+        self.count += 1
+
+    def take_chunk(self) -> Dict[str, Tuple[np.ndarray, List[Drawable]]]:
+        chunk = {}
+        for name, lines in self.lines.items():
+            if lines or self.drawables[name]:
+                chunk[name] = (np.trunc(np.array(lines, dtype=np.float64).reshape(-1, 4)), self.drawables[name])
+                self.lines[name] = []
+                self.drawables[name] = []
+        self.count = 0
+        return chunk
+
+
+def read_dxf_layers(filename: str, cleanup: bool = True, autocut: bool = False) -> List[LayerModel]:
+    """
+    The layers of a DXF file read on the calling thread, for callers without an event
+    loop. Chunks are imported with cleanup=False, finish_import runs once per layer at
+    the end unless cleanup is False.
+    """
+    layers, by_name = [], {}
+    with open(filename, "rb") as stream:
+        for event, data in DxfStreamReader(stream).read():
+            if event == "layers":
+                layers = data
+                for layer in layers:
+                    by_name.setdefault(layer.name, layer)
+                continue
+            for name, (lines, drawables) in data.items():
+                by_name[name].import_entities(lines, drawables, cleanup=False)
+    if cleanup:
+        for layer in by_name.values():
+            layer.finish_import(autocut)
+    return layers
+
+
+class DxfStreamLoader(QThread):
+    """
+    Runs a DxfStreamReader on a worker thread. The receiver of entities calls
+    chunk_done() once it has taken a chunk in, at most max_pending chunks wait for it,
+    so the model and the canvas fill in at the pace the UI thread keeps up with.
+    requestInterruption() cancels the load, finished_loading tells whether it completed.
+    """
+    layers_read = Signal(object)  # [LayerModel]
+    entities_read = Signal(object)  # {layer name: (lines (n, 4), [Drawable])}
+    progress = Signal('qint64', 'qint64')  # bytes read, file size
+    failed = Signal(str)
+    finished_loading = Signal(bool)
+
+    def __init__(self, filename: str, chunk_size: int = 20000, max_pending: int = 2, parent=None):
+        super().__init__(parent)
+        self.filename = filename
+        self.chunk_size = chunk_size
+        self.pending = QSemaphore(max_pending)
+
+    def chunk_done(self):
+        self.pending.release()
+
+    def run(self):
+        try:
+            completed = self.load()
+        except Exception as e:
+            print(f"loading {self.filename} failed: {e}", flush=True)
+            self.failed.emit(str(e))
+            completed = False
+        self.finished_loading.emit(completed)
+
+    def load(self) -> bool:
+        with open(self.filename, "rb") as stream:
+            size = os.fstat(stream.fileno()).st_size
+            for event, data in DxfStreamReader(stream, self.chunk_size).read():
+                if event == "layers":
+                    self.layers_read.emit(data)
+                    continue
+                while not self.pending.tryAcquire(1, 50):
+                    if self.isInterruptionRequested():
+                        return False
+                if self.isInterruptionRequested():
+                    return False
+                self.entities_read.emit(data)
+                self.progress.emit(stream.tell(), size)
+        return not self.isInterruptionRequested()
@@ -0,0 +1,214 @@
+import itertools
+import os
+from typing import Callable, Iterator, List, NamedTuple, Optional
+
+import git
+from PySide6.QtCore import QAbstractTableModel, QModelIndex, QThread, Qt, Signal
+
+from pycad.util_snapshot import snapshot_path
+
+
+class CommitRecord(NamedTuple):
+    date: str
+    message: str
+    hexsha: str
+
+
+def commit_record(commit: git.Commit) -> CommitRecord:
+    lines = commit.message.splitlines()
+    return CommitRecord(f"{commit.committed_datetime:%Y-%m-%d %H:%M:%S}", lines[0] if lines else "", commit.hexsha)
+
+
+def drawing_repository(drawing: str) -> str:
+    # the git directory of the repository the drawing is in, the one to create next to it when there is none
+    directory = os.path.dirname(os.path.abspath(drawing))
+    try:
+        return git.Repo(directory, search_parent_directories=True).git_dir
+    except git.InvalidGitRepositoryError:
+        return os.path.join(directory, ".git")
+
+
+def drawing_files(path: str) -> List[str]:
+    # what a commit of the drawing takes: the drawing alone, not its .snapshot, the journal or the autosave
+    return [path]
+
+
+def ignore_snapshots(work_tree: str):
+    # a .snapshot is a cache rebuilt from its drawing, as large as it and rewritten by every save
+    path = os.path.join(work_tree, ".gitignore")
+    pattern = f"*{snapshot_path('')}"
+    lines = []
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    if pattern not in lines:
+        with open(path, "a", encoding="utf-8") as f:
+            if lines and lines[-1]:
+                f.write("\n")
+            f.write(f"{pattern}\n")
+
+
+class CommitWorker(QThread):
+    """
+    Commits the files at paths (relative to the work tree) and nothing else, on a worker
+    thread: write() first when given, then `git add` of each path and `git commit -- paths`,
+    so what else is staged or changed in the tree stays out of the commit. committed gives
+    the new commit, an empty string when the paths had no change.
+    """
+    progress = Signal(str, int, int)  # step, steps done, steps
+    committed = Signal(str)
+    failed = Signal(str)
+
+    def __init__(self, repo_path: str, paths: List[str], message: str, write: Optional[Callable[[], None]] = None,
+                 parent=None):
+        super().__init__(parent)
+        self.repo_path = repo_path
+        self.paths = paths
+        self.message = message
+        self.write = write
+
+    def run(self):
+        try:
+            hexsha = self.commit()
+        except Exception as e:
+            print(f"commit of {', '.join(self.paths)} failed: {e}", flush=True)
+            self.failed.emit(str(e))
+            return
+        self.committed.emit(hexsha or "")
+
+    def commit(self) -> Optional[str]:
+        steps = len(self.paths) + 1 + (self.write is not None)
+        done = 0
+        if self.write is not None:
+            self.progress.emit("writing the drawing", done, steps)
+            self.write()
+            done += 1
+        repo = git.Repo(self.repo_path)
+        tracked = set(repo.git.ls_files("--", *self.paths).splitlines())
+        paths = [path for path in self.paths
+                 if path in tracked or os.path.exists(os.path.join(repo.working_tree_dir, path))]
+        for path in paths:
+            # git hashes the file, a large drawing takes a while
+            self.progress.emit(f"staging {path}", done, steps)
+            repo.git.add("-A", "--", path)
+            done += 1
+        if not paths or not repo.git.status("--porcelain", "--", *paths):
+            self.progress.emit("nothing to commit", steps, steps)
+            return None
+        self.progress.emit("committing", done, steps)
+        # the identity GitPython would commit with when git has none configured
+        author, committer = git.Actor.author(repo.config_reader()), git.Actor.committer(repo.config_reader())
+        with repo.git.custom_environment(GIT_AUTHOR_NAME=author.name, GIT_AUTHOR_EMAIL=author.email,
+                                         GIT_COMMITTER_NAME=committer.name, GIT_COMMITTER_EMAIL=committer.email):
+            repo.git.commit("--allow-empty-message", "-m", self.message, "--", *paths)
+        self.progress.emit("committed", steps, steps)
+        return repo.head.commit.hexsha
+
+
+class CommitLogLoader(QThread):
+    """
+    Reads the history of a repository from rev on, one page of page_size commits each
+    time the thread is started. The walk is a single `git rev-list` streamed by GitPython,
+    kept between pages, so a page costs the same however deep in the history it is.
+    """
+    page_read = Signal(object, bool)  # [CommitRecord], more pages to come
+    failed = Signal(str)
+
+    def __init__(self, repo_path: str, rev: str, page_size: int = 200, parent=None):
+        super().__init__(parent)
+        self.repo_path = repo_path
+        self.rev = rev
+        self.page_size = page_size
+        self.commits: Optional[Iterator[git.Commit]] = None
+
+    def run(self):
+        try:
+            if self.commits is None:
+                self.commits = git.Repo(self.repo_path).iter_commits(self.rev)
+            page = [commit_record(commit) for commit in itertools.islice(self.commits, self.page_size)]
+        except Exception as e:
+            print(f"reading the history of {self.repo_path} failed: {e}", flush=True)
+            self.failed.emit(str(e))
+            page = []
+        self.page_read.emit(page, len(page) == self.page_size)
+
+
+class CommitLogModel(QAbstractTableModel):
+    """
+    The commits of a repository, newest first, for a QTableView. Rows are read by a
+    CommitLogLoader as the view asks for more (canFetchMore / fetchMore when it scrolls
+    to the end), nothing is read before the view is shown. The history is the one of HEAD
+    when the first page was asked for, newer commits go on top with prepend().
+    """
+    HEADERS = ["Date", "Message", "SHA"]
+
+    def __init__(self, repo: git.Repo, page_size: int = 200, parent=None):
+        super().__init__(parent)
+        self.repo = repo
+        self.page_size = page_size
+        self.commits: List[CommitRecord] = []
+        self.loader: Optional[CommitLogLoader] = None
+        self.more = True
+        self.fetching = False
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.commits)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index: QModelIndex, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        return self.commits[index.row()][index.column()]
+
+    def headerData(self, section: int, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()) -> bool:
+        return not parent.isValid() and self.more and not self.fetching
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        if self.loader is None:
+            if not self.repo.head.is_valid():
+                # no commit yet
+                self.more = False
+                return
+            self.loader = CommitLogLoader(self.repo.git_dir, self.repo.head.commit.hexsha, self.page_size, self)
+            self.loader.page_read.connect(self.on_page_read)
+        # the thread of the last page may still be returning from run()
+        self.loader.wait()
+        self.fetching = True
+        self.loader.start()
+
+    def on_page_read(self, page: List[CommitRecord], more: bool):
+        self.fetching = False
+        self.more = more
+        if page:
+            self.beginInsertRows(QModelIndex(), len(self.commits), len(self.commits) + len(page) - 1)
+            self.commits.extend(page)
+            self.endInsertRows()
+
+    def prepend(self, commit: git.Commit):
+        if self.loader is None:
+            if not self.more:
+                # there was no commit to start from
+                self.more = True
+                self.fetchMore()
+            # otherwise the walk has not started and will start from this commit
+            return
+        self.beginInsertRows(QModelIndex(), 0, 0)
+        self.commits.insert(0, commit_record(commit))
+        self.endInsertRows()
+
+    def commit_at(self, row: int) -> Optional[CommitRecord]:
+        return self.commits[row] if 0 <= row < len(self.commits) else None
+
+    def stop(self):
+        # waits for the page being read, the walk goes on with the next fetchMore
+        if self.loader is not None:
+            self.loader.wait()
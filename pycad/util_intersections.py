@@ -0,0 +1,72 @@
+from typing import List, Tuple
+
+from PySide6.QtCore import QPoint
+
+from pycad.Drawable import Drawable
+from pycad.DrawableLineImpl import Line
+from pycad.util_spatial import GridIndex, bbox_overlaps
+
+IntersectionTable = List[Tuple[int, QPoint]]
+
+
+def find_intersections_bruteforce(drawables: List[Drawable]) -> IntersectionTable:
+    # reference engine: every pair of lines, O(n^2)
+    intersection_table = []
+    for i, line1 in enumerate(drawables):
+        if not isinstance(line1, Line):
+            continue
+        for j in range(i + 1, len(drawables)):
+            line2 = drawables[j]
+            if not isinstance(line2, Line):
+                continue
+            intersect_point = line1.intersect(line2)
+            if intersect_point:
+                intersection_table.append((i, intersect_point))
+                intersection_table.append((j, intersect_point))
+    return intersection_table
+
+
+def pick_cell_size(lines: List[Line]) -> float:
+    if not lines:
+        return 100
+    extent = 0
+    for line in lines:
+        extent += max(abs(line.end_point.x() - line.start_point.x()), abs(line.end_point.y() - line.start_point.y()))
+    return max(extent / len(lines), 1)
+
+
+def find_intersections(drawables: List[Drawable]) -> IntersectionTable:
+    """
+    Bucketed broad phase: lines are dropped in a uniform grid sized after the
+    average segment extent and only lines sharing a cell are tested with
+    Line.intersect. The table is ordered like the pairwise scan, so splitting
+    it gives the same result as find_intersections_bruteforce.
+    """
+    lines = [(i, drawable) for i, drawable in enumerate(drawables) if isinstance(drawable, Line)]
+    grid = GridIndex(cell_size=pick_cell_size([line for i, line in lines]))
+    for i, line in lines:
+        start_point, end_point = line.start_point, line.end_point
+        grid.insert(i, start_point.x(), start_point.y(), end_point.x(), end_point.y())
+
+    pairs = set()
+    for bucket in grid.cells.values():
+        if len(bucket) < 2:
+            continue
+        members = sorted(bucket)
+        for a, i in enumerate(members):
+            for j in members[a + 1:]:
+                pairs.add((i, j))
+    for i in grid.oversized:
+        for j, line in lines:
+            if i != j:
+                pairs.add((min(i, j), max(i, j)))
+
+    intersection_table = []
+    for i, j in sorted(pairs):
+        if not bbox_overlaps(grid.items[i][0], grid.items[j][0]):
+            continue
+        intersect_point = drawables[i].intersect(drawables[j])
+        if intersect_point:
+            intersection_table.append((i, intersect_point))
+            intersection_table.append((j, intersect_point))
+    return intersection_table
@@ -0,0 +1,234 @@
+import json
+import os
+from typing import Callable, Dict, List
+
+import numpy as np
+from PySide6.QtCore import QPoint
+from PySide6.QtGui import QColor
+
+from pycad.ComponentLayers import LayerModel
+from pycad.Drawable import Drawable
+from pycad.DrawableDimensionImpl import Dimension
+from pycad.DrawableLineImpl import Line
+from pycad.DrawableTextImpl import Text
+from pycad.util_dxf import replace_file
+
+
+def journal_path(drawing: str) -> str:
+    return f"{drawing}.journal"
+
+
+def encode_drawable(drawable: Drawable) -> list:
+    start_point, end_point = drawable.start_point, drawable.end_point
+    points = [start_point.x(), start_point.y(), end_point.x(), end_point.y()]
+    if isinstance(drawable, Text):
+        return ["TEXT", *points, drawable.text, drawable.height]
+    if isinstance(drawable, Dimension):
+        return ["DIMENSION", *points]
+    return ["LINE", *points]
+
+
+def decode_drawable(entity: list) -> Drawable:
+    kind, x1, y1, x2, y2 = entity[:5]
+    start_point, end_point = QPoint(x1, y1), QPoint(x2, y2)
+    if kind == "TEXT":
+        return Text(start_point, end_point, height=entity[6], text=entity[5])
+    if kind == "DIMENSION":
+        return Dimension(start_point, end_point)
+    return Line(start_point, end_point)
+
+
+def encode_layer(key: int, layer: LayerModel) -> dict:
+    return {"key": key, "name": layer.name, "color": layer.color.rgba(), "lineweight": layer.lineweight,
+            "linetype": layer.linetype, "autocut": layer.flAutoCut, "visible": layer.visible}
+
+
+def apply_layer(layer: LayerModel, entry: dict):
+    layer.name = entry["name"]
+    layer.color = QColor.fromRgba(entry["color"])
+    layer.lineweight = entry["lineweight"]
+    layer.linetype = entry["linetype"]
+    layer.flAutoCut = entry["autocut"]
+    layer.visible = entry["visible"]
+    layer.revision += 1
+
+
+class Journal:
+    """
+    Write-ahead log of the edits made since the drawing was last written, one JSON record
+    per line in <drawing>.journal:
+
+        {"op": "begin", "base": file, "size": .., "mtime_ns": ..}   the DXF the records apply to
+        {"op": "layers", "layers": [{"key": 0, "name": .., ...}]}  layer table, after every change
+        {"op": "add", "layer": key, "entity": ["LINE", x1, y1, x2, y2]}
+        {"op": "remove", "layer": key, "entities": [[...], ...]}
+
+    Entities are recorded by geometry, so the records survive the renumbering of a reload.
+    Layers hold a reference to the journal and report what index_drawable and remove_ids
+    do, lines cut by auto-cut are recorded as the removed line and the added pieces.
+    """
+
+    def __init__(self, path: str, layers: Callable[[], List[LayerModel]]):
+        self.path = path
+        self.layers = layers
+        self.file = None
+        self.layer_keys: Dict[LayerModel, int] = {}
+        self.next_key = 0
+
+    @property
+    def active(self) -> bool:
+        return self.file is not None
+
+    def layer_key(self, layer: LayerModel) -> int:
+        key = self.layer_keys.get(layer)
+        if key is None:
+            key = self.layer_keys[layer] = self.next_key
+            self.next_key += 1
+        return key
+
+    def layers_record(self) -> dict:
+        layers = self.layers()
+        for layer in layers:
+            layer.journal = self
+        self.layer_keys = {layer: self.layer_key(layer) for layer in layers}
+        return {"op": "layers", "layers": [encode_layer(self.layer_keys[layer], layer) for layer in layers]}
+
+    def write_head(self, base: str, stat: os.stat_result, layers_record: dict, tail: bytes = b""):
+        begin = {"op": "begin", "base": os.path.abspath(base), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+        def write(name):
+            with open(name, "wb") as file:
+                file.write((json.dumps(begin) + "\n" + json.dumps(layers_record) + "\n").encode())
+                file.write(tail)
+
+        if self.file is not None:
+            self.file.close()
+        replace_file(self.path, write)
+        self.file = open(self.path, "a")
+
+    def begin(self, base: str):
+        # starts an empty journal over the drawing stored in base
+        self.write_head(base, os.stat(base), self.layers_record())
+
+    def append(self, record: dict):
+        if self.file is None:
+            return
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+
+    def layers_changed(self):
+        if self.file is not None:
+            self.append(self.layers_record())
+
+    def added(self, layer: LayerModel, drawable: Drawable):
+        if layer not in self.layer_keys:
+            self.layers_changed()
+        self.append({"op": "add", "layer": self.layer_key(layer), "entity": encode_drawable(drawable)})
+
+    def removed(self, layer: LayerModel, ids: np.ndarray):
+        # called before the ids are dropped from the layer
+        if layer not in self.layer_keys:
+            self.layers_changed()
+        line_ids, x1, y1, x2, y2 = layer.lines.columns(layer.lines.rows_of(ids))
+        entities = [["LINE", *points] for points in zip(x1.tolist(), y1.tolist(), x2.tolist(), y2.tolist())]
+        entities.extend(encode_drawable(layer.entities[entity_id]) for entity_id in ids.tolist()
+                        if entity_id in layer.entities)
+        if entities:
+            self.append({"op": "remove", "layer": self.layer_key(layer), "entities": entities})
+
+    def checkpoint(self):
+        """position and layer table to compact from once a snapshot taken now is written"""
+        if self.file is None:
+            return None
+        self.file.flush()
+        return self.file.tell(), self.layers_record()
+
+    def compact(self, base: str, stat: os.stat_result, checkpoint):
+        # base holds the drawing as of checkpoint, only the records written since are kept
+        if self.file is None or checkpoint is None:
+            return
+        offset, layers_record = checkpoint
+        self.file.flush()
+        with open(self.path, "rb") as file:
+            file.seek(offset)
+            tail = file.read()
+        self.write_head(base, stat, layers_record, tail)
+
+    def close(self, remove: bool = True):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        for layer in self.layer_keys:
+            layer.journal = None
+        if remove and os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def read_journal(path: str) -> List[dict]:
+    # a record torn by a crash ends the journal
+    records = []
+    with open(path, "r") as file:
+        for line in file:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+    return records
+
+
+def base_matches(begin: dict) -> bool:
+    base = begin.get("base")
+    if base is None or not os.path.exists(base):
+        return False
+    stat = os.stat(base)
+    return stat.st_size == begin.get("size") and stat.st_mtime_ns == begin.get("mtime_ns")
+
+
+def find_entity(layer: LayerModel, entity: list) -> int:
+    # id of an entity of the layer with exactly the recorded geometry, -1 if there is none
+    x1, y1, x2, y2 = entity[1:5]
+    ids = layer.index.query((min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)))
+    if entity[0] == "LINE":
+        found, fx1, fy1, fx2, fy2 = layer.lines.columns(layer.lines.rows_of(ids))
+        found = found[(fx1 == x1) & (fy1 == y1) & (fx2 == x2) & (fy2 == y2)]
+        return int(found[0]) if len(found) else -1
+    for entity_id in ids.tolist():
+        drawable = layer.entities.get(entity_id)
+        if drawable is not None and encode_drawable(drawable) == entity:
+            return entity_id
+    return -1
+
+
+def replay(records: List[dict], layers: List[LayerModel]) -> List[LayerModel]:
+    """
+    Applies the records to the layers loaded from the base file and returns the
+    resulting layer list. Added entities are stored as recorded, without auto-cut,
+    the recorded removals already hold what the cut did.
+    """
+    unclaimed = list(layers)
+    keys: Dict[int, LayerModel] = {}
+    current = list(layers)
+    for record in records:
+        op = record.get("op")
+        if op == "layers":
+            current = []
+            for entry in record["layers"]:
+                layer = keys.get(entry["key"])
+                if layer is None:
+                    layer = next((layer for layer in unclaimed if layer.name == entry["name"]), None)
+                    if layer is None:
+                        layer = LayerModel(name=entry["name"])
+                    else:
+                        unclaimed.remove(layer)
+                    keys[entry["key"]] = layer
+                apply_layer(layer, entry)
+                current.append(layer)
+        elif op == "add":
+            keys[record["layer"]].index_drawable(decode_drawable(record["entity"]))
+        elif op == "remove":
+            layer = keys[record["layer"]]
+            for entity in record["entities"]:
+                entity_id = find_entity(layer, entity)
+                if entity_id >= 0:
+                    layer.remove_ids(np.array([entity_id], dtype=np.int64))
+    return current
@@ -0,0 +1,249 @@
+import math
+import os
+import weakref
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from PySide6.QtCore import QMarginsF, QRect, QSize, QSizeF, Qt
+from PySide6.QtGui import QColor, QFont, QFontMetrics, QGuiApplication, QImage, QPageSize, QPainter, QPdfWriter, QPen, QTransform
+from PySide6.QtSvg import QSvgGenerator
+
+from pycad.ComponentLayers import LayerModel
+from pycad.DrawableDimensionImpl import Dimension
+from pycad.DrawableTextImpl import Text
+from pycad.constants import linetypes
+from pycad.util_drawable import LineBatch
+from pycad.util_spatial import BBox, encode_cells
+
+
+class LevelOfDetail(NamedTuple):
+    # in device pixels, 0 turns a rule off, see DrawingManager
+    point_size: float = 1.0
+    text_size: float = 4.0
+    dimension_size: float = 24.0
+
+
+def layer_pen(layer: LayerModel, zoom_factor: float) -> QPen:
+    pen = QPen(layer.color, layer.lineweight / zoom_factor, Qt.SolidLine)
+    pen.setDashPattern(linetypes[layer.linetype])
+    return pen
+
+
+def merge_points(x: np.ndarray, y: np.ndarray, zoom_factor: float) -> Tuple[np.ndarray, np.ndarray]:
+    # one point per device pixel
+    cells = encode_cells(np.floor(x * zoom_factor), np.floor(y * zoom_factor))
+    cells, first = np.unique(cells, return_index=True)
+    return x[first], y[first]
+
+
+# layer -> (revision, font family, font size, reach), see text_reach
+text_reaches = weakref.WeakKeyDictionary()
+
+
+def text_reach(layer: LayerModel, font: QFont) -> float:
+    """
+    How far the texts and dimensions of the layer draw past the points they are indexed
+    by, in model units: a text around its start point, a dimension its offset line and
+    label. Measured again when the layer or the font changed.
+    """
+    key = (layer.revision, font.family(), font.pointSizeF())
+    cached = text_reaches.get(layer)
+    if cached is not None and cached[:3] == key:
+        return cached[3]
+    metrics = QFontMetrics(font)
+    reach = 0.0
+    for drawable in layer.entities.values():
+        if isinstance(drawable, Text):
+            reach = max(reach, math.hypot(metrics.horizontalAdvance(drawable.text), metrics.height()))
+        elif isinstance(drawable, Dimension):
+            label = metrics.horizontalAdvance(f"{drawable.length():.1f}")
+            reach = max(reach, abs(drawable.offset_distance) + label + 2 * metrics.height())
+    text_reaches[layer] = key + (reach,)
+    return reach
+
+
+def paint_layer(painter: QPainter, layer: LayerModel, view_bbox: BBox, zoom_factor: float,
+                line_batch: LineBatch, lod: LevelOfDetail = LevelOfDetail(), entity_margin: float = 0):
+    # draws the part of the layer inside view_bbox, painter set to model coordinates,
+    # texts and dimensions indexed up to entity_margin outside it too, see text_reach
+    columns, drawables = layer.query(view_bbox)
+    if entity_margin > 0 and layer.entities:
+        drawables = layer.query((view_bbox[0] - entity_margin, view_bbox[1] - entity_margin,
+                                 view_bbox[2] + entity_margin, view_bbox[3] + entity_margin))[1]
+    ids, x1, y1, x2, y2 = columns
+    tiny = np.maximum(np.abs(x2 - x1), np.abs(y2 - y1)) * zoom_factor < lod.point_size
+    points_x, points_y = [x1[tiny]], [y1[tiny]]
+    x1, y1, x2, y2 = x1[~tiny], y1[~tiny], x2[~tiny], y2[~tiny]
+
+    text_size = painter.fontMetrics().height() * zoom_factor
+    detailed, outlines, baselines = [], [], []
+    for drawable in drawables:
+        start_point, end_point = drawable.start_point, drawable.end_point
+        extent = max(abs(end_point.x() - start_point.x()), abs(end_point.y() - start_point.y())) * zoom_factor
+        if extent < lod.point_size:
+            points_x.append([start_point.x()])
+            points_y.append([start_point.y()])
+        elif isinstance(drawable, Text) and text_size < lod.text_size:
+            outlines.append(drawable)
+        elif isinstance(drawable, Dimension) and (text_size < lod.text_size or extent < lod.dimension_size):
+            baselines.append(drawable)
+        else:
+            detailed.append(drawable)
+
+    if baselines:
+        # dimension lines go with the batch of lines
+        ends = np.array([[p.x(), p.y(), q.x(), q.y()] for p, q in (drawable.baseline() for drawable in baselines)],
+                        dtype=np.float64)
+        x1, y1 = np.concatenate([x1, ends[:, 0]]), np.concatenate([y1, ends[:, 1]])
+        x2, y2 = np.concatenate([x2, ends[:, 2]]), np.concatenate([y2, ends[:, 3]])
+
+    for drawable in detailed:
+        drawable.update(painter)
+    painter.setPen(layer_pen(layer, zoom_factor))
+    line_batch.draw(painter, x1, y1, x2, y2)
+    line_batch.draw_points(painter, *merge_points(np.concatenate(points_x), np.concatenate(points_y), zoom_factor))
+    for drawable in outlines:
+        drawable.draw_outline(painter)
+    for drawable in detailed:
+        drawable.draw(painter)
+
+
+def ensure_gui_application() -> QGuiApplication:
+    # fonts and painters need one, without a display it runs on the offscreen platform
+    app = QGuiApplication.instance()
+    if app is None:
+        if "QT_QPA_PLATFORM" not in os.environ and not os.environ.get("DISPLAY") and os.name != "nt":
+            os.environ["QT_QPA_PLATFORM"] = "offscreen"
+        app = QGuiApplication([])
+    return app
+
+
+def layers_bounds(layers: List[LayerModel]) -> Optional[BBox]:
+    bounds = [layer.bounds() for layer in layers if layer.visible and layer.bounds() is not None]
+    if not bounds:
+        return None
+    return (min(b[0] for b in bounds), min(b[1] for b in bounds),
+            max(b[2] for b in bounds), max(b[3] for b in bounds))
+
+
+class SheetView(NamedTuple):
+    """model extent shown and its device size, device = model * zoom_factor - extent corner"""
+    extent: BBox
+    zoom_factor: float
+    width: int
+    height: int
+
+    @classmethod
+    def fit(cls, layers: List[LayerModel], extent: BBox = None, scale: float = None,
+            size: Tuple[int, int] = None, margin: float = 0.02) -> 'SheetView':
+        """
+        extent defaults to the bounds of the visible layers grown by margin of their size.
+        scale is device units per model unit, otherwise the extent fits in size
+        (width, height), 1024 x 1024 when neither is given.
+        """
+        if extent is None:
+            extent = layers_bounds(layers) or (0, 0, 100, 100)
+            grow = margin * max(extent[2] - extent[0], extent[3] - extent[1], 1)
+            extent = (extent[0] - grow, extent[1] - grow, extent[2] + grow, extent[3] + grow)
+        model_width, model_height = max(extent[2] - extent[0], 1e-9), max(extent[3] - extent[1], 1e-9)
+        if scale is None:
+            width, height = size or (1024, 1024)
+            scale = min(width / model_width, height / model_height)
+        return cls(extent, scale, max(1, math.ceil(model_width * scale)), max(1, math.ceil(model_height * scale)))
+
+    def transform(self) -> QTransform:
+        transform = QTransform()
+        transform.scale(self.zoom_factor, self.zoom_factor)
+        transform.translate(-self.extent[0], -self.extent[1])
+        return transform
+
+    def tile(self, x: int, y: int, width: int, height: int) -> 'SheetView':
+        # the part of the sheet at device pixels x, y, same zoom
+        left, top = self.extent[0] + x / self.zoom_factor, self.extent[1] + y / self.zoom_factor
+        return SheetView((left, top, left + width / self.zoom_factor, top + height / self.zoom_factor),
+                         self.zoom_factor, width, height)
+
+
+class SheetRenderer:
+    """
+    Paints layers off screen with the same code as DrawingManager: layer pens and
+    linetypes, level of detail, texts and dimensions. Needs a QGuiApplication, see
+    ensure_gui_application.
+    """
+
+    def __init__(self, font_family: str = "Arial", lod: LevelOfDetail = LevelOfDetail(),
+                 background: QColor = QColor(Qt.white), antialiasing: bool = True):
+        self.font_family = font_family
+        self.lod = lod
+        self.background = background
+        self.antialiasing = antialiasing
+        self.line_batch = LineBatch()
+
+    def paint(self, painter: QPainter, layers: List[LayerModel], view: SheetView):
+        painter.setRenderHint(QPainter.Antialiasing, self.antialiasing)
+        painter.setFont(QFont(self.font_family, 12))
+        painter.setTransform(view.transform())
+        for layer in layers:
+            if layer.visible:
+                # texts crossing the extent are painted by every tile they fall on, see render_tiles
+                paint_layer(painter, layer, view.extent, view.zoom_factor, self.line_batch, self.lod,
+                            text_reach(layer, painter.font()))
+
+    def render_image(self, layers: List[LayerModel], view: SheetView) -> QImage:
+        image = QImage(view.width, view.height, QImage.Format_ARGB32_Premultiplied)
+        image.fill(self.background)
+        painter = QPainter(image)
+        self.paint(painter, layers, view)
+        painter.end()
+        return image
+
+    def render_svg(self, layers: List[LayerModel], view: SheetView, filename: str):
+        generator = QSvgGenerator()
+        generator.setFileName(filename)
+        generator.setSize(QSize(view.width, view.height))
+        generator.setViewBox(QRect(0, 0, view.width, view.height))
+        painter = QPainter(generator)
+        painter.fillRect(QRect(0, 0, view.width, view.height), self.background)
+        self.paint(painter, layers, view)
+        painter.end()
+
+    def render_pdf(self, layers: List[LayerModel], view: SheetView, filename: str, resolution: int = 96):
+        # one page the size of the sheet, a device unit is a pixel at resolution dpi
+        writer = QPdfWriter(filename)
+        writer.setResolution(resolution)
+        writer.setPageSize(QPageSize(QSizeF(view.width * 72 / resolution, view.height * 72 / resolution),
+                                     QPageSize.Point))
+        writer.setPageMargins(QMarginsF(0, 0, 0, 0))
+        painter = QPainter(writer)
+        painter.fillRect(QRect(0, 0, view.width, view.height), self.background)
+        self.paint(painter, layers, view)
+        painter.end()
+
+    def render_tiles(self, layers: List[LayerModel], view: SheetView, filename: str,
+                     tile_size: int = 4096) -> Iterator[str]:
+        """
+        A sheet too large for one image, as tile_size images saved one at a time next to
+        filename (name_row_column.ext): every tile only queries and paints its own part
+        and is written before the next one is rendered. Yields the tile file names.
+        """
+        stem, extension = os.path.splitext(filename)
+        for row, y in enumerate(range(0, view.height, tile_size)):
+            for column, x in enumerate(range(0, view.width, tile_size)):
+                tile = view.tile(x, y, min(tile_size, view.width - x), min(tile_size, view.height - y))
+                name = f"{stem}_{row}_{column}{extension or '.png'}"
+                if not self.render_image(layers, tile).save(name):
+                    raise OSError(f"could not write {name}")
+                yield name
+
+    def render(self, layers: List[LayerModel], view: SheetView, filename: str, tile_size: int = 4096) -> List[str]:
+        # by the extension of filename: .svg, .pdf or an image format, tiled past tile_size pixels
+        extension = os.path.splitext(filename)[1].lower()
+        if extension == ".svg":
+            self.render_svg(layers, view, filename)
+        elif extension == ".pdf":
+            self.render_pdf(layers, view, filename)
+        elif view.width > tile_size or view.height > tile_size:
+            return list(self.render_tiles(layers, view, filename, tile_size))
+        elif not self.render_image(layers, view).save(filename):
+            raise OSError(f"could not write {filename}")
+        return [filename]
@@ -0,0 +1,209 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PySide6.QtCore import QPoint
+from PySide6.QtGui import QColor
+
+from pycad.ComponentLayers import LayerModel
+from pycad.DrawableDimensionImpl import Dimension
+from pycad.DrawableLineStore import LineStore
+from pycad.DrawableTextImpl import Text
+from pycad.util_dxf import LayerSnapshot, replace_file
+from pycad.util_spatial import SegmentIndex
+
+SNAPSHOT_MAGIC = b"PYCADSNP"
+SNAPSHOT_VERSION = 1
+ALIGNMENT = 64
+
+
+def snapshot_path(drawing: str) -> str:
+    return f"{drawing}.snapshot"
+
+
+def file_digest(filename: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(filename, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def dxf_signature(dxf_file: str) -> dict:
+    stat = os.stat(dxf_file)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": file_digest(dxf_file)}
+
+
+def signature_matches(signature: dict, dxf_file: str) -> bool:
+    # the mtime settles it when it is the same, a touched file still matches by its hash
+    if not os.path.exists(dxf_file):
+        return False
+    stat = os.stat(dxf_file)
+    if stat.st_size != signature.get("size"):
+        return False
+    return stat.st_mtime_ns == signature.get("mtime_ns") or file_digest(dxf_file) == signature.get("sha256")
+
+
+def layer_arrays(layer: LayerSnapshot, strings: List[bytes]) -> Tuple[dict, Dict[str, np.ndarray]]:
+    # ids are given like a load of the DXF gives them: the lines first, then texts and dimensions
+    lines = len(layer.x1)
+    texts = [drawable for drawable in layer.entities if isinstance(drawable, Text)]
+    dimensions = [drawable for drawable in layer.entities if isinstance(drawable, Dimension)]
+    text_ids = np.arange(lines, lines + len(texts), dtype=np.int64)
+    dimension_ids = np.arange(lines + len(texts), lines + len(texts) + len(dimensions), dtype=np.int64)
+    text_points = np.array([(drawable.start_point.x(), drawable.start_point.y(), drawable.end_point.x(),
+                             drawable.end_point.y(), float(drawable.height)) for drawable in texts],
+                           dtype=np.float64).reshape(-1, 5)
+    dimension_points = np.array([(drawable.start_point.x(), drawable.start_point.y(), drawable.end_point.x(),
+                                  drawable.end_point.y()) for drawable in dimensions],
+                                dtype=np.float64).reshape(-1, 4)
+    text_strings = np.arange(len(strings), len(strings) + len(texts), dtype=np.int64)
+    strings.extend(str(drawable.text).encode("utf8") for drawable in texts)
+
+    index = SegmentIndex()
+    index.rebuild(np.arange(lines + len(texts) + len(dimensions), dtype=np.int64),
+                  np.concatenate((layer.x1, text_points[:, 0], dimension_points[:, 0])),
+                  np.concatenate((layer.y1, text_points[:, 1], dimension_points[:, 1])),
+                  np.concatenate((layer.x2, text_points[:, 2], dimension_points[:, 2])),
+                  np.concatenate((layer.y2, text_points[:, 3], dimension_points[:, 3])))
+    arrays = {"x1": layer.x1, "y1": layer.y1, "x2": layer.x2, "y2": layer.y2,
+              "text_ids": text_ids, "text_points": text_points, "text_strings": text_strings,
+              "dimension_ids": dimension_ids, "dimension_points": dimension_points}
+    arrays.update({f"index_{name}": array for name, array in index.static_arrays().items()})
+    entry = {"name": layer.name, "color": layer.color, "lineweight": layer.lineweight, "linetype": layer.linetype,
+             "autocut": layer.autocut, "next_id": lines + len(texts) + len(dimensions), "cell_size": index.cell_size}
+    return entry, arrays
+
+
+def data_start(header_length: int) -> int:
+    # the arrays start after the magic, the header length and the header, aligned
+    return -(-(len(SNAPSHOT_MAGIC) + 8 + header_length) // ALIGNMENT) * ALIGNMENT
+
+
+def write_native_snapshot(snapshot: List[LayerSnapshot], filename: str, dxf_file: str):
+    """
+    Writes the layers next to their DXF as <drawing>.snapshot: a JSON header after the
+    magic and its length, then raw arrays aligned to 64 bytes,
+
+        per layer   line columns, text and dimension ids and points, the packed grid of its index
+        strings     the utf8 texts one after another, offsets (n + 1) into them
+
+    The header records the size, mtime and sha256 of dxf_file as written, a snapshot is
+    only read back for the same DXF.
+    """
+    strings: List[bytes] = []
+    layers = []
+    arrays: List[np.ndarray] = []
+    for layer in snapshot:
+        entry, layer_data = layer_arrays(layer, strings)
+        entry["arrays"] = {}
+        for name, array in layer_data.items():
+            entry["arrays"][name] = len(arrays)
+            arrays.append(np.ascontiguousarray(array))
+        layers.append(entry)
+    offsets = np.cumsum([0] + [len(string) for string in strings], dtype=np.int64)
+    string_arrays = {"strings": len(arrays), "string_offsets": len(arrays) + 1}
+    arrays += [np.frombuffer(b"".join(strings), dtype=np.uint8), offsets]
+
+    # offsets relative to the end of the header, which is padded to the alignment
+    position = 0
+    descriptors = []
+    for array in arrays:
+        descriptors.append([position, array.dtype.str, list(array.shape)])
+        position += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    header = json.dumps({"version": SNAPSHOT_VERSION, "dxf": dxf_signature(dxf_file), "layers": layers,
+                         **string_arrays, "arrays": descriptors}).encode("utf8")
+    start = data_start(len(header))
+
+    def write(name):
+        with open(name, "wb") as file:
+            file.write(SNAPSHOT_MAGIC + struct.pack("<Q", len(header)) + header)
+            for (offset, _, _), array in zip(descriptors, arrays):
+                file.seek(start + offset)
+                file.write(array.tobytes())
+            file.truncate(start + position)
+
+    replace_file(filename, write)
+
+
+def read_native_snapshot(filename: str, dxf_file: str) -> Optional[List[LayerModel]]:
+    """
+    The layers of a snapshot written by write_native_snapshot, None when there is none or
+    it does not belong to dxf_file as it is now. The line columns and the index arrays
+    are views of a copy-on-write mapping of the file: nothing is parsed or rebuilt, the
+    pages are read as they are used and edits never reach the file.
+    """
+    if not os.path.exists(filename):
+        return None
+    with open(filename, "rb") as file:
+        magic = file.read(len(SNAPSHOT_MAGIC) + 8)
+        if len(magic) < len(SNAPSHOT_MAGIC) + 8 or magic[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            return None
+        header_length = struct.unpack("<Q", magic[len(SNAPSHOT_MAGIC):])[0]
+        header = json.loads(file.read(header_length))
+        if header.get("version") != SNAPSHOT_VERSION or not signature_matches(header["dxf"], dxf_file):
+            return None
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+    start = data_start(header_length)
+
+    def array(number: int) -> np.ndarray:
+        offset, dtype, shape = header["arrays"][number]
+        count = int(np.prod(shape))
+        if count == 0:
+            return np.empty(shape, dtype=np.dtype(dtype))
+        return np.frombuffer(data, dtype=np.dtype(dtype), count=count, offset=start + offset).reshape(shape)
+
+    strings = array(header["strings"])
+    string_offsets = array(header["string_offsets"]).tolist()
+    layers = []
+    for entry in header["layers"]:
+        arrays = {name: array(number) for name, number in entry["arrays"].items()}
+        layer = LayerModel(name=entry["name"], color=QColor(entry["color"]), width=entry["lineweight"], visible=True)
+        layer.linetype = entry["linetype"]
+        layer.flAutoCut = entry["autocut"]
+        layer.lines = LineStore.from_columns(np.arange(len(arrays["x1"]), dtype=np.int64),
+                                             arrays["x1"], arrays["y1"], arrays["x2"], arrays["y2"])
+        for entity_id, (x1, y1, x2, y2, height), string in zip(arrays["text_ids"].tolist(),
+                                                               arrays["text_points"].tolist(),
+                                                               arrays["text_strings"].tolist()):
+            text = strings[string_offsets[string]:string_offsets[string + 1]].tobytes().decode("utf8")
+            drawable = Text(QPoint(x1, y1), QPoint(x2, y2), height=height, text=text)
+            drawable.entity_id = entity_id
+            layer.entities[entity_id] = drawable
+        for entity_id, (x1, y1, x2, y2) in zip(arrays["dimension_ids"].tolist(), arrays["dimension_points"].tolist()):
+            drawable = Dimension(QPoint(x1, y1), QPoint(x2, y2))
+            drawable.entity_id = entity_id
+            layer.entities[entity_id] = drawable
+        layer.index = SegmentIndex.from_static_arrays(
+            entry["cell_size"], {name: arrays[f"index_{name}"] for name in SegmentIndex.STATIC_ARRAYS})
+        layer.next_id = entry["next_id"]
+        layers.append(layer)
+    return layers
+
+
+def is_mapped(array: np.ndarray) -> bool:
+    # np.frombuffer keeps a memoryview of the mapping as the base of its array
+    base = array
+    while isinstance(base, np.ndarray):
+        base = base.base
+    if isinstance(base, memoryview):
+        base = base.obj
+    return isinstance(base, mmap.mmap)
+
+
+def detach_snapshot(layers: List[LayerModel]):
+    """
+    Copies the arrays of layers read by read_native_snapshot out of the mapping. Once
+    none is left the mapping is closed, the snapshot file can then be written over: on
+    Windows a mapped file can be neither replaced nor deleted.
+    """
+    for layer in layers:
+        for owner in (layer.lines, layer.index):
+            for name, value in list(vars(owner).items()):
+                if isinstance(value, np.ndarray) and is_mapped(value):
+                    setattr(owner, name, np.array(value))
+
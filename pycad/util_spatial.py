@@ -0,0 +1,298 @@
+import math
+from typing import Dict, Hashable, List, Set, Tuple
+
+import numpy as np
+from PySide6.QtCore import QRect
+
+BBox = Tuple[float, float, float, float]
+
+# segments crossing more cells than this are kept in a separate bucket
+# that every query returns, instead of flooding the grid
+MAX_CELLS_PER_ITEM = 4096
+# same for the packed grid, which registers a segment in all the cells of its bounding box
+MAX_BBOX_CELLS_PER_ITEM = 256
+
+
+def segment_bbox(start_point, end_point) -> BBox:
+    x1, y1 = start_point.x(), start_point.y()
+    x2, y2 = end_point.x(), end_point.y()
+    return min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)
+
+
+def rect_bbox(rect: QRect) -> BBox:
+    return rect.left(), rect.top(), rect.right(), rect.bottom()
+
+
+def bbox_overlaps(a: BBox, b: BBox) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def encode_cells(cx: np.ndarray, cy: np.ndarray) -> np.ndarray:
+    # one sortable int64 per cell, column major
+    return (cx.astype(np.int64) << 32) + (cy.astype(np.int64) + (1 << 31))
+
+
+def decode_cells(keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    return keys >> 32, (keys & 0xffffffff) - (1 << 31)
+
+
+class GridIndex:
+    """
+    Uniform grid over model space. Every item is a segment (x1, y1, x2, y2) stored in
+    the cells it actually crosses, so a query only touches the cells of the query
+    box and the items registered there.
+    """
+
+    def __init__(self, cell_size: float = 100):
+        self.cell_size = cell_size
+        self.cells: Dict[Tuple[int, int], Set[Hashable]] = {}
+        self.items: Dict[Hashable, Tuple[BBox, List[Tuple[int, int]]]] = {}
+        self.oversized: Set[Hashable] = set()
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def clear(self):
+        self.cells.clear()
+        self.items.clear()
+        self.oversized.clear()
+
+    def cell_of(self, x: float, y: float) -> Tuple[int, int]:
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def segment_cells(self, x1: float, y1: float, x2: float, y2: float) -> List[Tuple[int, int]]:
+        cs = self.cell_size
+        if x1 > x2:
+            x1, y1, x2, y2 = x2, y2, x1, y1
+        cx0 = math.floor(x1 / cs)
+        cx1 = math.floor(x2 / cs)
+        cy0 = math.floor(min(y1, y2) / cs)
+        cy1 = math.floor(max(y1, y2) / cs)
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) <= 4:
+            # short segment, its bounding cells are good enough
+            return [(cx, cy) for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1)]
+        dx = x2 - x1
+        slope = (y2 - y1) / dx if dx != 0 else 0.0
+        cells = []
+        for cx in range(cx0, cx1 + 1):
+            # clip the segment to the column and take the y range it covers there
+            xa = max(x1, cx * cs)
+            xb = min(x2, (cx + 1) * cs)
+            if dx == 0:
+                ya, yb = y1, y2
+            else:
+                ya = y1 + (xa - x1) * slope
+                yb = y1 + (xb - x1) * slope
+            cya = math.floor(min(ya, yb) / cs)
+            cyb = math.floor(max(ya, yb) / cs)
+            for cy in range(cya, cyb + 1):
+                cells.append((cx, cy))
+            if len(cells) > MAX_CELLS_PER_ITEM:
+                return []
+        return cells
+
+    def insert(self, key: Hashable, x1: float, y1: float, x2: float, y2: float):
+        if key in self.items:
+            self.remove(key)
+        bbox = min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)
+        cells = self.segment_cells(x1, y1, x2, y2)
+        if not cells:
+            self.oversized.add(key)
+        for cell in cells:
+            bucket = self.cells.get(cell)
+            if bucket is None:
+                bucket = set()
+                self.cells[cell] = bucket
+            bucket.add(key)
+        self.items[key] = (bbox, cells)
+
+    def remove(self, key: Hashable):
+        entry = self.items.pop(key, None)
+        if entry is None:
+            return
+        bbox, cells = entry
+        if not cells:
+            self.oversized.discard(key)
+        for cell in cells:
+            bucket = self.cells.get(cell)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self.cells[cell]
+
+    def update(self, key: Hashable, x1: float, y1: float, x2: float, y2: float):
+        self.insert(key, x1, y1, x2, y2)
+
+    def query(self, bbox: BBox) -> Set[Hashable]:
+        """keys whose bounding box overlaps bbox = (xmin, ymin, xmax, ymax)"""
+        cx0, cy0 = self.cell_of(bbox[0], bbox[1])
+        cx1, cy1 = self.cell_of(bbox[2], bbox[3])
+        found: Set[Hashable] = set(self.oversized)
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(self.cells):
+            # the box covers more cells than are occupied, walk the occupied ones instead
+            for (cx, cy), bucket in self.cells.items():
+                if cx0 <= cx <= cx1 and cy0 <= cy <= cy1:
+                    found.update(bucket)
+        else:
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    bucket = self.cells.get((cx, cy))
+                    if bucket:
+                        found.update(bucket)
+        return {key for key in found if bbox_overlaps(self.items[key][0], bbox)}
+
+    def query_rect(self, rect: QRect) -> Set[Hashable]:
+        return self.query(rect_bbox(rect))
+
+
+class SegmentIndex:
+    """
+    Spatial index over integer keys for a whole layer. The bulk of the items lives in a
+    grid packed into numpy arrays (sorted cell keys + CSR offsets), which costs a few
+    dozen bytes per segment and is rebuilt in one vectorized pass. Items inserted or
+    moved since the last rebuild are kept in a small GridIndex, removed ones are masked.
+    """
+
+    def __init__(self, cell_size: float = 100):
+        self.cell_size = cell_size
+        self.keys = np.empty(0, dtype=np.int64)
+        self.xmin = np.empty(0)
+        self.ymin = np.empty(0)
+        self.xmax = np.empty(0)
+        self.ymax = np.empty(0)
+        self.alive = np.empty(0, dtype=bool)
+        self.static_count = 0
+        self.cell_keys = np.empty(0, dtype=np.int64)
+        self.cell_start = np.zeros(1, dtype=np.int64)
+        self.entries = np.empty(0, dtype=np.int64)
+        self.oversized = np.empty(0, dtype=np.int64)
+        self.dynamic = GridIndex(cell_size)
+
+    def __len__(self):
+        return self.static_count + len(self.dynamic)
+
+    def clear(self):
+        self.rebuild(np.empty(0, dtype=np.int64), np.empty(0), np.empty(0), np.empty(0), np.empty(0))
+
+    def needs_rebuild(self) -> bool:
+        dead = len(self.keys) - self.static_count
+        return len(self.dynamic) > max(4096, self.static_count // 4) or dead > max(4096, len(self.keys) // 2)
+
+    def rebuild(self, keys: np.ndarray, x1: np.ndarray, y1: np.ndarray, x2: np.ndarray, y2: np.ndarray,
+                cell_size: float = None):
+        order = np.argsort(keys, kind='stable')
+        self.keys = np.asarray(keys, dtype=np.int64)[order]
+        x1, y1, x2, y2 = x1[order], y1[order], x2[order], y2[order]
+        self.xmin = np.minimum(x1, x2)
+        self.ymin = np.minimum(y1, y2)
+        self.xmax = np.maximum(x1, x2)
+        self.ymax = np.maximum(y1, y2)
+        if cell_size is None and len(self.keys):
+            # about one cell per segment keeps both the entries and the buckets small
+            cell_size = max(float(np.mean(np.maximum(self.xmax - self.xmin, self.ymax - self.ymin))), 1.0)
+        if cell_size is not None:
+            self.cell_size = cell_size
+        self.alive = np.ones(len(self.keys), dtype=bool)
+        self.static_count = len(self.keys)
+        self.dynamic = GridIndex(self.cell_size)
+
+        cs = self.cell_size
+        cx0 = np.floor(self.xmin / cs).astype(np.int64)
+        cy0 = np.floor(self.ymin / cs).astype(np.int64)
+        nx = np.floor(self.xmax / cs).astype(np.int64) - cx0 + 1
+        ny = np.floor(self.ymax / cs).astype(np.int64) - cy0 + 1
+        counts = nx * ny
+        big = counts > MAX_BBOX_CELLS_PER_ITEM
+        self.oversized = np.flatnonzero(big)
+        counts[big] = 0
+
+        # one (cell, position) entry per cell of every bounding box
+        total = int(counts.sum())
+        positions = np.repeat(np.arange(len(self.keys), dtype=np.int64), counts)
+        local = np.arange(total, dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+        cells = encode_cells(cx0[positions] + local // ny[positions], cy0[positions] + local % ny[positions])
+        order = np.argsort(cells, kind='stable')
+        cells = cells[order]
+        self.entries = positions[order]
+        self.cell_keys, first = np.unique(cells, return_index=True)
+        self.cell_start = np.append(first, total).astype(np.int64)
+
+    # the packed grid as arrays, to store it and set it back without a rebuild
+    STATIC_ARRAYS = ('keys', 'xmin', 'ymin', 'xmax', 'ymax', 'alive', 'cell_keys', 'cell_start', 'entries', 'oversized')
+
+    def static_arrays(self) -> Dict[str, np.ndarray]:
+        return {name: getattr(self, name) for name in self.STATIC_ARRAYS}
+
+    @classmethod
+    def from_static_arrays(cls, cell_size: float, arrays: Dict[str, np.ndarray]) -> 'SegmentIndex':
+        index = cls(cell_size)
+        for name in cls.STATIC_ARRAYS:
+            setattr(index, name, arrays[name])
+        index.static_count = int(np.count_nonzero(index.alive))
+        return index
+
+    def static_position(self, key: int) -> int:
+        position = int(np.searchsorted(self.keys, key))
+        if position < len(self.keys) and self.keys[position] == key and self.alive[position]:
+            return position
+        return -1
+
+    def insert(self, key: int, x1: float, y1: float, x2: float, y2: float):
+        self.remove(key)
+        self.dynamic.insert(key, x1, y1, x2, y2)
+
+    def update(self, key: int, x1: float, y1: float, x2: float, y2: float):
+        self.insert(key, x1, y1, x2, y2)
+
+    def remove(self, key: int):
+        self.dynamic.remove(key)
+        position = self.static_position(key)
+        if position >= 0:
+            self.alive[position] = False
+            self.static_count -= 1
+
+    def remove_many(self, keys: np.ndarray):
+        keys = np.asarray(keys, dtype=np.int64)
+        for key in keys.tolist():
+            self.dynamic.remove(key)
+        positions = np.searchsorted(self.keys, keys)
+        positions = positions[positions < len(self.keys)]
+        positions = positions[np.isin(self.keys[positions], keys)]
+        positions = positions[self.alive[positions]]
+        self.alive[positions] = False
+        self.static_count -= len(positions)
+
+    def query(self, bbox: BBox) -> np.ndarray:
+        """sorted keys whose bounding box overlaps bbox = (xmin, ymin, xmax, ymax)"""
+        cs = self.cell_size
+        cx0, cy0 = math.floor(bbox[0] / cs), math.floor(bbox[1] / cs)
+        cx1, cy1 = math.floor(bbox[2] / cs), math.floor(bbox[3] / cs)
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(self.cell_keys):
+            cx, cy = decode_cells(self.cell_keys)
+            selected = np.flatnonzero((cx >= cx0) & (cx <= cx1) & (cy >= cy0) & (cy <= cy1))
+        else:
+            cx, cy = np.meshgrid(np.arange(cx0, cx1 + 1), np.arange(cy0, cy1 + 1), indexing='ij')
+            wanted = encode_cells(cx.ravel(), cy.ravel())
+            selected = np.searchsorted(self.cell_keys, wanted)
+            found = selected < len(self.cell_keys)
+            found[found] = self.cell_keys[selected[found]] == wanted[found]
+            selected = selected[found]
+
+        starts = self.cell_start[selected]
+        lengths = self.cell_start[selected + 1] - starts
+        total = int(lengths.sum())
+        gather = np.arange(total, dtype=np.int64) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        candidates = np.unique(np.concatenate((self.entries[gather], self.oversized)))
+        candidates = candidates[self.alive[candidates]]
+        hit = (self.xmin[candidates] <= bbox[2]) & (self.xmax[candidates] >= bbox[0]) & \
+              (self.ymin[candidates] <= bbox[3]) & (self.ymax[candidates] >= bbox[1])
+        keys = self.keys[candidates[hit]]
+        if len(self.dynamic):
+            keys = np.union1d(keys, np.fromiter(self.dynamic.query(bbox), dtype=np.int64))
+        return keys
+
+    def query_rect(self, rect: QRect) -> np.ndarray:
+        return self.query(rect_bbox(rect))
@@ -0,0 +1,70 @@
+import math
+from collections import OrderedDict
+from typing import NamedTuple
+
+from PySide6.QtGui import QStaticText, QFont, QFontMetrics, QTransform, Qt
+
+
+class TextLayout(NamedTuple):
+    width: int
+    height: int
+    ascent: int
+
+
+class TextLayoutCache:
+    """
+    Strings measured once, keyed by (text, font family, font size), and laid out as
+    QStaticText once per octave of the painter scale and rotation, the least recently
+    used ones dropped past capacity.
+    """
+
+    def __init__(self, capacity: int = 4096):
+        self.capacity = capacity
+        self.layouts: OrderedDict = OrderedDict()
+        self.static_texts: OrderedDict = OrderedDict()
+
+    def __len__(self):
+        return len(self.layouts)
+
+    def cached(self, cache: OrderedDict, key):
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+    def store(self, cache: OrderedDict, key, value):
+        cache[key] = value
+        if len(cache) > self.capacity:
+            cache.popitem(last=False)
+        return value
+
+    def layout(self, text: str, font: QFont) -> TextLayout:
+        key = (text, font.family(), font.pointSizeF())
+        layout = self.cached(self.layouts, key)
+        if layout is not None:
+            return layout
+        metrics = QFontMetrics(font)
+        return self.store(self.layouts, key, TextLayout(metrics.horizontalAdvance(text), metrics.height(),
+                                                        metrics.ascent()))
+
+    def static_text(self, text: str, font: QFont, transform: QTransform) -> QStaticText:
+        # prepared for the painter's transform at draw time, Qt lays it out again in place when it
+        # is drawn at another scale of the same octave; a translation alone keeps the layout
+        scale = math.sqrt(abs(transform.determinant())) or 1.0
+        key = (text, font.family(), font.pointSizeF(), math.floor(math.log2(scale)),
+               round(math.atan2(transform.m12(), transform.m11()), 6))
+        static_text = self.cached(self.static_texts, key)
+        if static_text is not None:
+            return static_text
+        static_text = QStaticText(text)
+        static_text.setTextFormat(Qt.PlainText)
+        static_text.prepare(QTransform(transform.m11(), transform.m12(), transform.m21(), transform.m22(), 0, 0),
+                            font)
+        return self.store(self.static_texts, key, static_text)
+
+    def clear(self):
+        self.layouts.clear()
+        self.static_texts.clear()
+
+
+text_layouts = TextLayoutCache()
@@ -7,10 +7,13 @@ setup(
     install_requires=[
         'PySide6',  # Add all your dependencies here
         'ezdxf',
+        'numpy',
     ],
     entry_points={
         'console_scripts': [
             'pycad=pycad.main:main',  # Adjust to your main entry point
+            'pycad-batch=pycad.cli:main',
+            'pycad-render=pycad.cli:render_main',
         ],
     },
 )